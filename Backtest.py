@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from OptionPricing import Greeks, black76, implied_volatility, years_to_expiry
+from OptionStrategy import OptionStrategy
+
+
+class BacktestResult(object):
+    def __init__(self, times, profit_loss, positions, fills, greeks=None):
+        self.times = times
+        self.profit_loss = profit_loss
+        self.positions = positions
+        self.fills = fills
+        self.greeks = greeks
+
+    def to_frame(self):
+        frame = pd.DataFrame({'ProfitLoss': self.profit_loss}, index=pd.DatetimeIndex(self.times, name='Time'))
+        if self.greeks is not None:
+            for name, values in self.greeks._asdict().items():
+                if name != 'price':
+                    frame[name.capitalize()] = values
+        return frame
+
+
+class Backtest(object):
+    # Replays a strategy over the bars of a BarStore. adjust(strategy, step, bar_store) is called at every step and
+    # returns the OptionOperations filled at that step (or None), which are applied with OptionStrategy.add.
+    # Between fills the legs are fixed, so each of those stretches is marked to market in one vectorized pass.
+    # With underlying (the ConId of the future) the Black-76 Greeks are recorded too, using volatility or, when it
+    # is None, the implied volatility of every leg at every step. Their price is the model profit/loss.
+    # A strategy given with legs already filled starts with the cash paid (or received) for their premiums.
+    def __init__(self, bar_store, adjust, strategy=None, field='Close', underlying=None, volatility=None, rate=0.):
+        self.bar_store = bar_store
+        self.adjust = adjust
+        self.strategy = OptionStrategy('Backtest') if strategy is None else strategy
+        self.underlying = underlying
+        self.volatility = volatility
+        self.rate = rate
+        self.marks = _forward_fill(bar_store.field(field))
+
+    def run(self):
+        steps = len(self.bar_store.times)
+        profit_loss = np.zeros(steps)
+        greeks = Greeks(*[np.zeros(steps) for _ in Greeks._fields]) if self.underlying is not None else None
+        segments = []
+        fills = []
+        legs = self.strategy.legs
+        cash = -(legs.signs * legs.premium).sum()
+        segment_start = 0
+        for step in range(steps):
+            step_fills = self.adjust(self.strategy, step, self.bar_store)
+            if not step_fills:
+                continue
+            if step > segment_start:
+                segments.append(self._mark_segment(segment_start, step, cash, profit_loss, greeks))
+            for option in step_fills:
+                self.strategy.add(option)
+                cash -= option.position.value * option.quantity * option.premium
+                fills.append((self.bar_store.times[step], option.ConId, option.position.value * option.quantity,
+                              option.premium))
+            segment_start = step
+        if steps > segment_start:
+            segments.append(self._mark_segment(segment_start, steps, cash, profit_loss, greeks))
+
+        fills = pd.DataFrame(fills, columns=['Time', 'ConId', 'Quantity', 'Premium'])
+        return BacktestResult(self.bar_store.times, profit_loss, self._positions(segments), fills, greeks)
+
+    def _mark_segment(self, start, end, cash, profit_loss, greeks):
+        legs = self.strategy.legs
+        con_ids = legs.con_id.tolist()
+        try:
+            rows = [self.bar_store.row_of(con_id) for con_id in con_ids]
+        except KeyError as error:
+            raise KeyError('The ConId {} has no bars.'.format(error.args[0]))
+        signs = legs.signs
+        weights = (signs * legs.multiplier)[:, np.newaxis]
+        marks = self.marks[rows, start:end]
+        profit_loss[start:end] = cash + (weights * marks).sum(axis=0)
+        if greeks is not None and len(legs):
+            unit = self._unit_greeks(legs, marks, start, end)
+            for total, greek in zip(greeks[1:], unit[1:]):
+                total[start:end] = (weights * greek).sum(axis=0)
+            greeks.price[start:end] = cash + (weights * unit.price).sum(axis=0)
+        return start, end, con_ids, signs.copy()
+
+    def _unit_greeks(self, legs, marks, start, end):
+        forward = self.marks[self.bar_store.row_of(self.underlying), start:end][np.newaxis, :]
+        times = self.bar_store.times[start:end]
+        time_to_expiry = np.stack([years_to_expiry([expiry], times) for expiry in legs.expiry])
+        strikes = legs.strike[:, np.newaxis]
+        is_call = legs.is_call[:, np.newaxis]
+        volatility = self.volatility
+        if volatility is None:
+            volatility, _ = implied_volatility(marks, forward, strikes, time_to_expiry, is_call, self.rate)
+        return black76(forward, strikes, time_to_expiry, volatility, is_call, self.rate)
+
+    def _positions(self, segments):
+        con_ids = sorted({con_id for _, _, segment_con_ids, _ in segments for con_id in segment_con_ids})
+        columns = {con_id: column for column, con_id in enumerate(con_ids)}
+        positions = np.zeros((len(self.bar_store.times), len(con_ids)), dtype=np.int64)
+        for start, end, segment_con_ids, signs in segments:
+            positions[start:end, [columns[con_id] for con_id in segment_con_ids]] = signs
+        return pd.DataFrame(positions, index=pd.DatetimeIndex(self.bar_store.times, name='Time'),
+                            columns=pd.Index(con_ids, name='ConId'))
+
+
+def _forward_fill(values):
+    # Carries the last bar forward over the missing (NaN) bars of every contract.
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    last = np.where(present, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    return values[np.arange(values.shape[0])[:, np.newaxis], last]
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Backtest import Backtest
+from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position
+
+
+def test_backtest_marks_the_strategy_to_market_at_every_step(session, adaptive_condor, chain):
+    bar_store = session()
+    result = Backtest(bar_store, adaptive_condor).run()
+    closes = {con_id: pd.Series(bar_store.select(con_id, 'Close')).ffill().values for con_id in chain}
+    positions = {1: 1, 2: -1, 3: -1, 4: 1}
+    cash = -sum(sign * closes[con_id][0] * 50 for con_id, sign in positions.items())
+    for step in range(len(bar_store.times)):
+        if step == 120:
+            for con_id, quantity in [(3, 1), (4, -3), (5, 2)]:
+                positions[con_id] = positions.get(con_id, 0) + quantity
+                cash -= quantity * closes[con_id][step] * 50
+        expected = cash + sum(sign * closes[con_id][step] * 50 for con_id, sign in positions.items())
+        assert result.profit_loss[step] == pytest.approx(expected)
+    assert result.positions.columns.tolist() == [1, 2, 3, 4, 5]
+    assert result.positions.iloc[119].tolist() == [1, -1, -1, 1, 0]
+    assert result.positions.iloc[120].tolist() == [1, -1, 0, -2, 2]
+    assert len(result.fills) == 7
+
+
+def test_prefilled_strategy_starts_with_the_cash_of_its_premiums(session, adaptive_condor):
+    bar_store = session()
+    strategy = OptionStrategy('AdaptativeCondor')
+    for option in adaptive_condor(strategy, 0, bar_store):
+        strategy.add(option)
+
+    def adjust(strategy, step, bar_store):
+        if step > 0:
+            return adaptive_condor(strategy, step, bar_store)
+
+    result = Backtest(bar_store, adjust, strategy=strategy).run()
+    assert result.profit_loss[0] == pytest.approx(0.)
+    assert result.profit_loss == pytest.approx(Backtest(bar_store, adaptive_condor).run().profit_loss)
+
+
+def test_backtest_records_the_Greeks_with_implied_volatilities(session, adaptive_condor, underlying):
+    bar_store = session()
+    implied = Backtest(bar_store, adaptive_condor, underlying=underlying).run()
+    model = Backtest(bar_store, adaptive_condor, underlying=underlying, volatility=0.2).run()
+    # The carried forward bars of ConId 2 imply other volatilities.
+    fresh = np.ones(len(bar_store.times), dtype=bool)
+    fresh[100:103] = False
+    assert np.allclose(implied.greeks.delta[fresh], model.greeks.delta[fresh])
+    assert np.allclose(implied.greeks.price, implied.profit_loss)
+    assert implied.to_frame().columns.tolist() == ['ProfitLoss', 'Delta', 'Gamma', 'Vega', 'Theta', 'Rho']
+
+
+def test_backtest_fails_when_a_leg_has_no_bars(session):
+    def adjust(strategy, step, bar_store):
+        if step == 0:
+            return [OptionOperation(Position.Long, 10, OptionType.Call, 2200., con_id=6, multiplier=50)]
+
+    with pytest.raises(KeyError):
+        Backtest(session(), adjust).run()
@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+
+from BarStore import BarStore
+
+
+class BarArchive(object):
+    # Append-only on-disk bars: one file of fixed-width records (Time in ns plus the float fields) per ConId,
+    # sorted by Time so the Time column is the index. Readers memory-map the files.
+    extension = '.bars'
+
+    def __init__(self, path, fields=None):
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                stored_fields = json.load(meta_file)['fields']
+            if fields is not None and list(fields) != stored_fields:
+                raise ValueError('The archive holds the fields {}.'.format(stored_fields))
+            fields = stored_fields
+        elif fields is None:
+            raise ValueError('The fields are needed to create a new archive.')
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, 'w') as meta_file:
+                json.dump({'fields': list(fields)}, meta_file)
+        self.fields = list(fields)
+        self.dtype = np.dtype([('Time', '<i8')] + [(field, '<f8') for field in self.fields])
+        self._records = {}
+
+    @property
+    def con_ids(self):
+        return sorted(int(name[:-len(self.extension)]) for name in os.listdir(self.path)
+                      if name.endswith(self.extension))
+
+    def __contains__(self, con_id):
+        return os.path.exists(self._file_of(con_id))
+
+    def append(self, con_id, times, values):
+        # Appends the (bars x fields) values; times must be increasing and after the last archived bar.
+        times = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+        values = np.asarray(values, dtype=float).reshape(len(times), len(self.fields))
+        if len(times) == 0:
+            return
+        if np.any(np.diff(times) <= 0):
+            raise ValueError('The bar times must be increasing.')
+        records = np.empty(len(times), dtype=self.dtype)
+        records['Time'] = times
+        for column, field in enumerate(self.fields):
+            records[field] = values[:, column]
+
+        file_path = self._file_of(con_id)
+        with open(file_path, 'ab') as bars_file:
+            size = bars_file.tell()
+            # Drop a record left half written by an interrupted append.
+            if size % self.dtype.itemsize:
+                size -= size % self.dtype.itemsize
+                bars_file.truncate(size)
+                bars_file.seek(size)
+            if size:
+                last_time = np.fromfile(file_path, dtype=self.dtype, offset=size - self.dtype.itemsize)['Time'][0]
+                if times[0] <= last_time:
+                    raise ValueError('The bars must be appended after the last archived bar.')
+            bars_file.write(records.tobytes())
+        self._records.pop(con_id, None)
+
+    def append_store(self, bar_store):
+        # Appends every non missing bar of a BarStore.
+        for row, con_id in enumerate(bar_store.con_ids.tolist()):
+            bars = bar_store.data[row]
+            present = ~np.isnan(bars).all(axis=1)
+            self.append(con_id, bar_store.times[present], bars[present])
+
+    def records(self, con_id):
+        # The map is redone when the file grew, so readers see the bars appended by other processes.
+        file_path = self._file_of(con_id)
+        length = os.path.getsize(file_path) // self.dtype.itemsize
+        if length == 0:
+            return np.empty(0, dtype=self.dtype)
+        if con_id not in self._records or len(self._records[con_id]) != length:
+            self._records[con_id] = np.memmap(file_path, dtype=self.dtype, mode='r', shape=(length,))
+        return self._records[con_id]
+
+    def window(self, con_id, start=None, end=None):
+        # Memory-mapped records with start <= Time <= end, found by binary search on the Time column.
+        records = self.records(con_id)
+        times = records['Time']
+        first = 0 if start is None else np.searchsorted(times, _to_ns(start))
+        last = len(records) if end is None else np.searchsorted(times, _to_ns(end), 'right')
+        return records[first:last]
+
+    def select(self, con_id, field, start=None, end=None):
+        return self.window(con_id, start, end)[field]
+
+    def to_bar_store(self, con_ids=None, start=None, end=None):
+        # Loads a time window of some contracts into a BarStore aligned on the union of their bar times.
+        con_ids = self.con_ids if con_ids is None else list(con_ids)
+        windows = [self.window(con_id, start, end) for con_id in con_ids]
+        times = np.unique(np.concatenate([window['Time'] for window in windows] + [np.empty(0, np.int64)]))
+        data = np.full((len(con_ids), len(times), len(self.fields)), np.nan)
+        for row, window in enumerate(windows):
+            columns = np.searchsorted(times, window['Time'])
+            for column, field in enumerate(self.fields):
+                data[row, columns, column] = window[field]
+        return BarStore(con_ids, times.astype('datetime64[ns]'), self.fields, data)
+
+    def _file_of(self, con_id):
+        return os.path.join(self.path, '{}{}'.format(con_id, self.extension))
+
+
+def _to_ns(time):
+    return np.datetime64(time, 'ns').astype(np.int64)
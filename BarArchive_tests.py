@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from BarArchive import BarArchive
+
+
+def test_bar_store_round_trips_through_the_archive(tmp_path, bar_store, bar_fields):
+    archive = BarArchive(str(tmp_path / 'archive'), bar_fields)
+    archive.append_store(bar_store)
+    loaded = BarArchive(str(tmp_path / 'archive')).to_bar_store()
+    assert loaded.con_ids.tolist() == bar_store.con_ids.tolist()
+    assert loaded.times.tolist() == bar_store.times.tolist()
+    assert np.array_equal(loaded.data, bar_store.data, equal_nan=True)
+
+
+def test_appended_bars_are_seen_by_open_readers(tmp_path, bar_store, bar_fields):
+    writer = BarArchive(str(tmp_path), bar_fields)
+    reader = BarArchive(str(tmp_path))
+    writer.append_store(bar_store.window(end='2016-07-18 18:10:00'))
+    assert len(reader.records(197307551)) == 50
+    writer.append_store(bar_store.window(start='2016-07-18 18:10:05'))
+    records = reader.records(197307551)
+    assert isinstance(records, np.memmap)
+    assert len(records) == 121
+    assert records['Close'].tolist() == bar_store.select(197307551, 'Close').tolist()
+
+
+def test_time_window_of_a_contract_is_sliced_from_the_memory_map(tmp_path, bar_store, bar_fields):
+    archive = BarArchive(str(tmp_path), bar_fields)
+    archive.append_store(bar_store)
+    close = archive.select(198003980, 'Close', '2016-07-18 18:06:00', '2016-07-18 18:07:00')
+    assert isinstance(close.base, np.memmap) or isinstance(close, np.memmap)
+    assert close.tolist() == bar_store.select(198003980, 'Close')[1:14].tolist()
+    window = archive.window(198003980, start='2016-07-18 18:15:00')
+    assert window['Time'][0] == pd.Timestamp('2016-07-18 18:15:00').value
+
+
+def test_bars_can_not_be_appended_out_of_order(tmp_path):
+    archive = BarArchive(str(tmp_path), ['Close'])
+    archive.append(1, ['2016-07-18 18:06:00', '2016-07-18 18:06:05'], [1., 2.])
+    with pytest.raises(ValueError):
+        archive.append(1, ['2016-07-18 18:06:05'], [3.])
+    with pytest.raises(ValueError):
+        archive.append(1, ['2016-07-18 18:06:15', '2016-07-18 18:06:10'], [3., 4.])
+    assert archive.select(1, 'Close').tolist() == [1., 2.]
+
+
+def test_half_written_record_is_dropped_on_the_next_append(tmp_path):
+    archive = BarArchive(str(tmp_path), ['Close'])
+    archive.append(1, ['2016-07-18 18:06:00'], [1.])
+    with open(str(tmp_path / '1.bars'), 'ab') as bars_file:
+        bars_file.write(b'\x00' * 5)
+    assert archive.select(1, 'Close').tolist() == [1.]
+    archive.append(1, ['2016-07-18 18:06:05'], [2.])
+    assert archive.select(1, 'Close').tolist() == [1., 2.]
+
+
+def test_an_existing_archive_keeps_its_fields(tmp_path, bar_fields):
+    BarArchive(str(tmp_path), bar_fields)
+    with pytest.raises(ValueError):
+        BarArchive(str(tmp_path), ['Close'])
+    with pytest.raises(ValueError):
+        BarArchive(str(tmp_path / 'missing'))
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class BarStore(object):
+    # Bars of many contracts on a shared time axis, stored as one (contract x time x field) array.
+    # Missing bars are NaN.
+    def __init__(self, con_ids, times, fields, data):
+        self.con_ids = np.asarray(con_ids, dtype=np.int64)
+        self.times = np.asarray(times, dtype='datetime64[ns]')
+        self.fields = list(fields)
+        self.data = data
+        self._rows = {con_id: row for row, con_id in enumerate(self.con_ids.tolist())}
+        self._columns = {field: column for column, field in enumerate(self.fields)}
+
+    @classmethod
+    def from_frame(cls, bars: pd.DataFrame, dictionary):
+        # bars holds the TWS BarList columns (reqId, Time and the bar fields), dictionary maps reqId to ConId.
+        dictionary = {int(req_id): int(con_id) for req_id, con_id in dict(dictionary).items()}
+        fields = [column for column in bars.columns if column not in ('reqId', 'Time')]
+        req_ids = bars['reqId'].to_numpy()
+        known_req_ids = np.array(sorted(dictionary), dtype=req_ids.dtype)
+        known = np.isin(req_ids, known_req_ids)
+        req_ids = req_ids[known]
+        times = bars['Time'].to_numpy(dtype='datetime64[ns]')[known]
+        values = bars[fields].to_numpy(dtype=float)[known]
+
+        # One pass: every bar is placed by its reqId and Time positions, no per contract filtering.
+        con_ids = np.array([dictionary[req_id] for req_id in known_req_ids.tolist()], dtype=np.int64)
+        order = np.argsort(con_ids, kind='stable')
+        con_ids = con_ids[order]
+        rows = np.empty(len(order), dtype=np.intp)
+        rows[order] = np.arange(len(order))
+        rows = rows[np.searchsorted(known_req_ids, req_ids)]
+        unique_times, columns = np.unique(times, return_inverse=True)
+        data = np.full((len(con_ids), len(unique_times), len(fields)), np.nan)
+        data[rows, columns.ravel()] = values
+        return cls(con_ids, unique_times, fields, data)
+
+    @classmethod
+    def from_csv(cls, bars_path, dictionary_path):
+        bars = pd.read_csv(bars_path, parse_dates=['Time'])
+        with open(dictionary_path) as dictionary_file:
+            dictionary = json.load(dictionary_file)
+        return cls.from_frame(bars, dictionary)
+
+    def __len__(self):
+        return len(self.con_ids)
+
+    def __contains__(self, con_id):
+        return con_id in self._rows
+
+    def row_of(self, con_id):
+        return self._rows[con_id]
+
+    def select(self, con_id, field=None):
+        # Views into the store: (time x field) bars of a contract, or the time series of one of its fields.
+        bars = self.data[self._rows[con_id]]
+        return bars if field is None else bars[:, self._columns[field]]
+
+    def field(self, field):
+        # (contract x time) view of one field.
+        return self.data[:, :, self._columns[field]]
+
+    def window(self, start=None, end=None):
+        # Store sharing the data of the bars with start <= Time <= end.
+        first = 0 if start is None else np.searchsorted(self.times, np.datetime64(start, 'ns'))
+        last = len(self.times) if end is None else np.searchsorted(self.times, np.datetime64(end, 'ns'), 'right')
+        return BarStore(self.con_ids, self.times[first:last], self.fields, self.data[:, first:last])
+
+    def frame(self, con_id):
+        return pd.DataFrame(self.select(con_id), index=pd.DatetimeIndex(self.times, name='Time'),
+                            columns=self.fields)
+
+    def to_frame(self, dropna=True):
+        index = pd.MultiIndex.from_product([self.con_ids, pd.DatetimeIndex(self.times)], names=['ConId', 'Time'])
+        frame = pd.DataFrame(self.data.reshape(-1, len(self.fields)), index=index, columns=self.fields)
+        return frame.dropna(how='all') if dropna else frame
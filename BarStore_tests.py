@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from BarStore import BarStore
+
+def test_bars_are_placed_by_ConId_time_and_field(bar_list, bar_fields, bar_dictionary):
+    bars = bar_list()
+    store = BarStore.from_frame(bars, bar_dictionary)
+    assert store.con_ids.tolist() == sorted(bar_dictionary.values())
+    assert store.fields == bar_fields
+    assert store.data.shape == (3, 121, 7)
+    for req_id, con_id in bar_dictionary.items():
+        expected = bars.query('reqId=={}'.format(req_id)).drop('reqId', axis=1).set_index('Time').sort_index()
+        actual = store.frame(con_id).dropna()
+        assert actual.index.tolist() == expected.index.tolist()
+        assert np.array_equal(actual.values, expected.values)
+    assert np.isnan(store.select(198003244, 'Close')[:10]).all()
+
+
+def test_contract_and_field_slices_are_views(bar_store):
+    close = bar_store.select(197307551, 'Close')
+    assert np.shares_memory(close, bar_store.data)
+    assert np.shares_memory(bar_store.field('Close'), bar_store.data)
+    assert close.tolist() == bar_store.frame(197307551)['Close'].tolist()
+
+
+def test_time_window_shares_the_store_data(bar_store):
+    window = bar_store.window('2016-07-18 18:06:00', '2016-07-18 18:07:00')
+    assert len(window.times) == 13
+    assert np.shares_memory(window.data, bar_store.data)
+    assert window.select(198003980, 'Open').tolist() == bar_store.select(198003980, 'Open')[1:14].tolist()
+
+
+def test_store_is_read_from_the_TWS_files(tmp_path, bar_list, bar_dictionary):
+    bars_path = str(tmp_path / 'BarList.csv')
+    dictionary_path = str(tmp_path / 'contractsDictionary.json')
+    bar_list().to_csv(bars_path, index=False)
+    with open(dictionary_path, 'w') as dictionary_file:
+        json.dump(bar_dictionary, dictionary_file)
+    store = BarStore.from_csv(bars_path, dictionary_path)
+    frame = store.to_frame()
+    assert frame.index.names == ['ConId', 'Time']
+    assert len(frame) == 121 * 3 - 10
+    assert frame.loc[(198003980, pd.Timestamp('2016-07-18 18:06:00')), 'Close'] == pytest.approx(
+        store.select(198003980, 'Close')[1])
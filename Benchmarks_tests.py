@@ -0,0 +1,31 @@
+import json
+
+from benchmarks import suite
+from benchmarks.startup import HEAVY_MODULES, loaded_heavy_modules
+
+
+def test_benchmark_suite_runs_every_case_on_a_small_book():
+    results = suite.run(contracts=60, legs=4, grid_points=50, repeat=1, min_time=0.)
+    assert sorted(results['cases']) == ['add_churn', 'contract_index_build', 'from_ConId', 'from_contract_description',
+                                        'generate_adaptive_strategy_dataframe', 'generate_strategy_dataframe',
+                                        'load_contracts_cold', 'load_contracts_warm', 'profit_loss_at',
+                                        'profit_loss_over']
+    assert results['cases']['load_contracts_cold']['params'] == {'contracts': 51}
+    assert json.loads(json.dumps(results)) == results
+
+
+def test_slower_cases_are_regressions():
+    baseline = {'cases': {'fast': {'seconds': 1e-3, 'params': {'legs': 4}},
+                          'resized': {'seconds': 1e-3, 'params': {'legs': 4}},
+                          'noisy': {'seconds': 1e-8, 'params': {}}}}
+    results = {'cases': {'fast': {'seconds': 2e-3, 'params': {'legs': 4}},
+                         'resized': {'seconds': 2e-3, 'params': {'legs': 8}},
+                         'noisy': {'seconds': 1e-7, 'params': {}},
+                         'new': {'seconds': 1., 'params': {}}}}
+    assert suite.compare(results, baseline) == [('fast', 1e-3, 2e-3)]
+    assert suite.compare(results, baseline, tolerance=3.) == []
+
+
+def test_core_modules_do_not_import_heavy_modules():
+    assert 'pandas' in HEAVY_MODULES
+    assert loaded_heavy_modules('OptionStrategy') == []
@@ -0,0 +1,160 @@
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from ContractLoader import _cache_path, _write_cache, load_contract_columns
+
+DETAILS_COLUMNS = ('ConId', 'MinTick', 'PriceMagnifier', 'Multiplier', 'UnderConId', 'TimeZoneId', 'TradingHours',
+                   'LiquidHours')
+# The arrays of the index, also the key of its binary cache: a change of layout invalidates the old caches.
+INDEX_ARRAYS = ('con_id', 'min_tick', 'price_magnifier', 'multiplier', 'under_con_id', 'trading_offsets',
+                'trading_starts', 'trading_ends', 'liquid_offsets', 'liquid_starts', 'liquid_ends')
+# TWS time zone ids that are not IANA names.
+TIME_ZONES = {'CST': 'America/Chicago', 'CDT': 'America/Chicago', 'EST': 'America/New_York',
+              'EDT': 'America/New_York', 'PST': 'America/Los_Angeles', 'JST': 'Asia/Tokyo', 'GMT': 'UTC'}
+ROUNDING = {'nearest': np.round, 'down': np.floor, 'up': np.ceil}
+
+
+def parse_trading_hours(hours, time_zone):
+    # Parses TWS TradingHours/LiquidHours into sorted, merged (starts, ends) arrays of UTC nanoseconds.
+    # Both TWS formats are read: '20160613:1700-1515,1530-1600;20160614:CLOSED', where a session starting after
+    # its end opened the day before, and '20180323:0400-20180323:2000'.
+    from zoneinfo import ZoneInfo
+    zone = ZoneInfo(TIME_ZONES.get(time_zone, time_zone or 'UTC'))
+    sessions = []
+    for day in filter(None, (hours or '').split(';')):
+        day_date, day_sessions = day.split(':', 1)
+        if day_sessions == 'CLOSED':
+            continue
+        day_date = _date_of(day_date)
+        for session in day_sessions.split(','):
+            start, end = session.split('-')
+            if ':' in end:
+                end_date, end = end.split(':')
+                end_date = _date_of(end_date)
+                start_date = day_date
+            else:
+                end_date = day_date
+                start_date = day_date - timedelta(days=1) if start > end else day_date
+            sessions.append((_utc_ns(start_date, start, zone), _utc_ns(end_date, end, zone)))
+
+    merged = []
+    for start, end in sorted(sessions):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    merged = np.array(merged, dtype=np.int64).reshape(-1, 2)
+    return merged[:, 0], merged[:, 1]
+
+
+class ContractDetailsIndex(object):
+    # Numeric details and trading/liquid sessions of every ConId of a ContractDetails.json, parsed once.
+    # The sessions of all the contracts are stored end to end, offsets giving the slice of each contract.
+    # Times are datetime64, naive ones being UTC.
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._order = np.argsort(arrays['con_id'], kind='stable')
+        self._sorted_con_ids = np.asarray(arrays['con_id'])[self._order]
+
+    @classmethod
+    def load(cls, path, cache_dir=None, use_cache=True):
+        # The index is persisted next to the ContractLoader caches and memory-mapped on warm starts.
+        cache_path = _cache_path(path, INDEX_ARRAYS, cache_dir)
+        if use_cache and os.path.isdir(cache_path):
+            return cls({name: np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')
+                        for name in INDEX_ARRAYS})
+        index = cls.from_columns(load_contract_columns(path, DETAILS_COLUMNS, use_cache=False))
+        if use_cache:
+            _write_cache(cache_path, index.arrays)
+        return index
+
+    @classmethod
+    def from_columns(cls, columns):
+        arrays = {'con_id': np.asarray(columns['ConId'], dtype=np.int64),
+                  'min_tick': np.asarray(columns['MinTick'], dtype=float),
+                  'price_magnifier': _filled(columns['PriceMagnifier'], 1.),
+                  'multiplier': _filled(columns['Multiplier'], 1.),
+                  'under_con_id': _filled(columns['UnderConId'], 0.).astype(np.int64)}
+        for kind in ('trading', 'liquid'):
+            sessions = [parse_trading_hours(hours, time_zone) for hours, time_zone in
+                        zip(columns['{}Hours'.format(kind.capitalize())], columns['TimeZoneId'])]
+            lengths = [len(starts) for starts, _ in sessions]
+            arrays[kind + '_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            arrays[kind + '_starts'] = np.concatenate([starts for starts, _ in sessions] + [np.empty(0, np.int64)])
+            arrays[kind + '_ends'] = np.concatenate([ends for _, ends in sessions] + [np.empty(0, np.int64)])
+        return cls(arrays)
+
+    def __len__(self):
+        return len(self._sorted_con_ids)
+
+    def __contains__(self, con_id):
+        row = np.searchsorted(self._sorted_con_ids, con_id)
+        return row < len(self) and self._sorted_con_ids[row] == con_id
+
+    def rows(self, con_ids):
+        con_ids = np.asarray(con_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._sorted_con_ids, con_ids), max(len(self) - 1, 0))
+        if len(self) == 0 or np.any(self._sorted_con_ids[positions] != con_ids):
+            missing = np.setdiff1d(con_ids, self._sorted_con_ids)
+            raise KeyError('The ConIds {} are not in the contract details.'.format(missing.tolist()))
+        return self._order[positions]
+
+    def tick_size(self, con_ids):
+        # TWS reports prices multiplied by PriceMagnifier, so the tick of the actual price is MinTick / magnifier.
+        rows = self.rows(con_ids)
+        return self.arrays['min_tick'][rows] / self.arrays['price_magnifier'][rows]
+
+    def multiplier(self, con_ids):
+        return self.arrays['multiplier'][self.rows(con_ids)]
+
+    def under_con_id(self, con_ids):
+        return self.arrays['under_con_id'][self.rows(con_ids)]
+
+    def round_to_tick(self, con_ids, prices, mode='nearest'):
+        # con_ids and prices broadcast against each other; mode is 'nearest', 'down' or 'up'.
+        ticks = self.tick_size(con_ids)
+        ticks, prices = np.broadcast_arrays(ticks, np.asarray(prices, dtype=float))
+        # The second rounding drops the binary noise of the tick multiples (0.05 * 247 = 12.350000000000001).
+        return np.round(ROUNDING[mode](prices / ticks) * ticks, 10)
+
+    def sessions(self, con_id, liquid=False):
+        kind = 'liquid' if liquid else 'trading'
+        row = self.rows(con_id)
+        first, last = self.arrays[kind + '_offsets'][row:row + 2]
+        return tuple(self.arrays[kind + part][first:last].astype('datetime64[ns]') for part in ('_starts', '_ends'))
+
+    def is_open(self, con_ids, times, liquid=False):
+        # Whether the contracts trade (or, when liquid, are in their liquid hours) at times; con_ids and times
+        # broadcast against each other. Every contract is a binary search in its own sessions.
+        kind = 'liquid' if liquid else 'trading'
+        con_ids, times = np.broadcast_arrays(np.asarray(con_ids, dtype=np.int64),
+                                             np.asarray(times, dtype='datetime64[ns]').astype(np.int64))
+        offsets, starts, ends = [self.arrays[kind + part] for part in ('_offsets', '_starts', '_ends')]
+        unique_con_ids, inverse = np.unique(con_ids, return_inverse=True)
+        inverse = inverse.reshape(con_ids.shape)
+        is_open = np.zeros(con_ids.shape, dtype=bool)
+        for number, row in enumerate(self.rows(unique_con_ids).tolist()):
+            first, last = offsets[row], offsets[row + 1]
+            if first == last:
+                continue
+            selected = inverse == number
+            contract_times = times[selected]
+            session = np.searchsorted(starts[first:last], contract_times, 'right') - 1
+            is_open[selected] = (session >= 0) & (contract_times < ends[first:last][np.maximum(session, 0)])
+        return is_open
+
+
+def _filled(values, default):
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), default, values)
+
+
+def _date_of(text):
+    return date(int(text[:4]), int(text[4:6]), int(text[6:8]))
+
+
+def _utc_ns(day, hhmm, zone):
+    local = datetime(day.year, day.month, day.day, int(hhmm[:2]), int(hhmm[2:4]), tzinfo=zone)
+    return int(local.timestamp()) * 10 ** 9
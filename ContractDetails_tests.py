@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+from ContractDetails import *
+
+path_to_contract_details_json = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_files',
+                                             'ContractDetails.json')
+future, option = 187532577, 198003980
+
+trading_hours_cases = (("comment", "hours", "time_zone", "sessions"),
+                       [
+                           ('Overnight session opens the day before', '20160613:1700-1515,1530-1600', 'CST',
+                            [('2016-06-12T22:00', '2016-06-13T20:15'), ('2016-06-13T20:30', '2016-06-13T21:00')]),
+                           ('Closed days are skipped', '20160613:0830-1515;20160614:CLOSED', 'CST',
+                            [('2016-06-13T13:30', '2016-06-13T20:15')]),
+                           ('Dated sessions', '20180323:0400-20180323:2000;20180324:CLOSED', 'EST',
+                            [('2018-03-23T08:00', '2018-03-24T00:00')]),
+                           ('Standard time', '20161212:1700-1515', 'CST', [('2016-12-11T23:00', '2016-12-12T21:15')]),
+                           ('Repeated sessions are merged', '20160613:0930-1600;20160613:1200-1700', 'UTC',
+                            [('2016-06-13T09:30', '2016-06-13T17:00')]),
+                       ])
+
+
+@pytest.mark.parametrize(*trading_hours_cases)
+def test_trading_hours_are_parsed_to_utc_sessions(comment, hours, time_zone, sessions):
+    starts, ends = parse_trading_hours(hours, time_zone)
+    assert starts.astype('datetime64[ns]').tolist() == [np.datetime64(start, 'ns').tolist() for start, _ in sessions]
+    assert ends.astype('datetime64[ns]').tolist() == [np.datetime64(end, 'ns').tolist() for _, end in sessions]
+
+
+def test_contract_is_open_at_timestamps(tmp_path):
+    index = ContractDetailsIndex.load(path_to_contract_details_json, cache_dir=str(tmp_path))
+    times = np.array(['2016-06-12T21:59', '2016-06-12T22:00', '2016-06-13T20:20', '2016-06-13T20:40',
+                      '2016-06-13T21:30', '2016-06-13T22:30', '2016-06-15T12:00'], dtype='datetime64[ns]')
+    assert index.is_open(future, times).tolist() == [False, True, False, True, False, True, False]
+    assert index.is_open(option, times, liquid=True).tolist() == [False, False, False, False, False, False, False]
+    assert index.is_open([future, option], np.datetime64('2016-06-13T14:00')).tolist() == [True, True]
+    both = index.is_open(np.array([[future], [option]]), times[np.newaxis, :], liquid=True)
+    assert both.shape == (2, 7)
+    with pytest.raises(KeyError):
+        index.is_open(1, times)
+
+
+def test_prices_are_rounded_to_tick():
+    index = ContractDetailsIndex.load(path_to_contract_details_json, use_cache=False)
+    assert index.round_to_tick(future, [2101.13, 2101.12]).tolist() == [2101.25, 2101.0]
+    assert index.round_to_tick(future, 2101.13, 'down').item() == 2101.0
+    assert index.round_to_tick([future, option], 12.33, 'up').tolist() == [12.5, 12.35]
+    assert index.multiplier([future, option]).tolist() == [50., 50.]
+    assert index.under_con_id(option).item() == future
+
+
+def test_warm_start_memory_maps_the_index(tmp_path):
+    cold = ContractDetailsIndex.load(path_to_contract_details_json, cache_dir=str(tmp_path))
+    warm = ContractDetailsIndex.load(path_to_contract_details_json, cache_dir=str(tmp_path))
+    assert len(os.listdir(str(tmp_path))) == 1
+    assert len(warm) == 18
+    for name in INDEX_ARRAYS:
+        assert isinstance(warm.arrays[name], np.memmap)
+        assert np.array_equal(warm.arrays[name], cold.arrays[name])
+    assert [session.tolist() for session in warm.sessions(option)] == \
+        [session.tolist() for session in cold.sessions(option)]
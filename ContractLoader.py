@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+CONTRACT_COLUMNS = ('ConId', 'Symbol', 'SecType', 'Expiry', 'Strike', 'Right', 'Multiplier', 'Exchange', 'Currency',
+                    'LocalSymbol', 'TradingClass')
+CONTRACT_DETAILS_COLUMNS = CONTRACT_COLUMNS + ('MarketName', 'MinTick', 'PriceMagnifier', 'UnderConId',
+                                               'ContractMonth', 'TimeZoneId')
+NUMERIC_COLUMNS = {'ConId', 'Strike', 'Multiplier', 'MinTick', 'PriceMagnifier', 'UnderConId', 'EvMultiplier'}
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    # Yields the elements of a top level JSON array without loading the whole file.
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as json_file:
+        buffer = ''
+        started = False
+        while True:
+            chunk = json_file.read(chunk_size)
+            buffer += chunk
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                    position += 1
+                if position == len(buffer):
+                    break
+                if not started:
+                    if buffer[position] != '[':
+                        raise ValueError('{} does not hold a JSON array.'.format(path))
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == ']':
+                    return
+                try:
+                    element, position = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if not chunk:
+                        raise
+                    break
+                yield element
+            buffer = buffer[position:]
+            if not chunk:
+                raise ValueError('{} ends before its JSON array is closed.'.format(path))
+
+
+def project(record, columns):
+    # ContractDetails records nest the contract fields under 'Summary'.
+    summary = record.get('Summary') or {}
+    return [record[column] if column in record else summary.get(column) for column in columns]
+
+
+def load_contract_columns(path, columns=CONTRACT_COLUMNS, cache_dir=None, use_cache=True, chunk_size=1 << 20):
+    # Returns {column: array}. The arrays are memory-mapped from the binary cache when it is up to date.
+    columns = tuple(columns)
+    cache_path = _cache_path(path, columns, cache_dir)
+    if use_cache and os.path.isdir(cache_path):
+        return {column: np.load(os.path.join(cache_path, column + '.npy'), mmap_mode='r') for column in columns}
+
+    values = [[] for _ in columns]
+    for record in iter_json_array(path, chunk_size):
+        for column_values, value in zip(values, project(record, columns)):
+            column_values.append(value)
+    arrays = {column: _to_array(column, column_values) for column, column_values in zip(columns, values)}
+    if use_cache:
+        _write_cache(cache_path, arrays)
+    return arrays
+
+
+def load_contracts(path, columns=CONTRACT_COLUMNS, cache_dir=None, use_cache=True, chunk_size=1 << 20):
+    # pandas is only imported here: load_contract_columns needs NumPy alone.
+    import pandas as pd
+    arrays = load_contract_columns(path, columns, cache_dir, use_cache, chunk_size)
+    return pd.DataFrame(arrays, columns=list(columns)).set_index('ConId')
+
+
+def load_contract_details(path, columns=CONTRACT_DETAILS_COLUMNS, cache_dir=None, use_cache=True,
+                          chunk_size=1 << 20):
+    return load_contracts(path, columns, cache_dir, use_cache, chunk_size)
+
+
+def _to_array(column, values):
+    if column not in NUMERIC_COLUMNS:
+        return np.array(['' if value is None else str(value) for value in values])
+    array = np.array([np.nan if value in (None, '') else float(value) for value in values], dtype=float)
+    if np.isfinite(array).all() and (array == np.floor(array)).all():
+        return array.astype(np.int64)
+    return array
+
+
+def _cache_path(path, columns, cache_dir):
+    stat = os.stat(path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.contract_cache')
+    # The hash of the absolute path keeps apart the caches of same named sources of different directories.
+    path_hash = hashlib.md5(os.path.abspath(path).encode()).hexdigest()[:8]
+    columns_hash = hashlib.md5(','.join(columns).encode()).hexdigest()[:8]
+    key = '{}-{}-{}-{}-{}'.format(os.path.basename(path), path_hash, stat.st_mtime_ns, stat.st_size, columns_hash)
+    return os.path.join(cache_dir, key)
+
+
+def _write_cache(cache_path, arrays):
+    # The cache is optional: when it can not be written (e.g. a read-only data directory) the data is still returned.
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Caches of previous versions of the same source file (same name and path hash) are stale.
+        source_name = os.path.basename(cache_path).rsplit('-', 3)[0]
+        for entry in os.listdir(cache_dir):
+            if entry.rsplit('-', 3)[0] == source_name and entry.endswith(cache_path[-8:]):
+                shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+        temporary_path = tempfile.mkdtemp(dir=cache_dir)
+    except OSError as error:
+        warnings.warn('The contracts cache can not be written to {}: {}'.format(cache_dir, error), UserWarning)
+        return
+    try:
+        for column, array in arrays.items():
+            np.save(os.path.join(temporary_path, column + '.npy'), array)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        # Another process already wrote the same cache, or the disk is full.
+        shutil.rmtree(temporary_path, ignore_errors=True)
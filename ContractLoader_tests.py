@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ContractLoader import *
+
+testing_files = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_files')
+path_to_contracts_json = os.path.join(testing_files, 'Contracts.json')
+path_to_contract_details_json = os.path.join(testing_files, 'ContractDetails.json')
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1 << 20])
+def test_streamed_json_array_matches_the_parsed_file(chunk_size):
+    with open(path_to_contract_details_json) as json_file:
+        expected = json.load(json_file)
+    assert list(iter_json_array(path_to_contract_details_json, chunk_size)) == expected
+
+
+def test_contract_details_are_flattened_and_projected(tmp_path):
+    columns = load_contract_columns(path_to_contract_details_json, CONTRACT_DETAILS_COLUMNS, cache_dir=str(tmp_path))
+    assert set(columns) == set(CONTRACT_DETAILS_COLUMNS)
+    assert 'OrderTypes' not in columns
+    assert columns['ConId'][0] == 187532577
+    assert columns['MinTick'][0] == 0.25
+    assert columns['Multiplier'].dtype == np.int64
+    assert (columns['Multiplier'] == 50).all()
+
+
+def test_contracts_dataframe_is_indexed_by_ConId(tmp_path):
+    contracts = load_contracts(path_to_contracts_json, cache_dir=str(tmp_path))
+    assert contracts.index.name == 'ConId'
+    assert contracts.loc[198003980, 'Strike'] == 2070
+    assert contracts.loc[198003980, 'Right'] == 'P'
+    assert contracts.loc[187532577, 'Right'] == ''
+
+
+def test_warm_start_memory_maps_the_binary_cache(tmp_path):
+    cold = load_contract_columns(path_to_contracts_json, cache_dir=str(tmp_path))
+    warm = load_contract_columns(path_to_contracts_json, cache_dir=str(tmp_path))
+    assert len(os.listdir(str(tmp_path))) == 1
+    for column in CONTRACT_COLUMNS:
+        assert isinstance(warm[column], np.memmap)
+        assert warm[column].tolist() == cold[column].tolist()
+
+
+def test_cache_is_rebuilt_when_the_source_changes(tmp_path):
+    source = tmp_path / 'Contracts.json'
+    source.write_text(open(path_to_contracts_json).read())
+    cache_dir = str(tmp_path / 'cache')
+    assert len(load_contract_columns(str(source), cache_dir=cache_dir)['ConId']) == 18
+    source.write_text(json.dumps(json.load(open(path_to_contracts_json))[:3]))
+    os.utime(str(source), ns=(0, 10 ** 18))
+    assert len(load_contract_columns(str(source), cache_dir=cache_dir)['ConId']) == 3
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_same_named_sources_of_different_directories_keep_their_caches(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    contracts = json.load(open(path_to_contracts_json))
+    sources = []
+    for directory, records in (('front', contracts), ('back', contracts[:3])):
+        (tmp_path / directory).mkdir()
+        source = tmp_path / directory / 'Contracts.json'
+        source.write_text(json.dumps(records))
+        sources.append(str(source))
+    for _ in range(2):
+        assert [len(load_contract_columns(source, cache_dir=cache_dir)['ConId']) for source in sources] == [18, 3]
+    assert len(os.listdir(cache_dir)) == 2
+    for source in sources:
+        assert isinstance(load_contract_columns(source, cache_dir=cache_dir)['ConId'], np.memmap)
+
+
+@pytest.mark.parametrize('unwritable', ['read-only data directory', 'file in place of the cache directory'])
+def test_contracts_are_loaded_when_the_cache_can_not_be_written(tmp_path, unwritable):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    source = data_dir / 'Contracts.json'
+    source.write_text(open(path_to_contracts_json).read())
+    if unwritable == 'read-only data directory':
+        data_dir.chmod(0o555)
+        if os.access(str(data_dir), os.W_OK):
+            data_dir.chmod(0o755)
+            pytest.skip('Read-only permissions are not enforced for this user.')
+    else:
+        (data_dir / '.contract_cache').write_text('')
+    try:
+        with pytest.warns(UserWarning):
+            contracts = load_contracts(str(source))
+    finally:
+        data_dir.chmod(0o755)
+    assert contracts.loc[198003980, 'Strike'] == 2070
+    assert not (data_dir / '.contract_cache').is_dir()
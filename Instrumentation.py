@@ -0,0 +1,189 @@
+import functools
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from OptionStrategy import ContractIndex, OptionOperation, OptionStrategy, PiecewisePayoff
+
+# (stage, class, method) of the instrumented hot paths. Nothing is wrapped until enable(), so disabled
+# instrumentation costs nothing; enable() swaps the methods for timed wrappers and disable() puts the originals back.
+# The hot paths call each other (profit_loss_at evaluates the payoff, the DataFrame calls profit_loss_over): the
+# latencies are self times, without the time of the nested recorded calls, so the stages add up to the wall time.
+# The inclusive time is kept too.
+HOT_PATHS = (('lookup', OptionOperation, 'from_ConId'),
+             ('lookup', OptionOperation, 'from_contract_description'),
+             ('lookup', ContractIndex, 'lookup'),
+             ('add', OptionStrategy, 'add'),
+             ('payoff', OptionStrategy, 'profit_loss_at'),
+             ('payoff', OptionStrategy, 'profit_loss_over'),
+             ('payoff', PiecewisePayoff, 'evaluate'),
+             ('dataframe', OptionStrategy, '_generate_strategy_dataframe'))
+QUANTILES = (0.5, 0.9, 0.99)
+
+_originals = {}
+_recorder = None
+# Time spent in the recorded calls nested in each running recorded call.
+_nested = []
+
+
+class StageStats(object):
+    # Calls, cumulative self and inclusive seconds and the last `capacity` self latencies of one method, plus the leg
+    # and grid sizes seen.
+    def __init__(self, capacity=10000):
+        self.calls = 0
+        self.seconds = 0.
+        self.inclusive_seconds = 0.
+        self.latencies = np.empty(capacity)
+        self.max_legs = 0
+        self.points = 0
+
+    def record(self, seconds, legs=None, points=None, inclusive_seconds=None):
+        self.latencies[self.calls % len(self.latencies)] = seconds
+        self.calls += 1
+        self.seconds += seconds
+        self.inclusive_seconds += seconds if inclusive_seconds is None else inclusive_seconds
+        if legs is not None:
+            self.max_legs = max(self.max_legs, legs)
+        if points is not None:
+            self.points += points
+
+    def quantiles(self):
+        latencies = self.latencies[:min(self.calls, len(self.latencies))]
+        if len(latencies) == 0:
+            return {quantile: 0. for quantile in QUANTILES}
+        return dict(zip(QUANTILES, np.quantile(latencies, QUANTILES).tolist()))
+
+
+class Recorder(object):
+    def __init__(self, target=None, capacity=10000):
+        # With a target strategy only its own calls, those of its payoff and the contract lookups are recorded.
+        self.target = target
+        self.capacity = capacity
+        self.stats = {}
+
+    def record(self, stage, method, seconds, legs=None, points=None, inclusive_seconds=None):
+        key = (stage, method)
+        if key not in self.stats:
+            self.stats[key] = StageStats(self.capacity)
+        self.stats[key].record(seconds, legs, points, inclusive_seconds)
+
+    def snapshot(self):
+        return [dict(stage=stage, method=method, calls=stats.calls, seconds=stats.seconds,
+                     inclusive_seconds=stats.inclusive_seconds, max_legs=stats.max_legs, points=stats.points,
+                     quantiles={str(quantile): value for quantile, value in stats.quantiles().items()})
+                for (stage, method), stats in sorted(self.stats.items())]
+
+    def to_json_lines(self, path):
+        # Appends one JSON object per method, stamped with the export time.
+        timestamp = time.time()
+        with open(path, 'a') as log_file:
+            for entry in self.snapshot():
+                log_file.write(json.dumps(dict(entry, time=timestamp), sort_keys=True) + '\n')
+
+    def to_prometheus(self, path=None):
+        # Prometheus text exposition format; written to path when given.
+        lines = ['# HELP optionstrategy_stage_seconds Self latency of the instrumented hot paths.',
+                 '# TYPE optionstrategy_stage_seconds summary']
+        entries = self.snapshot()
+        for entry in entries:
+            labels = 'stage="{}",method="{}"'.format(entry['stage'], entry['method'])
+            for quantile, value in entry['quantiles'].items():
+                lines.append('optionstrategy_stage_seconds{{{},quantile="{}"}} {!r}'.format(labels, quantile, value))
+            lines.append('optionstrategy_stage_seconds_sum{{{}}} {!r}'.format(labels, entry['seconds']))
+            lines.append('optionstrategy_stage_seconds_count{{{}}} {}'.format(labels, entry['calls']))
+        for name, key, help_text in (('legs', 'max_legs', 'Largest leg count seen.'),
+                                     ('points', 'points', 'Price grid points valued.')):
+            lines.append('# HELP optionstrategy_stage_{} {}'.format(name, help_text))
+            lines.append('# TYPE optionstrategy_stage_{} gauge'.format(name))
+            for entry in entries:
+                lines.append('optionstrategy_stage_{}{{stage="{}",method="{}"}} {}'.format(
+                    name, entry['stage'], entry['method'], entry[key]))
+        text = '\n'.join(lines) + '\n'
+        if path is not None:
+            with open(path, 'w') as metrics_file:
+                metrics_file.write(text)
+        return text
+
+
+def enable(recorder=None):
+    # Wraps the hot paths, recording into recorder (a new one when None); returns the recorder.
+    global _recorder
+    _recorder = Recorder() if recorder is None else recorder
+    if not _originals:
+        for stage, cls, name in HOT_PATHS:
+            original = cls.__dict__[name]
+            _originals[(cls, name)] = original
+            setattr(cls, name, _timed(stage, name, original))
+    return _recorder
+
+
+def disable():
+    global _recorder
+    for (cls, name), original in _originals.items():
+        setattr(cls, name, original)
+    _originals.clear()
+    _recorder = None
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+@contextmanager
+def profile(strategy=None):
+    # Records the block (only the calls on strategy when given) into a new Recorder, whose 'profile' stage holds
+    # the time of the whole block. The previous instrumentation state is restored afterwards.
+    previous = _recorder
+    recorder = enable(Recorder(target=strategy))
+    start = time.perf_counter()
+    try:
+        yield recorder
+    finally:
+        recorder.record('profile', 'block', time.perf_counter() - start,
+                        None if strategy is None else len(strategy.legs))
+        if previous is None:
+            disable()
+        else:
+            enable(previous)
+
+
+def _timed(stage, name, original):
+    function = original.__func__ if isinstance(original, classmethod) else original
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        recorder = _recorder
+        if recorder is None or not _is_recorded(recorder, self):
+            return function(self, *args, **kwargs)
+        _nested.append(0.)
+        start = time.perf_counter()
+        try:
+            result = function(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            nested = _nested.pop()
+            if _nested:
+                _nested[-1] += seconds
+        legs = len(self.legs) if isinstance(self, OptionStrategy) else None
+        points = None
+        if name in ('profit_loss_over', 'evaluate'):
+            points = int(np.size(args[0] if args else kwargs['prices']))
+        elif name == '_generate_strategy_dataframe':
+            points = len(result)
+        recorder.record(stage, name, seconds - nested, legs, points, seconds)
+        return result
+
+    return classmethod(wrapper) if isinstance(original, classmethod) else wrapper
+
+
+def _is_recorded(recorder, instance):
+    target = recorder.target
+    if target is None:
+        return True
+    if isinstance(instance, OptionStrategy):
+        return instance is target
+    if isinstance(instance, PiecewisePayoff):
+        return instance is target._payoff
+    return True
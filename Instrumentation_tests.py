@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import Instrumentation
+from ContractLoader import load_contracts
+from OptionStrategy import OptionOperation, OptionStrategy, Position
+
+df_contracts = load_contracts(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_files',
+                                           'Contracts.json'), use_cache=False)
+iron_condor = {198003954: 1, 198003965: -1, 215521192: -1, 198003244: 1}
+
+
+def evaluate(name='IronCondor'):
+    strategy = OptionStrategy(name)
+    for con_id, position in iron_condor.items():
+        strategy.add(OptionOperation.from_ConId(df_contracts, con_id, Position(position), premium=1))
+    strategy.profit_loss_at(2050.)
+    strategy.profit_loss_over(np.arange(1900., 2200., 1.))
+    strategy._generate_strategy_dataframe()
+    return strategy
+
+
+@pytest.fixture(autouse=True)
+def disabled():
+    yield
+    Instrumentation.disable()
+
+
+def test_disabled_instrumentation_leaves_the_original_methods():
+    original_add = OptionStrategy.__dict__['add']
+    original_from_ConId = OptionOperation.__dict__['from_ConId']
+    Instrumentation.enable()
+    assert OptionStrategy.__dict__['add'] is not original_add
+    Instrumentation.disable()
+    assert OptionStrategy.__dict__['add'] is original_add
+    assert OptionOperation.__dict__['from_ConId'] is original_from_ConId
+    assert not Instrumentation.is_enabled()
+
+
+def test_every_stage_is_counted_with_its_sizes():
+    recorder = Instrumentation.enable()
+    evaluate()
+    stats = {(entry['stage'], entry['method']): entry for entry in recorder.snapshot()}
+    assert stats[('lookup', 'from_ConId')]['calls'] == 4
+    assert stats[('add', 'add')]['calls'] == 4
+    assert stats[('add', 'add')]['max_legs'] == 4
+    assert stats[('payoff', 'profit_loss_at')]['calls'] == 1
+    # The DataFrame is valued over its own grid with profit_loss_over too.
+    dataframe_points = stats[('dataframe', '_generate_strategy_dataframe')]['points']
+    assert stats[('payoff', 'profit_loss_over')]['points'] == 300 + dataframe_points
+    assert stats[('dataframe', '_generate_strategy_dataframe')]['calls'] == 1
+    quantiles = stats[('add', 'add')]['quantiles']
+    assert 0 < quantiles['0.5'] <= quantiles['0.9'] <= quantiles['0.99']
+
+
+def test_profile_records_one_strategy_end_to_end():
+    other = evaluate('Other')
+    with Instrumentation.profile(other) as recorder:
+        evaluate('Ignored')
+        other.profit_loss_at(2000.)
+    stats = {(entry['stage'], entry['method']): entry for entry in recorder.snapshot()}
+    assert stats[('payoff', 'profit_loss_at')]['calls'] == 1
+    assert stats[('payoff', 'evaluate')]['calls'] == 1
+    assert ('add', 'add') not in stats
+    assert stats[('lookup', 'from_ConId')]['calls'] == 4
+    assert stats[('profile', 'block')]['calls'] == 1
+    assert not Instrumentation.is_enabled()
+
+
+def test_nested_calls_are_not_counted_twice():
+    recorder = Instrumentation.enable()
+    strategy = evaluate()
+    for price in np.arange(1900., 2200., 10.):
+        strategy.profit_loss_at(price)
+    stats = {(entry['stage'], entry['method']): entry for entry in recorder.snapshot()}
+    profit_loss_at, payoff = stats[('payoff', 'profit_loss_at')], stats[('payoff', 'evaluate')]
+    assert payoff['calls'] == profit_loss_at['calls'] == 31
+    assert profit_loss_at['inclusive_seconds'] == pytest.approx(profit_loss_at['seconds'] + payoff['inclusive_seconds'])
+    dataframe = stats[('dataframe', '_generate_strategy_dataframe')]
+    assert dataframe['seconds'] < dataframe['inclusive_seconds']
+
+
+def test_metrics_are_exported_as_json_lines_and_prometheus_text(tmp_path):
+    recorder = Instrumentation.enable()
+    evaluate()
+    log_path = str(tmp_path / 'metrics.jsonl')
+    recorder.to_json_lines(log_path)
+    recorder.to_json_lines(log_path)
+    with open(log_path) as log_file:
+        entries = [json.loads(line) for line in log_file]
+    assert len(entries) == 2 * len(recorder.stats)
+    text = recorder.to_prometheus(str(tmp_path / 'metrics.prom'))
+    assert 'optionstrategy_stage_seconds_count{stage="add",method="add"} 4' in text
+    assert 'optionstrategy_stage_legs{stage="add",method="add"} 4' in text
+    assert open(str(tmp_path / 'metrics.prom')).read() == text
@@ -0,0 +1,212 @@
+import asyncio
+from collections import namedtuple
+
+import numpy as np
+
+from OptionPricing import DAYS_PER_YEAR, Greeks, black76, implied_volatility, years_to_expiry
+
+Tick = namedtuple('Tick', ['con_id', 'price', 'time'])
+Update = namedtuple('Update', ['time', 'strategy', 'profit_loss', 'greeks'])
+
+_SECONDS_PER_YEAR = DAYS_PER_YEAR * 24 * 60 * 60
+
+
+class ReplayFeed(object):
+    # Local stand-in for a broker feed: replays Ticks, sleeping interval seconds after each one.
+    # A feed only needs subscribe(con_ids) and an async ticks() generator of Ticks.
+    def __init__(self, ticks, interval=0.):
+        self._ticks = ticks
+        self.interval = interval
+        self.con_ids = set()
+
+    @classmethod
+    def from_bar_store(cls, bar_store, field='Close', interval=0.):
+        # One tick per non missing bar, in time order.
+        values = bar_store.field(field)
+        rows, columns = np.nonzero(~np.isnan(values))
+        order = np.lexsort((rows, columns))
+        con_ids = bar_store.con_ids[rows[order]].tolist()
+        prices = values[rows[order], columns[order]].tolist()
+        times = bar_store.times[columns[order]]
+        return cls([Tick(*tick) for tick in zip(con_ids, prices, times)], interval)
+
+    def subscribe(self, con_ids):
+        self.con_ids.update(con_ids)
+
+    async def ticks(self):
+        for tick in self._ticks:
+            if tick.con_id in self.con_ids:
+                yield tick
+                await asyncio.sleep(self.interval)
+
+
+class Subscription(object):
+    # Bounded queue of Updates; when it is full the oldest update is dropped, so a slow consumer never blocks the
+    # pricing loop. None is queued when the service stops.
+    def __init__(self, maxsize=100):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, update):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(update)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        update = await self.queue.get()
+        if update is None:
+            raise StopAsyncIteration
+        return update
+
+
+class LiveService(object):
+    # Revalues the registered strategies on the ticks of a feed. Ticks only overwrite the last price of their ConId;
+    # the pricing loop wakes on the first tick after a revaluation, waits coalesce seconds for the rest of the burst
+    # and then values the legs of every strategy in one vectorized pass, so an update lags its ticks by at most
+    # coalesce plus one revaluation.
+    # profit_loss is marked to the last option prices; the Greeks use Black-76 on the underlying future with
+    # volatility or, when it is None, the implied volatility of every leg. Their price is the model profit/loss.
+    def __init__(self, feed, coalesce=0.05, volatility=None, rate=0.):
+        self.feed = feed
+        self.coalesce = coalesce
+        self.volatility = volatility
+        self.rate = rate
+        self.ticks = 0
+        self.revaluations = 0
+        self.time = None
+        self._strategies = {}
+        self._subscriptions = []
+        self._slots = {}
+        self._prices = np.full(8, np.nan)
+        self._packed = None
+        self._dirty = None
+        self._done = False
+        self._running = False
+
+    def add(self, strategy, underlying):
+        # underlying is the ConId of the future the options are written on. While the service runs, the contracts
+        # of the strategy are subscribed right away.
+        self._strategies[strategy] = underlying
+        self._packed = None
+        if self._running:
+            self.feed.subscribe(self._con_ids_of(strategy))
+
+    def remove(self, strategy):
+        del self._strategies[strategy]
+        self._packed = None
+
+    def refresh(self, strategy):
+        # To be called after the legs of a registered strategy changed, e.g. a leg on a new ConId.
+        self._packed = None
+        if self._running:
+            self.feed.subscribe(self._con_ids_of(strategy))
+
+    def subscribe(self, maxsize=100):
+        subscription = Subscription(maxsize)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.remove(subscription)
+
+    def on_tick(self, tick):
+        self._prices[self._slot_of(tick.con_id)] = tick.price
+        self.time = tick.time if self.time is None else max(self.time, tick.time)
+        self.ticks += 1
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def run(self):
+        # Runs until the feed is exhausted; the last ticks are always valued.
+        self._dirty = asyncio.Event()
+        self._done = False
+        self._running = True
+        self.feed.subscribe({con_id for strategy in self._strategies for con_id in self._con_ids_of(strategy)})
+        pricing = asyncio.ensure_future(self._pricing_loop())
+        try:
+            async for tick in self.feed.ticks():
+                self.on_tick(tick)
+        finally:
+            self._running = False
+            self._done = True
+            self._dirty.set()
+            await pricing
+
+    def revalue(self):
+        # Values every strategy at the last prices and publishes one Update per strategy.
+        if self._packed is None:
+            self._packed = self._pack()
+        strategies, owners, slots, underlying_slots, strikes, is_call, weights, cost, expiry_years = self._packed
+        marks = self._prices[slots]
+        forward = self._prices[underlying_slots]
+        as_of = (np.datetime64(self.time, 's') - np.datetime64(0, 's')) / np.timedelta64(1, 's') / _SECONDS_PER_YEAR
+        time_to_expiry = expiry_years - as_of
+        volatility = self.volatility
+        if volatility is None:
+            volatility, _ = implied_volatility(marks, forward, strikes, time_to_expiry, is_call, self.rate)
+        unit = black76(forward, strikes, time_to_expiry, volatility, is_call, self.rate)
+        count = len(strategies)
+        profit_loss = np.bincount(owners, weights * marks - cost, count)
+        greeks = Greeks(np.bincount(owners, weights * unit.price - cost, count),
+                        *[np.bincount(owners, weights * greek, count) for greek in unit[1:]])
+        updates = [Update(self.time, strategy, profit_loss[number], Greeks(*[greek[number] for greek in greeks]))
+                   for number, strategy in enumerate(strategies)]
+        self.revaluations += 1
+        for update in updates:
+            self._publish(update)
+        return updates
+
+    async def _pricing_loop(self):
+        while True:
+            await self._dirty.wait()
+            if not self._done:
+                await asyncio.sleep(self.coalesce)
+            self._dirty.clear()
+            if self.time is not None:
+                self.revalue()
+            if self._done:
+                break
+        for subscription in self._subscriptions:
+            subscription.put(None)
+
+    def _publish(self, update):
+        for subscription in self._subscriptions:
+            subscription.put(update)
+
+    def _con_ids_of(self, strategy):
+        return {self._strategies[strategy]} | set(strategy.legs.con_id.tolist())
+
+    def _slot_of(self, con_id):
+        slot = self._slots.get(con_id)
+        if slot is None:
+            slot = self._slots[con_id] = len(self._slots)
+            if slot == len(self._prices):
+                self._prices = np.concatenate([self._prices, np.full(slot, np.nan)])
+        return slot
+
+    def _pack(self):
+        # The legs of all the strategies as flat arrays, owners giving the strategy of every leg.
+        strategies = list(self._strategies)
+        legs = [strategy.legs for strategy in strategies]
+        owners = np.repeat(np.arange(len(strategies)), [len(strategy_legs) for strategy_legs in legs])
+        con_ids = [con_id for strategy_legs in legs for con_id in strategy_legs.con_id.tolist()]
+        slots = np.array([self._slot_of(con_id) for con_id in con_ids], dtype=np.intp)
+        underlying_slots = np.array([self._slot_of(self._strategies[strategies[owner]]) for owner in owners.tolist()],
+                                    dtype=np.intp)
+
+        def column(name):
+            return np.concatenate([np.asarray(getattr(strategy_legs, name), dtype=float) for strategy_legs in legs] +
+                                  [np.empty(0)])
+
+        signs = column('signs')
+        expiries = [expiry for strategy_legs in legs for expiry in strategy_legs.expiry]
+        return (strategies, owners, slots, underlying_slots, column('strike'), column('is_call').astype(bool),
+                signs * column('multiplier'), signs * column('premium'),
+                years_to_expiry(expiries, '1970-01-01') if expiries else np.empty(0))
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+
+import numpy as np
+import pytest
+
+from Backtest import Backtest
+from LiveService import *
+from OptionStrategy import OptionStrategy
+
+
+@pytest.fixture
+def condor_after(adaptive_condor):
+    def build(steps, bar_store):
+        # The adaptive condor with the fills of its first steps, as the backtest would hold it.
+        strategy = OptionStrategy('AdaptativeCondor')
+        for step in range(steps):
+            for option in adaptive_condor(strategy, step, bar_store) or []:
+                strategy.add(option)
+        return strategy
+
+    return build
+
+
+def test_updates_match_the_backtest_marks(session, condor_after, adaptive_condor, underlying):
+    # Before the adjustment of step 120, which closes a leg along with its realized profit/loss.
+    bar_store = session(steps=110)
+    strategy = condor_after(110, bar_store)
+    service = LiveService(ReplayFeed.from_bar_store(bar_store), coalesce=0.)
+    service.add(strategy, underlying)
+    subscription = service.subscribe(maxsize=1000)
+
+    async def consume():
+        return [update async for update in subscription]
+
+    async def main():
+        updates = asyncio.ensure_future(consume())
+        await service.run()
+        return await updates
+
+    updates = asyncio.run(main())
+    assert service.ticks == 110 * 5 - 3
+    assert subscription.dropped == 0
+    last = updates[-1]
+    assert last.time == bar_store.times[-1]
+    assert last.strategy is strategy
+    assert last.profit_loss == pytest.approx(Backtest(bar_store, adaptive_condor).run().profit_loss[-1])
+    # The option prices were made with a 20% volatility, so the implied volatility gives back the marks.
+    assert last.greeks.price == pytest.approx(last.profit_loss)
+    _, expected = strategy.greeks(bar_store.select(underlying, 'Close')[-1], 0.2, as_of=bar_store.times[-1])
+    assert last.greeks.delta == pytest.approx(expected.delta)
+    assert last.greeks.vega == pytest.approx(expected.vega)
+
+
+class BurstFeed(object):
+    # Sends the ticks of a bar at once, then waits for the test to release the next bar, so the ticks of a burst
+    # arrive without the pricing loop running in between, whatever the speed of the machine.
+    def __init__(self, bar_store):
+        ticks = ReplayFeed.from_bar_store(bar_store)._ticks
+        self.bursts = [list(burst) for _, burst in itertools.groupby(ticks, key=lambda tick: tick.time)]
+        self.con_ids = set()
+        self.released = None
+
+    def subscribe(self, con_ids):
+        self.con_ids.update(con_ids)
+
+    async def ticks(self):
+        self.released = asyncio.Event()
+        for burst in self.bursts:
+            self.released.clear()
+            for tick in burst:
+                if tick.con_id in self.con_ids:
+                    yield tick
+            await self.released.wait()
+
+
+def run_bursts(service, feed, on_update=None):
+    # Runs the service, releasing the next burst of the feed on the updates of a revaluation. The updates of a
+    # revaluation are queued together and read without suspending, so the feed only resumes once they are all read.
+    subscription = service.subscribe(maxsize=10000)
+
+    async def consume():
+        updates = []
+        async for update in subscription:
+            updates.append(update)
+            if on_update is not None:
+                on_update(update)
+            feed.released.set()
+        return updates
+
+    async def main():
+        updates = asyncio.ensure_future(consume())
+        await service.run()
+        return await updates
+
+    return asyncio.run(main())
+
+
+def test_bursts_of_ticks_are_coalesced(session, condor_after, underlying):
+    bar_store = session(steps=300)
+    feed = BurstFeed(bar_store)
+    service = LiveService(feed, coalesce=0., volatility=0.2)
+    service.add(condor_after(1, bar_store), underlying)
+    service.add(condor_after(200, bar_store), underlying)
+    updates = run_bursts(service, feed)
+    assert service.ticks == 300 * 6 - 3
+    # One revaluation per burst, plus the final one when the feed ends.
+    assert service.revaluations == 300 + 1
+    assert [update.time for update in updates[::2]][:300] == list(bar_store.times)
+
+
+def test_slow_subscribers_do_not_block_the_pricing_loop(session, condor_after, underlying):
+    bar_store = session(steps=50)
+    feed = BurstFeed(bar_store)
+    service = LiveService(feed, coalesce=0.)
+    service.add(condor_after(1, bar_store), underlying)
+    slow = service.subscribe(maxsize=3)
+    updates = run_bursts(service, feed)
+    assert service.revaluations == 50 + 1
+    assert len(updates) == service.revaluations
+    assert slow.dropped == service.revaluations + 1 - 3
+    queued = [slow.queue.get_nowait() for _ in range(3)]
+    assert queued[-1] is None
+    assert queued[-2].time == bar_store.times[-1]
+
+
+def test_strategies_added_while_running_are_subscribed(session, condor_after, underlying):
+    bar_store = session(steps=20)
+    feed = BurstFeed(bar_store)
+    service = LiveService(feed, coalesce=0., volatility=0.2)
+    first = condor_after(1, bar_store)
+    second = condor_after(200, session(steps=300))
+    service.add(first, underlying)
+
+    def add_second(update):
+        if update.time == bar_store.times[9] and second not in service._strategies:
+            service.add(second, underlying)
+
+    updates = run_bursts(service, feed, add_second)
+    assert feed.con_ids == {underlying, 1, 2, 3, 4, 5}
+    last = [update for update in updates if update.strategy is second][-1]
+    assert last.time == bar_store.times[-1]
+    assert np.isfinite(last.profit_loss)
+    assert np.isfinite(last.greeks.delta)
+
+
+def test_feed_only_sends_the_contracts_of_the_strategies(session, condor_after, underlying):
+    bar_store = session(steps=10)
+    feed = ReplayFeed.from_bar_store(bar_store)
+    service = LiveService(feed, coalesce=0.)
+    strategy = condor_after(1, bar_store)
+    service.add(strategy, underlying)
+    asyncio.run(service.run())
+    assert feed.con_ids == {underlying, 1, 2, 3, 4}
+    assert service.ticks == 10 * 5
+    assert np.isfinite(service.revalue()[0].profit_loss)
@@ -0,0 +1,96 @@
+from collections import namedtuple
+from math import ceil
+
+import numpy as np
+
+Distribution = namedtuple('Distribution', ['paths', 'probability_of_profit', 'expected', 'standard_deviation',
+                                           'value_at_risk', 'conditional_value_at_risk', 'counts', 'edges'])
+
+Model = namedtuple('Model', ['underlying', 'volatility', 'time_to_expiry', 'drift', 'jump_intensity', 'jump_mean',
+                             'jump_volatility'])
+
+
+def terminal_prices(rng, model, size):
+    # Geometric Brownian motion plus Merton log-normal jumps. The jump compensation keeps the mean terminal price at
+    # underlying * exp(drift * time_to_expiry), so with the default zero drift the underlying is a futures price.
+    underlying, volatility, time_to_expiry, drift, intensity, jump_mean, jump_volatility = model
+    compensation = intensity * (np.exp(jump_mean + 0.5 * jump_volatility ** 2) - 1.)
+    log_return = ((drift - 0.5 * volatility ** 2 - compensation) * time_to_expiry +
+                  volatility * np.sqrt(time_to_expiry) * rng.standard_normal(size))
+    if intensity > 0:
+        jumps = rng.poisson(intensity * time_to_expiry, size)
+        log_return += jump_mean * jumps + jump_volatility * np.sqrt(jumps) * rng.standard_normal(size)
+    return underlying * np.exp(log_return)
+
+
+def evaluate_breakpoints(breakpoints, prices):
+    # Profit/loss of the piecewise-linear payoff given by OptionStrategy.payoff_breakpoints.
+    strikes, values, slopes = breakpoints
+    index = np.searchsorted(strikes, prices)
+    anchor = np.maximum(index - 1, 0)
+    return values[anchor] + slopes[index] * (prices - strikes[anchor])
+
+
+def simulate_profit_loss(breakpoints, underlying, volatility, time_to_expiry, paths=1000000, chunk_size=250000,
+                         seed=None, processes=1, confidence=0.95, bins=100, drift=0., jump_intensity=0.,
+                         jump_mean=0., jump_volatility=0.):
+    # Distribution of the profit/loss at expiry over simulated terminal prices. The paths are drawn in chunks, each
+    # one from its own child of SeedSequence(seed), so the result only depends on seed, paths and chunk_size and not
+    # on the number of processes; the chunk summaries are reduced in chunk order.
+    # value_at_risk and conditional_value_at_risk are losses (positive) at the confidence level; counts is the
+    # histogram of the profit/loss over edges, with the outliers counted in the first and last bins.
+    strikes, values, slopes = [np.asarray(array, dtype=float) for array in breakpoints]
+    if len(strikes) == 0:
+        raise ValueError('The strategy has no legs.')
+    breakpoints = strikes, values, slopes
+    model = Model(float(underlying), float(volatility), float(time_to_expiry), drift, jump_intensity, jump_mean,
+                  jump_volatility)
+    sizes = [chunk_size] * (paths // chunk_size) + ([paths % chunk_size] if paths % chunk_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    # The tolerance keeps 1 - 0.95 = 0.05000000000000004 from adding a path to the tail.
+    tail_size = max(1, int(ceil((1. - confidence) * paths - 1e-9)))
+    edges = _histogram_edges(breakpoints, model, bins)
+    tasks = [(breakpoints, model, chunk_seed, size, tail_size, edges) for chunk_seed, size in zip(seeds, sizes)]
+    if processes == 1:
+        summaries = map(_simulate_chunk, tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as executor:
+            summaries = list(executor.map(_simulate_chunk, tasks))
+
+    count, mean, squares, profitable, counts, tail = 0, 0., 0., 0, np.zeros(bins, dtype=np.int64), []
+    for chunk_count, chunk_mean, chunk_squares, chunk_profitable, chunk_counts, chunk_tail in summaries:
+        # Chan et al. pairwise update of the mean and the sum of squared deviations.
+        total = count + chunk_count
+        difference = chunk_mean - mean
+        mean += difference * chunk_count / total
+        squares += chunk_squares + difference ** 2 * count * chunk_count / total
+        count = total
+        profitable += chunk_profitable
+        counts += chunk_counts
+        tail = np.sort(np.concatenate([tail, chunk_tail]))[:tail_size]
+    return Distribution(count, profitable / count, mean, np.sqrt(squares / count), -tail[-1], -tail.mean(), counts,
+                        edges)
+
+
+def _simulate_chunk(task):
+    breakpoints, model, seed, size, tail_size, edges = task
+    profit_loss = evaluate_breakpoints(breakpoints, terminal_prices(np.random.default_rng(seed), model, size))
+    mean = profit_loss.mean()
+    bins = np.clip(np.searchsorted(edges, profit_loss, 'right') - 1, 0, len(edges) - 2)
+    tail = np.partition(profit_loss, tail_size - 1)[:tail_size] if size > tail_size else profit_loss
+    return (size, mean, np.square(profit_loss - mean).sum(), np.count_nonzero(profit_loss > 0),
+            np.bincount(bins, minlength=len(edges) - 1), tail)
+
+
+def _histogram_edges(breakpoints, model, bins):
+    # Spans the profit/loss over eight standard deviations of the log terminal price around its mean.
+    strikes = breakpoints[0]
+    underlying, volatility, time_to_expiry, drift, intensity, jump_mean, jump_volatility = model
+    deviation = np.sqrt((volatility ** 2 + intensity * (jump_mean ** 2 + jump_volatility ** 2)) * time_to_expiry)
+    center = np.log(underlying) + (drift + intensity * jump_mean) * time_to_expiry
+    prices = np.concatenate([np.exp(center + [-8 * deviation, 8 * deviation]), strikes])
+    prices = prices[(prices >= prices[0]) & (prices <= prices[1])]
+    profit_loss = evaluate_breakpoints(breakpoints, prices)
+    low, high = profit_loss.min(), profit_loss.max()
+    return np.linspace(low, high if high > low else low + 1., bins + 1)
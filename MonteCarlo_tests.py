@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+
+from MonteCarlo import *
+from OptionPricing import black76
+from OptionStrategy import OptionType, Position
+
+
+def long_call(strategy_of):
+    premium = black76(100., 100., 0.5, 0.2, True).price.item()
+    return strategy_of([(0, Position.Long, OptionType.Call, 100., premium)]), premium
+
+
+def test_long_call_distribution_matches_Black76(strategy_of):
+    strategy, premium = long_call(strategy_of)
+    distribution = strategy.profit_loss_distribution(100., 0.2, 0.5, paths=1000000, seed=1)
+    tolerance = 4 * distribution.standard_deviation / math.sqrt(distribution.paths)
+    assert distribution.paths == 1000000
+    assert distribution.expected == pytest.approx(0., abs=tolerance)
+    break_even_d2 = (math.log(100. / (100. + premium)) - 0.5 * 0.2 ** 2 * 0.5) / (0.2 * math.sqrt(0.5))
+    assert distribution.probability_of_profit == pytest.approx(0.5 * math.erfc(-break_even_d2 / math.sqrt(2)),
+                                                               abs=2e-3)
+    # More than 5% of the paths lose the whole premium.
+    assert distribution.value_at_risk == pytest.approx(premium)
+    assert distribution.conditional_value_at_risk == pytest.approx(premium)
+    assert distribution.counts.sum() == distribution.paths
+    assert len(distribution.edges) == 101
+
+
+def test_simulation_is_reproducible_whatever_the_processes(strategy_of):
+    strategy = strategy_of([(0, Position.Long, OptionType.Put, 90., 1.), (1, Position.Short, OptionType.Put, 95., 2.),
+                            (2, Position.Short, OptionType.Call, 105., 2.),
+                            (3, Position.Long, OptionType.Call, 110., 1.)])
+    options = dict(paths=300001, chunk_size=50000, seed=7, confidence=0.99, jump_intensity=1., jump_mean=-0.05,
+                   jump_volatility=0.1)
+    sequential = strategy.profit_loss_distribution(100., 0.25, 0.25, **options)
+    parallel = strategy.profit_loss_distribution(100., 0.25, 0.25, processes=2, **options)
+    for expected, actual in zip(sequential, parallel):
+        assert np.array_equal(expected, actual)
+    assert sequential.paths == 300001
+    assert 0 < sequential.value_at_risk <= 3.
+    assert sequential.value_at_risk <= sequential.conditional_value_at_risk <= 3.
+
+
+def test_tail_measures_match_the_whole_sample(strategy_of):
+    strategy = strategy_of([(0, Position.Short, OptionType.Put, 95., 1.5),
+                            (1, Position.Short, OptionType.Call, 105., 1.5)])
+    breakpoints = strategy.payoff_breakpoints()
+    distribution = simulate_profit_loss(breakpoints, 100., 0.3, 0.25, paths=100000, chunk_size=30000, seed=3)
+    model = Model(100., 0.3, 0.25, 0., 0., 0., 0.)
+    seeds = np.random.SeedSequence(3).spawn(4)
+    sample = np.concatenate([evaluate_breakpoints(breakpoints, terminal_prices(np.random.default_rng(seed), model,
+                                                                               size))
+                             for seed, size in zip(seeds, [30000, 30000, 30000, 10000])])
+    worst = np.sort(sample)[:5000]
+    assert distribution.value_at_risk == pytest.approx(-worst[-1])
+    assert distribution.conditional_value_at_risk == pytest.approx(-worst.mean())
+    assert distribution.expected == pytest.approx(sample.mean())
+    assert distribution.standard_deviation == pytest.approx(sample.std())
+    assert distribution.probability_of_profit == np.count_nonzero(sample > 0) / len(sample)
+
+
+def test_jumps_keep_the_futures_price_a_martingale(strategy_of):
+    synthetic_future = strategy_of([(0, Position.Long, OptionType.Call, 100., 0.),
+                                    (1, Position.Short, OptionType.Put, 100., 0.)])
+    distribution = synthetic_future.profit_loss_distribution(100., 0.2, 1., paths=1000000, seed=11, jump_intensity=2.,
+                                                             jump_mean=-0.1, jump_volatility=0.15)
+    assert distribution.expected == pytest.approx(0., abs=4 * distribution.standard_deviation / 1000.)
+
+
+def test_time_to_expiry_comes_from_the_legs_expiry(strategy_of):
+    strategy, _ = long_call(strategy_of)
+    from_dates = strategy.profit_loss_distribution(100., 0.2, as_of='2016-06-16', paths=10000, seed=5)
+    given = strategy.profit_loss_distribution(100., 0.2, 92 / 365., paths=10000, seed=5)
+    assert from_dates.expected == pytest.approx(given.expected)
+    calendar = strategy_of([(0, Position.Long, OptionType.Call, 100., 1.),
+                            (1, Position.Short, OptionType.Call, 100., 1.)], expiries=('20160916', '20161216'))
+    with pytest.raises(ValueError):
+        calendar.profit_loss_distribution(100., 0.2, as_of='2016-06-16')
+    with pytest.raises(ValueError, match='time_to_expiry or as_of'):
+        strategy.profit_loss_distribution(100., 0.2, paths=10000)
@@ -0,0 +1,191 @@
+from collections import namedtuple
+from datetime import date, datetime
+
+import numpy as np
+
+Greeks = namedtuple('Greeks', ['price', 'delta', 'gamma', 'vega', 'theta', 'rho'])
+
+DAYS_PER_YEAR = 365.
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * np.square(x)) / np.sqrt(2 * np.pi)
+
+
+def norm_cdf(x):
+    # Hart's double precision rational approximation (as given by G. West, "Better approximations to cumulative
+    # normal functions"), so no scipy is needed.
+    x = np.asarray(x, dtype=float)
+    abs_x = np.abs(x)
+    exponential = np.exp(-0.5 * np.square(np.minimum(abs_x, 38.)))
+    numerator = 3.52624965998911e-02
+    for coefficient in (0.700383064443688, 6.37396220353165, 33.912866078383, 112.079291497871, 221.213596169931,
+                        220.206867912376):
+        numerator = numerator * abs_x + coefficient
+    denominator = 8.83883476483184e-02
+    for coefficient in (1.75566716318264, 16.064177579207, 86.7807322029461, 296.564248779674, 637.333633378831,
+                        793.826512519948, 440.413735824752):
+        denominator = denominator * abs_x + coefficient
+    with np.errstate(invalid='ignore'):
+        fraction = abs_x + 0.65
+        for coefficient in (4., 3., 2., 1.):
+            fraction = abs_x + coefficient / fraction
+        tail = np.where(abs_x < 7.07106781186547, exponential * numerator / denominator,
+                        exponential / fraction / 2.506628274631)
+    tail = np.where(abs_x > 37., 0., tail)
+    return np.where(x > 0, 1. - tail, tail)
+
+
+def black76(forward, strike, time_to_expiry, volatility, is_call, rate=0.):
+    # Price and Greeks of options on futures, per unit of underlying. Every argument broadcasts against the others.
+    # Theta is per year of calendar time and expired (or zero volatility) options are worth their intrinsic value.
+    forward, strike, volatility, rate = [np.asarray(value, dtype=float) for value in (forward, strike, volatility,
+                                                                                      rate)]
+    time_to_expiry = np.maximum(np.asarray(time_to_expiry, dtype=float), 0.)
+    phi = np.where(is_call, 1., -1.)
+    discount = np.exp(-rate * time_to_expiry)
+    sqrt_time = np.sqrt(time_to_expiry)
+    deviation = volatility * sqrt_time
+    expired = deviation <= 0
+    safe_deviation = np.where(expired, 1., deviation)
+    d1, d2 = _d1_d2(forward, strike, deviation, phi)
+    density = norm_pdf(d1)
+    price = discount * phi * (forward * norm_cdf(phi * d1) - strike * norm_cdf(phi * d2))
+    delta = discount * phi * norm_cdf(phi * d1)
+    gamma = discount * density / (forward * safe_deviation)
+    vega = discount * forward * density * sqrt_time
+    theta = rate * price - discount * forward * density * volatility / (2 * np.where(expired, 1., sqrt_time))
+    rho = -time_to_expiry * price
+    return Greeks(price, delta, gamma, vega, theta, rho)
+
+
+def black76_price(forward, strike, time_to_expiry, volatility, is_call, rate=0.):
+    # black76(...).price alone, for the scenario sweeps that need no Greeks.
+    forward, strike, volatility, rate = [np.asarray(value, dtype=float) for value in (forward, strike, volatility,
+                                                                                      rate)]
+    time_to_expiry = np.maximum(np.asarray(time_to_expiry, dtype=float), 0.)
+    phi = np.where(is_call, 1., -1.)
+    d1, d2 = _d1_d2(forward, strike, volatility * np.sqrt(time_to_expiry), phi)
+    return np.exp(-rate * time_to_expiry) * phi * (forward * norm_cdf(phi * d1) - strike * norm_cdf(phi * d2))
+
+
+def _d1_d2(forward, strike, deviation, phi):
+    expired = deviation <= 0
+    safe_deviation = np.where(expired, 1., deviation)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_moneyness = np.log(forward / strike)
+    # At the money options expire out of the money.
+    expired_d1 = np.where(forward > strike, np.inf, np.where(forward < strike, -np.inf, -phi * np.inf))
+    d1 = np.where(expired, expired_d1, log_moneyness / safe_deviation + 0.5 * safe_deviation)
+    return d1, np.where(expired, d1, d1 - deviation)
+
+
+def implied_volatility(prices, forward, strike, time_to_expiry, is_call, rate=0., initial_volatility=None,
+                       tolerance=1e-10, max_iterations=40, lower_volatility=1e-4, upper_volatility=5.):
+    # Black-76 implied volatilities of a whole chain at once: vectorized Halley steps that fall back to bisection
+    # of the [lower_volatility, upper_volatility] bracket when a step leaves it. initial_volatility (e.g. the
+    # previous tick vols) warm starts the solver. Returns (volatility, converged); volatility is NaN where the
+    # price is out of the no-arbitrage bounds or the solver did not converge.
+    prices, forward, strike, time_to_expiry, is_call, rate = np.broadcast_arrays(
+        *[np.asarray(value, dtype=dtype) for value, dtype in ((prices, float), (forward, float), (strike, float),
+                                                              (time_to_expiry, float), (is_call, bool),
+                                                              (rate, float))])
+    shape = prices.shape
+    prices, forward, strike, time_to_expiry, is_call, rate = [value.ravel() for value in (prices, forward, strike,
+                                                                                          time_to_expiry, is_call,
+                                                                                          rate)]
+    phi = np.where(is_call, 1., -1.)
+    # Solve on undiscounted prices.
+    target = prices * np.exp(rate * np.maximum(time_to_expiry, 0.))
+    intrinsic = np.maximum(phi * (forward - strike), 0.)
+    upper_bound = np.where(is_call, forward, strike)
+    solvable = (time_to_expiry > 0) & (target > intrinsic) & (target < upper_bound) & (strike > 0)
+
+    volatility = np.full(target.shape, np.nan)
+    converged = np.zeros(target.shape, dtype=bool)
+    active = np.flatnonzero(solvable)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_moneyness = np.log(forward[active] / strike[active])
+        sqrt_time = np.sqrt(time_to_expiry[active])
+        # Start at the inflection point of the price in volatility (Manaster-Koehler), where Newton is monotone.
+        start = np.maximum(np.sqrt(2 * np.abs(log_moneyness)) / sqrt_time,
+                           np.sqrt(2 * np.pi) * target[active] / forward[active] / sqrt_time)
+    if initial_volatility is not None:
+        warm = np.broadcast_to(np.asarray(initial_volatility, dtype=float), shape).ravel()[active]
+        start = np.where(np.isfinite(warm), warm, start)
+    sigma = np.clip(start, lower_volatility, upper_volatility)
+    lower = np.full(active.shape, lower_volatility)
+    upper = np.full(active.shape, upper_volatility)
+
+    for _ in range(max_iterations):
+        if not len(active):
+            break
+        F, K, sqrt_T, log_FK, p = (forward[active], strike[active], sqrt_time, log_moneyness, target[active])
+        deviation = sigma * sqrt_T
+        d1 = log_FK / deviation + 0.5 * deviation
+        d2 = d1 - deviation
+        f = phi[active] * (F * norm_cdf(phi[active] * d1) - K * norm_cdf(phi[active] * d2)) - p
+        vega = F * norm_pdf(d1) * sqrt_T
+        volga = vega * d1 * d2 / sigma
+
+        done = np.abs(f) <= tolerance * np.maximum(p, 1.)
+        lower = np.where(f < 0, sigma, lower)
+        upper = np.where(f > 0, sigma, upper)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = f / vega
+            step = newton / (1 - 0.5 * newton * volga / vega)
+            step = np.where(np.isfinite(step) & (np.abs(step) < upper - lower), step, newton)
+        new_sigma = sigma - step
+        outside = ~np.isfinite(new_sigma) | (new_sigma <= lower) | (new_sigma >= upper)
+        new_sigma = np.where(outside, 0.5 * (lower + upper), new_sigma)
+        done |= (np.abs(new_sigma - sigma) <= 1e-14 * sigma) & (np.abs(f) <= 1e-6 * np.maximum(p, 1.))
+
+        finished = active[done]
+        volatility[finished] = sigma[done]
+        converged[finished] = True
+        keep = ~done
+        active, sigma, lower, upper = active[keep], new_sigma[keep], lower[keep], upper[keep]
+        sqrt_time, log_moneyness = sqrt_time[keep], log_moneyness[keep]
+    return volatility.reshape(shape), converged.reshape(shape)
+
+
+def years_to_expiry(expiries, as_of, con_ids=None):
+    # Expiries are 'YYYYMMDD' strings, taken at midnight. con_ids name the legs of the expiries in the errors.
+    if as_of is None:
+        raise ValueError('The time to expiry needs as_of (or an explicit time_to_expiry).')
+    for number, expiry in enumerate(expiries):
+        if expiry is None:
+            leg = number if con_ids is None else 'with ConId {}'.format(con_ids[number])
+            raise ValueError('The leg {} has no expiry, the time to expiry can not be computed.'.format(leg))
+    expiries = np.array(['{}-{}-{}'.format(expiry[:4], expiry[4:6], expiry[6:8]) for expiry in expiries],
+                        dtype='datetime64[s]')
+    if isinstance(as_of, (date, datetime, str)):
+        as_of = np.datetime64(as_of, 's')
+    seconds = (expiries - np.asarray(as_of, dtype='datetime64[s]')) / np.timedelta64(1, 's')
+    return seconds / (DAYS_PER_YEAR * 24 * 60 * 60)
+
+
+def strategy_greeks(strategy, underlying, volatility, time_to_expiry=None, rate=0., as_of=None, per_leg=()):
+    # Values every leg of the strategy over the broadcast of underlying, volatility, time_to_expiry and rate in one
+    # pass. Legs run along a new leading axis; the inputs named in per_leg already carry that leading leg axis.
+    # When time_to_expiry is None it is computed for each leg from its expiry and as_of.
+    # Returns (legs, total) Greeks weighted by position, quantity and multiplier; their price is the profit/loss.
+    legs = strategy.legs
+    if time_to_expiry is None:
+        time_to_expiry = years_to_expiry(legs.expiry, as_of, legs.con_id.tolist())
+        per_leg = tuple(per_leg) + ('time_to_expiry',)
+    inputs = {'underlying': underlying, 'volatility': volatility, 'time_to_expiry': time_to_expiry, 'rate': rate}
+    scenario_ndim = max(np.ndim(value) - (name in per_leg) for name, value in inputs.items())
+
+    def by_leg(values):
+        values = np.asarray(values)
+        return np.reshape(values, (len(legs),) + (1,) * (scenario_ndim + 1 - values.ndim) + values.shape[1:])
+
+    for name in per_leg:
+        inputs[name] = by_leg(inputs[name])
+    weights = by_leg(legs.signs * legs.multiplier)
+    unit = black76(inputs['underlying'], by_leg(legs.strike), inputs['time_to_expiry'], inputs['volatility'],
+                   by_leg(legs.is_call), inputs['rate'])
+    profit_loss = weights * unit.price - by_leg(legs.signs * legs.premium)
+    legs_greeks = Greeks(profit_loss, *[weights * greek for greek in unit[1:]])
+    return legs_greeks, Greeks(*[greek.sum(axis=0) for greek in legs_greeks])
@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+import pytest
+
+from OptionPricing import *
+from OptionStrategy import OptionOperation, OptionType, Position
+
+greeks_test_cases = (("comment", "forward", "strike", "time_to_expiry", "volatility", "is_call", "rate"),
+                     [
+                         ('ATM Call', 2100., 2100., 0.25, 0.15, True, 0.01),
+                         ('OTM Put', 2100., 2000., 0.1, 0.2, False, 0.02),
+                         ('ITM Call', 2100., 1950., 0.5, 0.25, True, 0.),
+                         ('ITM Put', 2100., 2200., 1., 0.18, False, 0.03),
+                     ])
+
+
+def test_normal_cdf_matches_the_error_function():
+    x = np.linspace(-10, 10, 2001)
+    expected = [0.5 * math.erfc(-value / math.sqrt(2)) for value in x]
+    assert np.allclose(norm_cdf(x), expected, rtol=1e-13, atol=1e-16)
+
+
+def test_put_call_parity_holds():
+    strikes = np.arange(1800., 2400., 25.)
+    call = black76(2100., strikes, 0.3, 0.2, True, 0.01).price
+    put = black76(2100., strikes, 0.3, 0.2, False, 0.01).price
+    assert np.allclose(call - put, np.exp(-0.01 * 0.3) * (2100. - strikes))
+
+
+@pytest.mark.parametrize(*greeks_test_cases)
+def test_greeks_match_finite_differences(comment, forward, strike, time_to_expiry, volatility, is_call, rate):
+    h = 1e-4
+    greeks = black76(forward, strike, time_to_expiry, volatility, is_call, rate)
+
+    def price(forward=forward, time_to_expiry=time_to_expiry, volatility=volatility, rate=rate):
+        return black76(forward, strike, time_to_expiry, volatility, is_call, rate).price
+
+    assert greeks.delta == pytest.approx((price(forward + h) - price(forward - h)) / (2 * h), rel=1e-6)
+    assert greeks.gamma == pytest.approx((price(forward + 1) - 2 * price() + price(forward - 1)), rel=1e-4)
+    assert greeks.vega == pytest.approx((price(volatility=volatility + h) - price(volatility=volatility - h)) /
+                                        (2 * h), rel=1e-6)
+    assert greeks.theta == pytest.approx(-(price(time_to_expiry=time_to_expiry + h) -
+                                           price(time_to_expiry=time_to_expiry - h)) / (2 * h), rel=1e-5)
+    assert greeks.rho == pytest.approx((price(rate=rate + h) - price(rate=rate - h)) / (2 * h), rel=1e-6)
+
+
+def test_price_alone_matches_the_price_of_the_greeks():
+    strikes = np.arange(1800., 2400., 25.)[:, np.newaxis]
+    times = np.array([0., 0.1, 0.5])
+    for is_call in (True, False):
+        assert np.array_equal(black76_price(2100., strikes, times, 0.2, is_call, 0.01),
+                              black76(2100., strikes, times, 0.2, is_call, 0.01).price)
+
+
+def test_expired_options_are_worth_their_intrinsic_value():
+    greeks = black76(2100., [2000., 2100., 2200.], 0., 0.2, [True, False, False])
+    assert greeks.price.tolist() == [100., 0., 100.]
+    assert greeks.delta.tolist() == [1., 0., -1.]
+    assert greeks.gamma.tolist() == [0., 0., 0.]
+
+
+def test_strategy_valued_at_expiry_matches_the_expiry_profit_loss(condor):
+    strategy = condor()
+    prices = np.arange(1950., 2250., 10.)
+    legs, total = strategy.greeks(prices, 0.2, time_to_expiry=0.)
+    assert np.allclose(legs.price, strategy.profit_loss_over(prices)[0])
+    assert np.allclose(total.price, strategy.profit_loss_over(prices)[1])
+
+
+def test_strategy_greeks_broadcast_over_prices_volatilities_and_times(condor):
+    strategy = condor()
+    prices = np.linspace(1900., 2300., 41)[:, np.newaxis, np.newaxis]
+    volatilities = np.array([0.1, 0.2, 0.3])[:, np.newaxis]
+    times = np.array([0.05, 0.1, 0.2, 0.25])
+    legs, total = strategy.greeks(prices, volatilities, times)
+    assert legs.delta.shape == (4, 41, 3, 4)
+    assert total.delta.shape == (41, 3, 4)
+    single = black76(prices[10, 0, 0], 2150., times[2], volatilities[1, 0], True)
+    assert legs.vega[2, 10, 1, 2] == pytest.approx(-50 * single.vega)
+    assert np.allclose(total.gamma, legs.gamma.sum(axis=0))
+
+
+def test_time_to_expiry_is_taken_from_the_leg_expiries(condor):
+    strategy = condor()
+    assert years_to_expiry(strategy.legs.expiry, '2016-06-18').tolist() == [90 / 365.] * 4
+    legs, _ = strategy.greeks(2100., 0.2, as_of='2016-06-18')
+    expected, _ = strategy.greeks(2100., 0.2, time_to_expiry=90 / 365.)
+    assert np.allclose(legs.price, expected.price)
+
+
+def test_time_to_expiry_needs_as_of_and_the_leg_expiries(condor):
+    strategy = condor()
+    with pytest.raises(ValueError, match='as_of'):
+        strategy.greeks(2100., 0.2)
+    strategy.add(OptionOperation(position=Position.Long, premium=50., option_type=OptionType.Call,
+                                 strike_price=2250., multiplier=50, con_id=7))
+    with pytest.raises(ValueError, match='ConId 7'):
+        strategy.greeks(2100., 0.2, as_of='2016-06-18')
+    # An explicit time to expiry needs neither.
+    assert np.isfinite(strategy.greeks(2100., 0.2, 0.25)[1].price)
+
+
+def test_per_leg_volatilities_broadcast_against_the_scenarios(condor):
+    strategy = condor()
+    prices = np.linspace(1900., 2300., 41)
+    volatilities = np.array([0.25, 0.2, 0.15, 0.17])
+    legs, _ = strategy.greeks(prices, volatilities, 0.1, per_leg=('volatility',))
+    assert legs.price.shape == (4, 41)
+    for leg, volatility in enumerate(volatilities):
+        expected, _ = strategy.greeks(prices, volatility, 0.1)
+        assert np.allclose(legs.price[leg], expected.price[leg])
+
+
+def synthetic_chain(size=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    strikes = rng.uniform(1700., 2500., size)
+    times = rng.uniform(5 / 365., 1., size)
+    volatilities = rng.uniform(0.08, 0.6, size)
+    is_call = rng.rand(size) < 0.5
+    prices = black76(2100., strikes, times, volatilities, is_call, 0.01).price
+    return prices, strikes, times, volatilities, is_call
+
+
+def test_implied_volatility_recovers_the_chain_volatilities():
+    prices, strikes, times, volatilities, is_call = synthetic_chain()
+    # Only quotes with some time value carry information about the volatility.
+    informative = prices - black76(2100., strikes, times, 0., is_call, 0.01).price > 1e-3
+    solved, converged = implied_volatility(prices, 2100., strikes, times, is_call, 0.01)
+    assert converged[informative].all()
+    assert np.allclose(solved[informative], volatilities[informative], atol=1e-7)
+
+
+def test_implied_volatility_keeps_the_shape_of_the_quotes():
+    prices, strikes, times, volatilities, is_call = synthetic_chain(size=60)
+    solved, converged = implied_volatility(prices.reshape(3, 20), 2100., strikes.reshape(3, 20),
+                                           times.reshape(3, 20), is_call.reshape(3, 20), [[0.01], [0.01], [0.01]])
+    assert solved.shape == converged.shape == (3, 20)
+    assert np.allclose(solved[converged], volatilities.reshape(3, 20)[converged])
+
+
+def test_implied_volatility_warm_starts_from_previous_volatilities():
+    prices, strikes, times, volatilities, is_call = synthetic_chain()
+    solved, converged = implied_volatility(prices, 2100., strikes, times, is_call, 0.01,
+                                           initial_volatility=volatilities, max_iterations=1)
+    assert converged.mean() > 0.99
+    assert np.allclose(solved[converged], volatilities[converged])
+
+
+def test_implied_volatility_masks_prices_out_of_the_arbitrage_bounds():
+    solved, converged = implied_volatility([50., 99., 2100., 120., 0.], 2100., [2000., 2000., 2000., 2100., 2100.],
+                                           0.25, True)
+    assert converged.tolist() == [False, False, False, True, False]
+    assert np.isnan(solved[[0, 1, 2, 4]]).all()
+    assert black76(2100., 2100., 0.25, solved[3], True).price == pytest.approx(120.)
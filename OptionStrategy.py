@@ -1,13 +1,19 @@
 import warnings
+import weakref
 from enum import Enum, IntEnum
 
-import pandas as pd
-from dateutil.parser import parse
-from math import ceil, floor
+import numpy as np
+from math import ceil, floor, fsum
 
-import plotly.tools as tls
-import plotly.plotly as py
-import cufflinks as cf
+from MonteCarlo import simulate_profit_loss
+from OptionPricing import DAYS_PER_YEAR, black76_price, strategy_greeks, years_to_expiry
+
+# The valuation core only needs NumPy: pandas (the DataFrame views), dateutil and the plotting backend are imported
+# where they are used.
+
+
+# ConId given by OptionStrategy.add to the options without one.
+UNRESOLVED_CON_ID = -999
 
 
 class OptionType(Enum):
@@ -25,31 +31,276 @@ class Position(IntEnum):
     Long = 1
 
 
+class LegTable(object):
+    # Parallel typed arrays holding one row per leg, in insertion order.
+    columns = (('con_id', np.int64), ('strike', np.float64), ('premium', np.float64), ('multiplier', np.float64),
+               ('quantity', np.int64), ('position', np.int8), ('right', np.int8))
+
+    def __init__(self, capacity=8):
+        self.size = 0
+        self._arrays = {column: np.empty(capacity, dtype=dtype) for column, dtype in self.columns}
+        self._underlying_asset = []
+        self._expiry = []
+        # The strike, premium and multiplier as given, so the operation views keep their types (2070, not 2070.0).
+        self._given = []
+        self._rows = {}
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, con_id):
+        return con_id in self._rows
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_arrays'][name][:self.size]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def signs(self):
+        return self.position * self.quantity
+
+    @property
+    def is_call(self):
+        return self.right == OptionType.Call.value
+
+    @property
+    def underlying_asset(self):
+        return list(self._underlying_asset)
+
+    @property
+    def expiry(self):
+        return list(self._expiry)
+
+    def row_of(self, con_id):
+        return self._rows[con_id]
+
+    def add(self, option):
+        # Nets the option against the leg with the same ConId. Returns the leg row, or None if the leg was closed.
+        row = self._rows.get(option.ConId)
+        if row is None:
+            return self._append(option)
+        quantity = self._arrays['quantity']
+        position = self._arrays['position']
+        actual_position = quantity[row] * position[row]
+        new_position = option.quantity * option.position
+        if actual_position * new_position > 0:
+            quantity[row] += option.quantity
+        else:
+            quantity[row] -= option.quantity
+
+        if quantity[row] < 0:
+            quantity[row] *= -1
+            position[row] *= -1
+        elif quantity[row] == 0:
+            self._remove(row)
+            return None
+        return row
+
+    def operation(self, row):
+        # Builds a detached OptionOperation from a table row.
+        arrays = self._arrays
+        strike_price, premium, multiplier = self._given[row]
+        return OptionOperation(Position(int(arrays['position'][row])), premium, OptionType(int(arrays['right'][row])),
+                               strike_price, arrays['con_id'][row].item(), self._underlying_asset[row], multiplier,
+                               int(arrays['quantity'][row]), self._expiry[row])
+
+    def _append(self, option):
+        if self.size == len(self._arrays['con_id']):
+            for column in self._arrays:
+                self._arrays[column] = np.resize(self._arrays[column], max(2 * self.size, 8))
+        row = self.size
+        values = (option.ConId, option.strike_price, option.premium, option.multiplier, option.quantity,
+                  option.position.value, option.option_type.value)
+        for (column, _), value in zip(self.columns, values):
+            self._arrays[column][row] = value
+        self._underlying_asset.append(option.underlying_asset)
+        self._expiry.append(option.expiry)
+        self._given.append((option.strike_price, option.premium, option.multiplier))
+        self._rows[option.ConId] = row
+        self.size += 1
+        return row
+
+    def _remove(self, row):
+        # Shifts the following rows up so the table keeps the insertion order.
+        for array in self._arrays.values():
+            array[row:self.size - 1] = array[row + 1:self.size]
+        del self._underlying_asset[row]
+        del self._expiry[row]
+        del self._given[row]
+        self.size -= 1
+        self._rows = {con_id: row for row, con_id in enumerate(self.con_id.tolist())}
+
+
+class PiecewisePayoff(object):
+    # Expiry payoff A + B * price + sum(w * max(price - strike, 0)), updated leg by leg as the legs change.
+    # It is not summed leg by leg, so it matches the sum of the legs profit/loss within TOLERANCE times their gross
+    # value sum(|signs| * (premium + multiplier * (strike + price))). The rounding of the updates adds up, so the
+    # owner rebuilds the payoff from its legs every REBUILD_AFTER updates.
+    TOLERANCE = 1e-12
+    REBUILD_AFTER = 1000
+
+    def __init__(self):
+        self.intercept = 0.
+        self.left_slope = 0.
+        self.updates = 0
+        self._kinks = {}
+        self._legs_at = {}
+        # Sorted strikes, kinks and the kinks / kinks * strikes cumulative sums (with a leading zero).
+        self._sorted = None
+        self._strike_range = None
+
+    def rebuild(self, strikes, premiums, multipliers, signs, is_call):
+        # Recomputes the payoff from the packed legs, dropping the rounding left by the updates.
+        kinks = signs * multipliers
+        self.intercept = fsum((np.where(is_call, 0., kinks * strikes) - signs * premiums).tolist())
+        self.left_slope = -fsum(kinks[~is_call].tolist())
+        self.updates = 0
+        self._kinks, self._legs_at = {}, {}
+        for strike, kink in zip(strikes.tolist(), kinks.tolist()):
+            self._kinks[strike] = self._kinks.get(strike, 0.) + kink
+            self._legs_at[strike] = self._legs_at.get(strike, 0) + 1
+        self._sorted = None
+        self._strike_range = None
+
+    def apply(self, strike, premium, multiplier, is_call, delta, opened=False, closed=False):
+        # Adds delta (a change of signed quantity) of the leg.
+        strike = float(strike)
+        self.updates += 1
+        kink = delta * multiplier
+        if is_call:
+            self.intercept -= delta * premium
+        else:
+            self.intercept += kink * strike - delta * premium
+            self.left_slope -= kink
+        if opened:
+            legs_at = self._legs_at.get(strike, 0)
+            self._legs_at[strike] = legs_at + 1
+            if legs_at == 0:
+                self._kinks[strike] = kink
+                self._sorted = None
+                if self._strike_range is not None:
+                    self._strike_range = [min(self._strike_range[0], strike), max(self._strike_range[1], strike)]
+                return
+        self._kinks[strike] += kink
+        if closed:
+            self._legs_at[strike] -= 1
+            if self._legs_at[strike] == 0:
+                del self._legs_at[strike]
+                del self._kinks[strike]
+                self._sorted = None
+                if self._strike_range is not None and strike in self._strike_range:
+                    self._strike_range = None
+                if not self._legs_at:
+                    # Drop the rounding left by the incremental updates.
+                    self.intercept = 0.
+                    self.left_slope = 0.
+                return
+        if self._sorted is not None and kink != 0:
+            strikes, kinks, cumulative_kinks, cumulative_kinks_strikes = self._sorted
+            index = np.searchsorted(strikes, strike)
+            kinks[index] += kink
+            cumulative_kinks[index + 1:] += kink
+            cumulative_kinks_strikes[index + 1:] += kink * strike
+
+    def evaluate(self, prices):
+        strikes, _, cumulative_kinks, cumulative_kinks_strikes = self._sorted_kinks()
+        index = np.searchsorted(strikes, prices)
+        return (self.intercept + (self.left_slope + cumulative_kinks[index]) * prices -
+                cumulative_kinks_strikes[index])
+
+    def breakpoints(self):
+        strikes, _, cumulative_kinks, cumulative_kinks_strikes = self._sorted_kinks()
+        slopes = self.left_slope + cumulative_kinks
+        values = self.intercept + slopes[:-1] * strikes - cumulative_kinks_strikes[:-1]
+        return strikes.copy(), values, slopes
+
+    def strike_range(self):
+        if self._strike_range is None:
+            if not self._legs_at:
+                raise ValueError('The strategy has no legs.')
+            self._strike_range = [min(self._legs_at), max(self._legs_at)]
+        return list(self._strike_range)
+
+    def _sorted_kinks(self):
+        if self._sorted is None:
+            strikes = np.array(sorted(self._kinks), dtype=float)
+            kinks = np.array([self._kinks[strike] for strike in strikes.tolist()], dtype=float)
+            self._sorted = (strikes, kinks, np.concatenate([[0.], np.cumsum(kinks)]),
+                            np.concatenate([[0.], np.cumsum(kinks * strikes)]))
+        return self._sorted
+
+
 class OptionStrategy(object):
-    def __init__(self, name='Strategy'):
+    def __init__(self, name='Strategy', compact=False):
         self.name = name
-        self.options = {}
+        self.legs = LegTable()
+        # In compact mode only the leg table is kept and OptionOperation views are built on demand.
+        self._options = None if compact else {}
+        # Aggregates kept up to date by add(): the payoff, the legs columns names and the last valuation grid.
+        self._payoff = PiecewisePayoff()
+        self._column_names = None
+        self._grid = None
+
+    @property
+    def compact(self):
+        return self._options is None
+
+    @property
+    def options(self):
+        # The legs are valued from the LegTable, which snapshots each operation when it is added: changing an operation
+        # of options afterwards does not change the valuation, a change goes through add().
+        if self._options is not None:
+            return self._options
+        return {con_id: self.legs.operation(row) for row, con_id in enumerate(self.legs.con_id.tolist())}
 
     def add(self, option):
         if option.ConId is None:
-            option.ConId = -999
+            option.ConId = UNRESOLVED_CON_ID
             warnings.warn('Option does not have an ConID!', UserWarning)
-        if option.ConId in self.options.keys():
-            option_hold = self.options[option.ConId]
-            actual_position = option_hold.quantity * option_hold.position
-            new_position = option.quantity * option.position
-            if actual_position * new_position > 0:
-                self.options[option.ConId].quantity += option.quantity
+        legs = self.legs
+        if option.ConId in legs:
+            old_row = legs.row_of(option.ConId)
+            old_sign = legs.signs[old_row]
+            leg = (legs.strike[old_row], legs.premium[old_row], legs.multiplier[old_row], legs.is_call[old_row])
+        else:
+            old_row, old_sign = None, 0
+            leg = (option.strike_price, option.premium, option.multiplier, option.option_type == OptionType.Call)
+        row = legs.add(option)
+        new_sign = 0 if row is None else legs.signs[row]
+        self._payoff.apply(*leg, delta=new_sign - old_sign, opened=old_row is None, closed=row is None)
+        if self._payoff.updates >= PiecewisePayoff.REBUILD_AFTER:
+            self._payoff.rebuild(*self._pack_options())
+
+        if self._options is not None:
+            if row is None:
+                self._options.pop(option.ConId, None)
+            elif old_row is not None:
+                option_hold = self._options[option.ConId]
+                option_hold.quantity = int(legs.quantity[row])
+                option_hold.position = Position(int(legs.position[row]))
             else:
-                self.options[option.ConId].quantity -= option.quantity
+                self._options[option.ConId] = option
 
-            if self.options[option.ConId].quantity < 0:
-                self.options[option.ConId].quantity *= -1
-                self.options[option.ConId].position = Position(option_hold.position * -1)
-            elif self.options[option.ConId].quantity == 0:
-                self.options.pop(option.ConId, None)
+        if old_row is None or row is None:
+            self._column_names = None
+            self._grid = None
         else:
-            self.options[option.ConId] = option
+            self._patch_caches(row)
+
+    def _patch_caches(self, row):
+        # Only the quantity or the position of the leg in row changed.
+        if self._column_names is not None:
+            self._column_names[row] = self._column_name(self.get_option_from_ConId(self.legs.con_id[row].item()))
+        if self._grid is not None and self._grid[0][0] is None:
+            # The adaptive grid moves with the break-even points, it is rebuilt.
+            self._grid = None
+        if self._grid is not None:
+            _, prices, legs_profit_loss, strategy_profit_loss = self._grid
+            leg_profit_loss = profit_loss_grid(prices, *[column[row:row + 1] for column in self._pack_options()])[0]
+            strategy_profit_loss += leg_profit_loss - legs_profit_loss[row]
+            legs_profit_loss[row] = leg_profit_loss
 
     def __str__(self):
         msg = ''
@@ -58,69 +309,274 @@ class OptionStrategy(object):
         return msg[:-1]
 
     def get_option_from_ConId(self, ConId):
-        return self.options[ConId]
+        if self._options is not None:
+            return self._options[ConId]
+        return self.legs.operation(self.legs.row_of(ConId))
 
     def profit_loss_at(self, price):
-        value = 0
-        for option in self.options.values():
-            value += option.profit_loss_at(price)
-        return value
+        # From the cached payoff, so a fill does not cost a pass over the legs. It is not the sum of the legs
+        # profit/loss (it may differ from it in the last bits, within PiecewisePayoff.TOLERANCE); profit_loss_over sums
+        # the legs exactly.
+        return self._payoff.evaluate(float(price)).item()
+
+    def profit_loss_over(self, prices):
+        # Returns the (legs x prices) profit/loss matrix and the strategy total for the whole price array.
+        legs_profit_loss = profit_loss_grid(prices, *self._pack_options())
+        return legs_profit_loss, legs_profit_loss.sum(axis=0)
+
+    def _pack_options(self):
+        legs = self.legs
+        return legs.strike, legs.premium, legs.multiplier, legs.signs.astype(float), legs.is_call
+
+    def greeks(self, underlying, volatility, time_to_expiry=None, rate=0., as_of=None, per_leg=()):
+        # Black-76 (legs, total) Greeks, see OptionPricing.strategy_greeks.
+        return strategy_greeks(self, underlying, volatility, time_to_expiry, rate, as_of, per_leg)
+
+    def scenario_grid(self, underlying, volatility, price_shifts=(0.,), volatility_shifts=(0.,), days_forward=(0,),
+                      time_to_expiry=None, rate=0., as_of=None, relative=True, max_cells=2 ** 22):
+        # Black-76 profit/loss over every (price shift, volatility shift, days forward) scenario, shaped
+        # (len(price_shifts), len(volatility_shifts), len(days_forward)). Price shifts are fractions of underlying
+        # (amounts when not relative) and volatility shifts are added to volatility, one value or one per leg.
+        # The scenarios are valued in chunks of consecutive scenarios (in the order of the grid) holding at most
+        # max_cells (legs x scenarios) values, or one scenario when the legs alone are more than max_cells.
+        legs = self.legs
+        legs_count = len(legs)
+        if time_to_expiry is None:
+            time_to_expiry = years_to_expiry(legs.expiry, as_of, legs.con_id.tolist())
+        axes = [np.asarray(price_shifts, dtype=float), np.asarray(volatility_shifts, dtype=float),
+                np.asarray(days_forward, dtype=float)]
+        prices = underlying * (1. + axes[0]) if relative else underlying + axes[0]
+        volatility = np.broadcast_to(np.asarray(volatility, dtype=float), (legs_count,))
+        time_to_expiry = np.broadcast_to(np.asarray(time_to_expiry, dtype=float), (legs_count,))
+        # Legs run along the rows and the scenarios of a chunk along the columns.
+        strikes, weights, is_call = [np.reshape(values, (-1, 1))
+                                     for values in (legs.strike, legs.signs * legs.multiplier, legs.is_call)]
+        premium = (legs.signs * legs.premium).sum()
+        shape = tuple(len(axis) for axis in axes)
+        grid = np.empty(shape)
+        scenarios = grid.reshape(-1)
+        step = max(1, max_cells // max(1, legs_count))
+        for start in range(0, len(scenarios), step):
+            price_index, volatility_index, days_index = np.unravel_index(
+                np.arange(start, min(start + step, len(scenarios))), shape)
+            scenario_volatility = volatility[:, np.newaxis] + axes[1][volatility_index]
+            scenario_time = np.maximum(time_to_expiry[:, np.newaxis] - axes[2][days_index] / DAYS_PER_YEAR, 0.)
+            unit = black76_price(prices[price_index], strikes, scenario_time, np.maximum(scenario_volatility, 0.),
+                                 is_call, rate)
+            scenarios[start:start + step] = (weights * unit).sum(axis=0) - premium
+        return grid
+
+    def scenario_frame(self, underlying, volatility, price_shifts=(0.,), volatility_shifts=(0.,), days_forward=(0,),
+                       **scenario_options):
+        # scenario_grid as a ProfitLoss column indexed by (Underlying, VolatilityShift, DaysForward).
+        import pandas as pd
+        grid = self.scenario_grid(underlying, volatility, price_shifts, volatility_shifts, days_forward,
+                                  **scenario_options)
+        shifts = np.asarray(price_shifts, dtype=float)
+        prices = underlying * (1. + shifts) if scenario_options.get('relative', True) else underlying + shifts
+        index = pd.MultiIndex.from_product([prices, volatility_shifts, days_forward],
+                                           names=['Underlying', 'VolatilityShift', 'DaysForward'])
+        return pd.DataFrame({'ProfitLoss': grid.ravel()}, index=index)
+
+    def profit_loss_distribution(self, underlying, volatility, time_to_expiry=None, as_of=None, **simulation):
+        # Monte Carlo profit/loss at expiry, see MonteCarlo.simulate_profit_loss for the simulation options.
+        # The time to expiry is time_to_expiry or the time from as_of to the expiry of the legs.
+        if time_to_expiry is None:
+            if as_of is None:
+                raise ValueError('The profit/loss distribution needs time_to_expiry or as_of.')
+            time_to_expiry = np.unique(years_to_expiry(self.legs.expiry, as_of, self.legs.con_id.tolist()))
+            if len(time_to_expiry) != 1:
+                raise ValueError('The legs expire on different dates, the time_to_expiry is needed.')
+            time_to_expiry = time_to_expiry.item()
+        return simulate_profit_loss(self.payoff_breakpoints(), underlying, volatility, time_to_expiry, **simulation)
+
+    def payoff_breakpoints(self):
+        # Returns the sorted strikes, the profit/loss at each strike and the slope of the len(strikes) + 1 segments.
+        return self._payoff.breakpoints()
+
+    def break_even_points(self):
+        prices, values, right_slope = self._payoff_vertices()
+        break_even = [prices[values == 0]]
+        crossing = values[:-1] * values[1:] < 0
+        lower, upper = prices[:-1][crossing], prices[1:][crossing]
+        lower_value, upper_value = values[:-1][crossing], values[1:][crossing]
+        break_even.append(lower - lower_value * (upper - lower) / (upper_value - lower_value))
+        if values[-1] * right_slope < 0:
+            break_even.append([prices[-1] - values[-1] / right_slope])
+        return np.unique(np.concatenate(break_even)).tolist()
+
+    def max_profit(self):
+        _, values, right_slope = self._payoff_vertices()
+        return float('inf') if right_slope > 0 else values.max().item()
+
+    def max_loss(self):
+        _, values, right_slope = self._payoff_vertices()
+        return float('-inf') if right_slope < 0 else values.min().item()
+
+    def _payoff_vertices(self):
+        # Strikes plus the zero price (the underlying can not be negative) with their profit/loss.
+        strikes, values, slopes = self.payoff_breakpoints()
+        if len(strikes) == 0:
+            raise ValueError('The strategy has no legs.')
+        if strikes[0] > 0:
+            zero_value = values[0] - slopes[0] * strikes[0]
+            strikes = np.concatenate([[0.], strikes])
+            values = np.concatenate([[zero_value], values])
+        return strikes, values, slopes[-1]
 
     def _get_strike_range(self):
-        strikes = [option.strike_price for option in self.options.values()]
-        return [min(strikes), max(strikes)]
-
-    def plot(self, plotly_folder=None):
-        df = self._generate_strategy_dataframe()
-        if plotly_folder is None:
-            options_plot_name = '{}_options'.format(self.name)
-            strategy_plot_name = '{}_strategy'.format(self.name)
-        else:
-            options_plot_name = '{}/{}_options'.format(plotly_folder, self.name)
-            strategy_plot_name = '{}/{}_strategy'.format(plotly_folder, self.name)
-        # Plot options profit/loss
-        _ = df.ix[:, :len(self.options)].iplot(kind='scatter', width=2, colorscale="dflt", theme='ggplot',
-                                               filename=options_plot_name, asUrl=True, world_readable=True)
-        # Plot strategy profit/loss
-        _ = df.ix[:, self.name].iplot(kind='scatter', width=2, colorscale="dflt", theme='ggplot',
-                                      filename=strategy_plot_name, asUrl=True, world_readable=True)
-
-    def _generate_strategy_dataframe(self, index_step=5):
-        strategy_profit_loss = {}
-        price_range = self._generate_price_range(index_step)
-        for price in price_range:
-            profit_loss = []
-            for option in self.options.values():
-                profit_loss.append(option.profit_loss_at(price))
-            profit_loss.append(self.profit_loss_at(price))
-            strategy_profit_loss[price] = profit_loss
-        df = pd.DataFrame(strategy_profit_loss).transpose()
-        col_names = self._generate_columns_names()
-        df.columns = col_names
-        return df
+        return self._payoff.strike_range()
+
+    def plot(self, path=None, legs=True, **plot_options):
+        # Writes the profit/loss chart to a local .html, .svg or .png file (<name>.html by default), see StrategyPlot.
+        from StrategyPlot import plot_strategy
+        return plot_strategy(self, '{}.html'.format(self.name) if path is None else path, legs=legs, **plot_options)
+
+    def _generate_strategy_dataframe(self, index_step=None, underlying=None, points=200):
+        # The legs and strategy profit/loss over _generate_price_range, adaptive unless index_step is given.
+        import pandas as pd
+        key = (index_step, underlying, points)
+        if self._grid is None or self._grid[0] != key:
+            price_range = np.asarray(self._generate_price_range(index_step, underlying, points), dtype=float)
+            self._grid = (key, price_range) + self.profit_loss_over(price_range)
+        _, price_range, legs_profit_loss, strategy_profit_loss = self._grid
+        data = np.vstack([legs_profit_loss, strategy_profit_loss]).T
+        return pd.DataFrame(data, index=price_range, columns=self._generate_columns_names())
 
     def _generate_columns_names(self):
-        col_names = []
-        for option in self.options.values():
-            name = '{}_{}_{}{}'.format(option.quantity, option.position.name,
-                                       option.strike_price, option.option_type.name)
-            col_names.append(name)
-        col_names.append(self.name)
-        return col_names
-
-    def _generate_price_range(self, index_step):
+        if self._column_names is None:
+            self._column_names = [self._column_name(option) for option in self.options.values()]
+        return self._column_names + [self.name]
+
+    @staticmethod
+    def _column_name(option):
+        return '{}_{}_{}{}'.format(option.quantity, option.position.name, option.strike_price,
+                                   option.option_type.name)
+
+    def _generate_price_range(self, index_step=None, underlying=None, points=200):
+        # With index_step, a fixed step grid 20% wider than the strikes with bounds rounded to tens; otherwise
+        # adaptive_price_grid around the strikes, the break-even points and the underlying price.
+        if not len(self.legs):
+            raise ValueError('The strategy has no legs.')
+        if index_step is None:
+            return adaptive_price_grid(self.payoff_breakpoints()[0], self.break_even_points(), underlying, points)
         [lower_strike, upper_strike] = self._get_strike_range()
-        if lower_strike < upper_strike:
-            strike_range = upper_strike - lower_strike
-            lower_price = floor(int(lower_strike - 0.2 * strike_range) / 10) * 10
-            upper_price = ceil(int(upper_strike + 0.2 * strike_range) / 10) * 10
-            price_range = range(lower_price, upper_price + index_step, index_step)
-        else:
-            raise NotImplementedError()
-        return price_range
+        strike_range = upper_strike - lower_strike
+        if strike_range == 0:
+            strike_range = _single_strike_width(lower_strike)
+        lower_price = max(floor((lower_strike - 0.2 * strike_range) / 10) * 10, 0)
+        upper_price = ceil((upper_strike + 0.2 * strike_range) / 10) * 10
+        return np.arange(lower_price, upper_price + index_step / 2., index_step)
+
+
+def adaptive_price_grid(kinks, anchors=(), underlying=None, points=200, padding=0.2):
+    # Expiry payoffs are linear between strikes, so the grid holds every kink (exact at all of them), the anchors
+    # (break-even points) and the underlying price, and it ends padding times the span of those prices beyond them.
+    # The rest of the point budget is spread half evenly and half around the underlying price (or the middle of the
+    # kinks) and the anchors, denser near them: the underlying gets half of those points and the anchors share the
+    # other half. The budget is exceeded only when the kinks and anchors need more points.
+    kinks = np.asarray(kinks, dtype=float)
+    anchors = np.asarray(anchors, dtype=float)
+    exact = np.concatenate([kinks, anchors] +
+                           ([np.array([underlying], dtype=float)] if underlying is not None else []))
+    if len(exact) == 0:
+        raise ValueError('The strategy has no legs.')
+    lower, upper = exact.min(), exact.max()
+    span = upper - lower if upper > lower else _single_strike_width(lower)
+    lower, upper = max(lower - padding * span, 0.), upper + padding * span
+    free = max(points - len(np.unique(exact)) - 2, 0)
+    center = underlying if underlying is not None else 0.5 * (kinks.min() + kinks.max()) if len(kinks) else lower
+    even = np.linspace(lower, upper, free - free // 2 + 2)[1:-1]
+    per_anchor = free // 4 // len(anchors) if len(anchors) else 0
+    centers = [(center, free // 2 - per_anchor * len(anchors))] + [(anchor, per_anchor) for anchor in anchors]
+    # Cubing an even grid of [-1, 1] packs the points around 0.
+    dense = [point + np.linspace(-1., 1., count + 2)[1:-1] ** 3 * max(point - lower, upper - point)
+             for point, count in centers]
+    grid = np.concatenate([[lower, upper], exact, even] + dense)
+    return np.unique(grid[(grid >= lower) & (grid <= upper)])
+
+
+def _single_strike_width(strike):
+    # The span given to a single strike: padded by 0.2 of it, the grids reach 10% of the strike on each side.
+    return 0.5 * abs(strike) if strike else 1.
+
+
+def profit_loss_grid(prices, strikes, premiums, multipliers, signs, is_call):
+    # Expiry profit/loss of every packed leg (rows) at every price (columns) in a single broadcast.
+    prices = np.asarray(prices, dtype=float)[np.newaxis, :]
+    strikes = strikes[:, np.newaxis]
+    intrinsic = np.where(is_call[:, np.newaxis], prices - strikes, strikes - prices)
+    value = np.maximum(intrinsic, 0) * multipliers[:, np.newaxis] - premiums[:, np.newaxis]
+    return value * signs[:, np.newaxis]
+
+
+_RIGHTS = {OptionType.Call: 'C', OptionType.Put: 'P'}
+
+
+class ContractIndex(object):
+    # Hash lookups over a contracts DataFrame (indexed by ConId). The index of a DataFrame is cached with the pandas
+    # index it was built from: adding or dropping rows replaces that index, so one identity check per call tells a
+    # stale index. After editing the values of existing rows in place, pass ContractIndex(df) instead.
+    # Building it is one pass over the contracts; the table of each shape of description (which of the underlying,
+    # expiry, right and strike are given) is built by the first lookup of that shape, and the result of every
+    # description looked up is kept.
+    _indexes = {}
+
+    def __init__(self, contracts: 'pandas.DataFrame'):
+        self.contracts = {}
+        self._descriptions = []
+        self._tables = {}
+        self._results = {}
+        columns = [contracts[column].tolist() for column in ('Right', 'Strike', 'Symbol', 'Expiry', 'Multiplier')]
+        for con_id, right, strike_price, symbol, expiry, multiplier in zip(contracts.index.tolist(), *columns):
+            right = right if right in ('C', 'P') else None
+            expiry = str(expiry)
+            self.contracts[con_id] = (right, strike_price, symbol, expiry, multiplier)
+            self._descriptions.append((con_id, (symbol, expiry, right or '', float(strike_price))))
+
+    @classmethod
+    def of(cls, contracts):
+        if isinstance(contracts, cls):
+            return contracts
+        key = id(contracts)
+        cached = cls._indexes.get(key)
+        if cached is None or cached[1] is not contracts.index:
+            if cached is None:
+                weakref.finalize(contracts, cls._indexes.pop, key, None)
+            cached = cls._indexes[key] = (cls(contracts), contracts.index)
+        return cached[0]
+
+    def __getitem__(self, con_id):
+        return self.contracts[con_id]
+
+    def __contains__(self, con_id):
+        return con_id in self.contracts
+
+    def __len__(self):
+        return len(self.contracts)
+
+    def lookup(self, underlying_asset=None, expiry=None, right=None, strike_price=None):
+        key = (underlying_asset, None if expiry is None else str(expiry), right,
+               None if strike_price is None else float(strike_price))
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = self._match(key)
+        return result
+
+    def _match(self, key):
+        shape = tuple(value is not None for value in key)
+        table = self._tables.get(shape)
+        if table is None:
+            table = self._tables[shape] = {}
+            for con_id, description in self._descriptions:
+                table.setdefault(tuple(value for value, given in zip(description, shape) if given), []).append(con_id)
+        return table.get(tuple(value for value in key if value is not None), [])
 
 
 class OptionOperation(object):
+    __slots__ = ('option_type', 'strike_price', 'ConId', 'underlying_asset', 'multiplier', 'expiry', 'position',
+                 'premium', 'quantity')
+
     # region Constructors
     def __init__(self, position, premium, option_type, strike_price, con_id=None, underlying_asset=None, multiplier=1,
                  quantity=1, expiry=None):
@@ -137,42 +593,23 @@ class OptionOperation(object):
         self.quantity = quantity
 
     @classmethod
-    def from_contract_description(cls, contracts: pd.DataFrame, position, premium, option_type=None,
+    def from_contract_description(cls, contracts: 'pandas.DataFrame', position, premium, option_type=None,
                                   strike_price=None, underlying_asset=None, expiry=None, quantity=1):
-        queries = []
-
-        if option_type is not None:
-            if option_type == OptionType.Call:
-                queries.append("Right=='C'")
-            elif option_type == OptionType.Put:
-                queries.append("Right=='P'")
-
-        if strike_price is not None:
-            queries.append("Strike==" + str(strike_price))
-
-        if underlying_asset is not None:
-            queries.append("Symbol=='{}'".format(underlying_asset))
-
-        if expiry is not None:
-            queries.append("Symbol=='{}'".format(expiry))
-
-        query = None
-        for q in queries:
-            if query is None:
-                query = q
-            else:
-                query = query + " and " + q
-
-        selected_contract = contracts.query(query)
-        if selected_contract.shape[0] > 1:
+        index = ContractIndex.of(contracts)
+        right = _RIGHTS.get(option_type)
+        selected_contracts = index.lookup(underlying_asset=underlying_asset, expiry=expiry, right=right,
+                                          strike_price=strike_price)
+        if len(selected_contracts) > 1:
             raise ValueError()
+        elif len(selected_contracts) == 0:
+            raise KeyError('No contract matches the given description.')
         else:
-            return cls.from_ConId(contracts, selected_contract.index[0], position, premium, quantity)
+            return cls.from_ConId(index, selected_contracts[0], position, premium, quantity)
 
     @classmethod
-    def from_ConId(cls, contracts: pd.DataFrame, ConID, position, premium, quantity=1):
+    def from_ConId(cls, contracts: 'pandas.DataFrame', ConID, position, premium, quantity=1):
         try:
-            right = contracts.ix[ConID, 'Right']
+            right, strike_price, underlying_asset, expiry, multiplier = ContractIndex.of(contracts)[ConID]
         except KeyError:
             raise KeyError('The ConId does not exist in the contract JSON file.')
 
@@ -184,17 +621,24 @@ class OptionOperation(object):
             raise ValueError('The ConId is not an option.')
 
         con_id = ConID
-        strike_price = contracts.ix[ConID, 'Strike']
-        underlying_asset = contracts.ix[ConID, 'Symbol']
-        expiry = str(contracts.ix[ConID, 'Expiry'])
-        multiplier = contracts.ix[ConID, 'Multiplier']
         premium = premium * quantity * multiplier
         return cls(position, premium, option_type, strike_price, con_id, underlying_asset, multiplier, quantity,
                    expiry)
 
+    @classmethod
+    def from_ConIds(cls, contracts: 'pandas.DataFrame', ConIDs, positions, premiums, quantities=1):
+        # Bulk version of from_ConId, positions, premiums and quantities can be scalars or one value per ConId.
+        index = ContractIndex.of(contracts)
+        ConIDs = list(ConIDs)
+        positions, premiums, quantities = [value if isinstance(value, (list, tuple, np.ndarray))
+                                           else [value] * len(ConIDs) for value in (positions, premiums, quantities)]
+        return [cls.from_ConId(index, ConID, position, premium, quantity)
+                for ConID, position, premium, quantity in zip(ConIDs, positions, premiums, quantities)]
+
     # endregion
 
     def __str__(self):
+        from dateutil.parser import parse
         expiry = parse(self.expiry).strftime('%B-%y')
         return ("{} {} {} {} {} {} at {}"
                 .format(self.quantity, self.position.name, self.underlying_asset, expiry,
@@ -213,6 +657,12 @@ class OptionOperation(object):
                 value = (self.strike_price - price) * self.multiplier - self.premium
         return value * self.position.value * self.quantity
 
+    def profit_loss_over(self, prices):
+        is_call = np.array([self.option_type == OptionType.Call])
+        return profit_loss_grid(prices, np.array([self.strike_price], dtype=float),
+                                np.array([self.premium], dtype=float), np.array([self.multiplier], dtype=float),
+                                np.array([self.position.value * self.quantity], dtype=float), is_call)[0]
+
     def status_at(self, price):
         if ((self.option_type == OptionType.Call and price >= self.strike_price) or
                 (self.option_type == OptionType.Put and price <= self.strike_price)):
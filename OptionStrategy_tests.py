@@ -1,11 +1,15 @@
+import os
+import subprocess
+import sys
+
 import pytest
-import requests
 
+from ContractLoader import load_contracts
 from OptionStrategy import *
 
 
-path_to_contracts_json = '/mnt/HDD200GB/Algorithmic Trading/OptionStrategy/testing_files/Contracts.json'
-df_contracts = pd.read_json(path_to_contracts_json).dropna(axis=1, how='all').set_index('ConId')
+path_to_contracts_json = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_files', 'Contracts.json')
+df_contracts = load_contracts(path_to_contracts_json, use_cache=False)
 
 option_valuation_test_cases = (("comment", "position", "option_type", "expected_values_formula"),
                                [
@@ -110,6 +114,44 @@ def test_when_option_is_correctly_instantiated_with_out_ConId_then_its_data_is_c
     assert option.multiplier == 50
 
 
+def test_when_option_is_described_by_expiry_then_the_expiry_is_used_to_filter():
+    option = OptionOperation.from_contract_description(df_contracts, position=Position.Long, premium=10,
+                                                       option_type=OptionType.Call, strike_price=2070,
+                                                       underlying_asset='ES', expiry='20160617')
+    assert option.ConId == 198003244
+    with pytest.raises(KeyError):
+        OptionOperation.from_contract_description(df_contracts, position=Position.Long, premium=10,
+                                                  option_type=OptionType.Call, strike_price=2070,
+                                                  expiry='20160916')
+
+
+def test_many_options_are_built_from_ConIds_in_one_call():
+    con_ids = [198003954, 198003965, 215521192, 198003244]
+    positions = [Position.Long, Position.Short, Position.Short, Position.Long]
+    options = OptionOperation.from_ConIds(df_contracts, con_ids, positions, premiums=1)
+    assert [option.ConId for option in options] == con_ids
+    assert [option.position for option in options] == positions
+    assert [option.strike_price for option in options] == [2010, 2030, 2055, 2070]
+    assert all(option.premium == 50 for option in options)
+
+
+def test_contract_index_is_built_once_per_contracts_dataframe():
+    index = ContractIndex.of(df_contracts)
+    assert ContractIndex.of(df_contracts) is index
+    assert ContractIndex.of(index) is index
+    assert len(index.lookup(right='P')) == 9
+    assert index.lookup(underlying_asset='ES', expiry=20160617, right='C', strike_price=2070.0) == [198003244]
+
+
+def test_contract_index_is_rebuilt_when_rows_are_added():
+    contracts = df_contracts.copy()
+    ContractIndex.of(contracts)
+    contracts.loc[999] = contracts.loc[198003244]
+    contracts.loc[999, 'Strike'] = 2075
+    assert OptionOperation.from_ConId(contracts, 999, Position.Long, 1.).strike_price == 2075
+    assert ContractIndex.of(contracts).lookup(right='C', strike_price=2075) == [999]
+
+
 def test_OptionOperation_string_representation():
     # Arrange
     option = OptionOperation.from_ConId(contracts=df_contracts, ConID=198003244,
@@ -147,6 +189,299 @@ def test_when_many_OptionOperation_is_added_to_OptionStrategy_then_strategy_is_c
     assert expected_strategy_valuation == actual_strategy_valuation
 
 
+def test_vectorized_strategy_valuation_matches_the_scalar_valuation():
+    # Arrange
+    option_1 = OptionOperation(position=Position.Long, premium=50.5, option_type=OptionType.Put, strike_price=35,
+                               multiplier=100, con_id=1)
+    option_2 = OptionOperation(position=Position.Short, premium=100.25, option_type=OptionType.Put, strike_price=40,
+                               multiplier=100, con_id=2, quantity=2)
+    option_3 = OptionOperation(position=Position.Short, premium=100.1, option_type=OptionType.Call, strike_price=50,
+                               multiplier=100, con_id=3, quantity=2)
+    option_4 = OptionOperation(position=Position.Long, premium=50.3, option_type=OptionType.Call, strike_price=55,
+                               multiplier=100, con_id=4)
+    strategy = OptionStrategy()
+    for option in [option_1, option_2, option_3, option_4]:
+        strategy.add(option)
+    prices = np.arange(30, 65, 0.25)
+    # Act
+    legs_profit_loss, strategy_profit_loss = strategy.profit_loss_over(prices)
+    # Assert
+    for leg, option in enumerate(strategy.options.values()):
+        assert legs_profit_loss[leg].tolist() == [option.profit_loss_at(price) for price in prices]
+        assert option.profit_loss_over(prices).tolist() == legs_profit_loss[leg].tolist()
+    # profit_loss_at reads the cached payoff, which matches the sum of the legs within its tolerance only.
+    legs = strategy.legs
+    gross = (np.abs(legs.signs) * (legs.premium + legs.multiplier * (legs.strike + prices[:, np.newaxis]))).sum(axis=1)
+    actual = [strategy.profit_loss_at(price) for price in prices]
+    assert np.all(np.abs(strategy_profit_loss - actual) <= PiecewisePayoff.TOLERANCE * gross)
+
+
+def test_cached_payoff_stays_within_its_tolerance_through_add_churn():
+    # Arrange
+    rng = np.random.RandomState(7)
+    strikes = 2000. + 0.25 * rng.randint(0, 800, 30)
+    strategy = OptionStrategy()
+    prices = np.linspace(1900., 2300., 37)
+    # Act & Assert
+    for number in range(3 * PiecewisePayoff.REBUILD_AFTER):
+        con_id = int(rng.randint(0, 30))
+        strategy.add(OptionOperation(position=Position(int(rng.choice([-1, 1]))), premium=float(rng.uniform(1, 5000)),
+                                     option_type=OptionType(con_id % 2), strike_price=strikes[con_id], con_id=con_id,
+                                     multiplier=50, quantity=int(rng.randint(1, 4))))
+        if number % 100 == 0 and len(strategy.legs):
+            legs = strategy.legs
+            gross = (np.abs(legs.signs) * (legs.premium + legs.multiplier * (legs.strike + prices[:, np.newaxis]))
+                     ).sum(axis=1)
+            expected = [sum(option.profit_loss_at(price) for option in strategy.options.values()) for price in prices]
+            actual = [strategy.profit_loss_at(price) for price in prices]
+            assert np.all(np.abs(np.subtract(actual, expected)) <= PiecewisePayoff.TOLERANCE * gross)
+    assert strategy._payoff.updates < PiecewisePayoff.REBUILD_AFTER
+
+
+def test_compact_strategy_keeps_the_leg_table_in_sync_with_add():
+    # Arrange
+    options = [(Position.Long, OptionType.Put, 35, 1, 2), (Position.Short, OptionType.Put, 40, 2, 2),
+               (Position.Short, OptionType.Call, 50, 3, 2), (Position.Long, OptionType.Call, 55, 4, 2),
+               (Position.Long, OptionType.Put, 40, 2, 2), (Position.Long, OptionType.Call, 50, 3, 6)]
+    strategy = OptionStrategy()
+    compact_strategy = OptionStrategy(compact=True)
+    # Act
+    for position, option_type, strike_price, con_id, quantity in options:
+        for target in (strategy, compact_strategy):
+            target.add(OptionOperation(position=position, premium=50, option_type=option_type,
+                                       strike_price=strike_price, multiplier=100, con_id=con_id, quantity=quantity,
+                                       expiry='20160916'))
+    # Assert
+    assert compact_strategy.compact
+    assert compact_strategy.legs.con_id.tolist() == list(strategy.options.keys())
+    assert compact_strategy.get_option_from_ConId(3).quantity == 4
+    assert compact_strategy.get_option_from_ConId(3).position == Position.Long
+    with pytest.raises(KeyError):
+        compact_strategy.get_option_from_ConId(2)
+    for price in range(30, 65, 5):
+        assert compact_strategy.profit_loss_at(price) == strategy.profit_loss_at(price)
+    for con_id in (1, 3, 4):
+        assert str(compact_strategy.get_option_from_ConId(con_id)) == str(strategy.get_option_from_ConId(con_id))
+
+
+def test_legs_are_snapshotted_when_they_are_added():
+    strategy = OptionStrategy()
+    option = OptionOperation(position=Position.Long, premium=50, option_type=OptionType.Put, strike_price=35,
+                             multiplier=100, con_id=1)
+    strategy.add(option)
+    profit_loss = strategy.profit_loss_at(30)
+    option.strike_price = 40
+    assert strategy.profit_loss_at(30) == profit_loss
+
+
+def test_OptionOperation_does_not_carry_an_instance_dict():
+    option = OptionOperation(position=Position.Long, premium=50, option_type=OptionType.Put, strike_price=35)
+    with pytest.raises(AttributeError):
+        option.__dict__
+
+
+strategy_extremes_test_cases = (("comment", "legs", "break_even_points", "max_profit", "max_loss"),
+                                [
+                                    ('Iron condor', [(1, 1, 35, 50), (-1, 1, 40, 100), (-1, 0, 50, 100),
+                                                     (1, 0, 55, 50)], [39, 51], 100, -400),
+                                    ('Long a Call @150', [(1, 0, 150, 1000)], [160], float('inf'), -1000),
+                                    ('Short a Call @150', [(-1, 0, 150, 1000)], [160], 1000, float('-inf')),
+                                    ('Long a Put @150', [(1, 1, 150, 1000)], [140], 14000, -1000),
+                                    ('Long straddle @150', [(1, 0, 150, 1000), (1, 1, 150, 1000)], [130, 170],
+                                     float('inf'), -2000),
+                                    ('Bull call spread', [(1, 0, 140, 700), (-1, 0, 150, 200)], [145], 500, -500),
+                                ])
+
+
+@pytest.mark.parametrize(*strategy_extremes_test_cases)
+def test_break_even_points_and_extremes_are_solved_from_the_strikes(comment, legs, break_even_points, max_profit,
+                                                                     max_loss):
+    # Arrange
+    strategy = OptionStrategy()
+    for con_id, (position, option_type, strike_price, premium) in enumerate(legs):
+        strategy.add(OptionOperation(position=Position(position), premium=premium,
+                                     option_type=OptionType(option_type), strike_price=strike_price,
+                                     multiplier=100, con_id=con_id))
+    # Act
+    strikes, values, slopes = strategy.payoff_breakpoints()
+    # Assert
+    assert values.tolist() == [strategy.profit_loss_at(strike) for strike in strikes]
+    assert strategy.break_even_points() == break_even_points
+    assert strategy.max_profit() == max_profit
+    assert strategy.max_loss() == max_loss
+    assert len(slopes) == len(strikes) + 1
+
+
+@pytest.mark.parametrize('method', ['break_even_points', 'max_profit', 'max_loss'])
+def test_payoff_extremes_of_a_strategy_without_legs_raise_ValueError(method):
+    strategy = OptionStrategy()
+    with pytest.raises(ValueError):
+        getattr(strategy, method)()
+    # The same once its only leg is closed.
+    for position in (Position.Long, Position.Short):
+        strategy.add(OptionOperation(position=position, premium=50, option_type=OptionType.Put, strike_price=35,
+                                     con_id=1))
+    with pytest.raises(ValueError):
+        getattr(strategy, method)()
+
+
+@pytest.mark.parametrize('index_step', [None, 5])
+def test_cached_valuation_is_patched_when_legs_are_adjusted(index_step):
+    # Arrange
+    # The adaptive condor adjustments of the __main__ demo.
+    first_operations = [(1, 1, 2120, 1, 1), (-1, 1, 2140, 1, 2), (-1, 0, 2140, 1, 3), (1, 0, 2160, 1, 4)]
+    adjustments = [(1, 0, 2140, 1, 3), (-1, 0, 2160, 3, 4), (1, 0, 2180, 2, 5), (1, 1, 2120, 3, 1)]
+    strategy = OptionStrategy('AdaptativeCondor')
+    for position, option_type, strike_price, quantity, con_id in first_operations:
+        strategy.add(OptionOperation(position=Position(position), premium=7.3, option_type=OptionType(option_type),
+                                     strike_price=strike_price, quantity=quantity, con_id=con_id, multiplier=50))
+    strategy._generate_strategy_dataframe(index_step)
+    # Act
+    for position, option_type, strike_price, quantity, con_id in adjustments:
+        strategy.add(OptionOperation(position=Position(position), premium=7.3, option_type=OptionType(option_type),
+                                     strike_price=strike_price, quantity=quantity, con_id=con_id, multiplier=50))
+        cached_df = strategy._generate_strategy_dataframe(index_step)
+        # Assert
+        rebuilt = OptionStrategy('AdaptativeCondor')
+        for option in strategy.options.values():
+            rebuilt.add(OptionOperation(position=option.position, premium=option.premium,
+                                        option_type=option.option_type, strike_price=option.strike_price,
+                                        quantity=option.quantity, con_id=option.ConId, multiplier=50))
+        rebuilt_df = rebuilt._generate_strategy_dataframe(index_step)
+        assert cached_df.columns.tolist() == rebuilt_df.columns.tolist()
+        assert cached_df.index.tolist() == rebuilt_df.index.tolist()
+        assert np.allclose(cached_df.values, rebuilt_df.values)
+        assert strategy._get_strike_range() == rebuilt._get_strike_range()
+        for cached, expected in zip(strategy.payoff_breakpoints(), rebuilt.payoff_breakpoints()):
+            assert np.allclose(cached, expected)
+
+
+adaptive_grid_cases = (("comment", "legs", "underlying"),
+                       [
+                           ('Fractional strikes', [(1, 1, 2087.25), (-1, 1, 2099.75), (-1, 0, 2120.5), (1, 0, 2131.)],
+                            2105.25),
+                           ('Single strike', [(1, 0, 2000.)], None),
+                           ('Underlying far from the strikes', [(-1, 1, 1800.), (-1, 0, 1900.)], 2400.),
+                       ])
+
+
+@pytest.mark.parametrize(*adaptive_grid_cases)
+def test_adaptive_price_grid_is_exact_at_kinks_and_break_even_points(comment, legs, underlying):
+    # Arrange
+    strategy = OptionStrategy()
+    for con_id, (position, option_type, strike_price) in enumerate(legs):
+        strategy.add(OptionOperation(position=Position(position), premium=250., option_type=OptionType(option_type),
+                                     strike_price=strike_price, con_id=con_id, multiplier=50))
+    # Act
+    grid = strategy._generate_price_range(underlying=underlying, points=60)
+    fixed = strategy._generate_price_range(5)
+    # Assert
+    assert len(grid) <= 60
+    assert np.all(np.diff(grid) > 0)
+    exact = [strike for _, _, strike in legs] + strategy.break_even_points() + ([underlying] if underlying else [])
+    assert set(exact) <= set(grid.tolist())
+    assert grid[0] < min(exact) and grid[-1] > max(exact)
+    # Linear interpolation between the grid points gives back the payoff everywhere.
+    fine = np.linspace(grid[0], grid[-1], 5001)
+    assert np.allclose(np.interp(fine, grid, strategy.profit_loss_over(grid)[1]), strategy.profit_loss_over(fine)[1])
+    assert fixed[0] <= min(strike for _, _, strike in legs) and fixed[-1] >= max(strike for _, _, strike in legs)
+    if underlying is not None:
+        # Denser around the underlying than at the edges of the grid.
+        spacing = np.diff(grid)
+        near = np.abs(grid[:-1] - underlying) < 0.1 * (grid[-1] - grid[0])
+        assert spacing[near].mean() < spacing[~near].mean()
+
+
+def test_adaptive_price_grid_is_denser_around_the_break_even_points():
+    grid = adaptive_price_grid([2000., 2100.], [2030.], 2080., points=80)
+    assert len(grid) <= 80
+
+    def near(prices, price):
+        return np.sum(np.abs(prices - price) < 5.)
+
+    assert near(grid, 2030.) > near(grid, 2050.)
+    assert near(grid, 2030.) > near(adaptive_price_grid([2000., 2030., 2100.], [], 2080., points=80), 2030.)
+
+
+def test_strategy_dataframe_uses_the_adaptive_grid_by_default():
+    strategy = OptionStrategy()
+    strategy.add(OptionOperation(position=Position.Long, premium=250., option_type=OptionType.Call,
+                                 strike_price=2087.25, con_id=1, multiplier=50))
+    df = strategy._generate_strategy_dataframe(points=50)
+    assert 2087.25 in df.index
+    assert len(df) <= 50
+    assert len(strategy._generate_strategy_dataframe(index_step=5)) != len(df)
+
+
+def test_scenario_grid_broadcasts_price_volatility_and_time(condor):
+    # Arrange
+    strategy = condor()
+    price_shifts, volatility_shifts, days_forward = np.linspace(-0.1, 0.1, 21), [-0.05, 0., 0.05], [0, 30, 60, 120]
+    # Act
+    grid = strategy.scenario_grid(2100., 0.15, price_shifts, volatility_shifts, days_forward, as_of='2016-06-16',
+                                  rate=0.01)
+    chunked = strategy.scenario_grid(2100., 0.15, price_shifts, volatility_shifts, days_forward, as_of='2016-06-16',
+                                     rate=0.01, max_cells=50)
+    # Assert
+    assert grid.shape == (21, 3, 4)
+    assert np.array_equal(grid, chunked)
+    for (price, volatility, days), value in np.ndenumerate(grid):
+        _, total = strategy.greeks(2100. * (1 + price_shifts[price]), 0.15 + volatility_shifts[volatility],
+                                   (92 - days_forward[days]) / 365., rate=0.01)
+        assert value == pytest.approx(total.price)
+    # After the expiry the legs are worth their payoff.
+    assert np.allclose(grid[:, 1, 3], strategy.profit_loss_over(2100. * (1 + price_shifts))[1])
+
+
+@pytest.mark.parametrize('max_cells', [4, 50, 97, 1000])
+def test_scenario_grid_chunks_hold_at_most_max_cells(condor, monkeypatch, max_cells):
+    # A slice of the largest axis (4 legs x 3 volatility shifts x 4 days forward) is already 48 cells.
+    import OptionStrategy as option_strategy
+    price = option_strategy.black76_price
+    chunks = []
+
+    def black76_price(*arguments):
+        chunks.append(np.broadcast(*arguments).size)
+        return price(*arguments)
+
+    monkeypatch.setattr(option_strategy, 'black76_price', black76_price)
+    strategy = condor()
+    grid = strategy.scenario_grid(2100., 0.15, np.linspace(-0.1, 0.1, 21), [-0.05, 0., 0.05], [0, 30, 60, 120],
+                                  time_to_expiry=0.25, max_cells=max_cells)
+    assert max(chunks) <= max_cells
+    assert sum(chunks) == 4 * grid.size
+
+
+def test_scenario_grid_needs_the_time_to_expiry_or_as_of(condor):
+    with pytest.raises(ValueError):
+        condor().scenario_grid(2100., 0.15, [-0.1, 0., 0.1])
+
+
+def test_scenario_frame_is_indexed_by_every_axis(condor):
+    frame = condor().scenario_frame(2100., 0.15, [-10., 0., 10.], [0., 0.1], [0, 7], time_to_expiry=0.25,
+                                    relative=False)
+    assert frame.index.names == ['Underlying', 'VolatilityShift', 'DaysForward']
+    assert len(frame) == 12
+    assert frame.index[-1] == (2110., 0.1, 7)
+    assert frame.loc[(2090., 0., 0), 'ProfitLoss'] == pytest.approx(
+        condor().greeks(2090., 0.15, 0.25)[1].price)
+
+
+def test_valuation_core_does_not_import_pandas_or_dateutil():
+    # Arrange
+    statement = ('import sys\n'
+                 'from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position\n'
+                 'strategy = OptionStrategy()\n'
+                 'strategy.add(OptionOperation(Position.Long, 2., OptionType.Call, 2000., con_id=1, multiplier=50))\n'
+                 'strategy.profit_loss_at(2100.)\n'
+                 'print(" ".join(sorted({"pandas", "dateutil", "plotly", "cufflinks"} & set(sys.modules))))')
+    # Act
+    output = subprocess.run([sys.executable, '-c', statement], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    # Assert
+    assert output.split() == []
+
+
 def test_when_an_OptionOperation_with_out_ConId_is_added_then_throw_warning():
     option_1 = OptionOperation(position=Position.Long, premium=50, option_type=OptionType.Put, strike_price=35,
                                multiplier=100)
@@ -264,18 +599,24 @@ def test_generate_strategy_strike_price_range_when_there_is_one_option():
     assert strategy_strike_range == expected_range
 
 
-@pytest.mark.skip('Wait until I have some response about the Plotly folders.')
-def test_send_strategy_to_plotly():
+def test_price_range_of_one_strike_spans_10_percent_around_it():
+    strategy = OptionStrategy()
+    strategy.add(OptionOperation(position=Position.Long, premium=100., option_type=OptionType.Call,
+                                 strike_price=2000., con_id=1))
+    prices = strategy._generate_price_range(5)
+    assert (prices[0], prices[-1]) == (1800., 2200.)
+    grid = adaptive_price_grid([2000.])
+    assert (grid[0], grid[-1]) == (1800., 2200.)
+
+
+@pytest.mark.parametrize('index_step', [None, 5])
+def test_strategy_without_legs_has_no_price_range(index_step):
+    with pytest.raises(ValueError):
+        OptionStrategy()._generate_strategy_dataframe(index_step)
+
+
+def test_strategy_is_plotted_to_local_files(tmp_path):
     # Arrange
-    user = 'jjdambrosio'
-    plotly_folder = 'OptionStrategy'
-    options_plot_name = 'IronCondor_options'
-    strategy_plot_name = 'IronCondor_strategy'
-    # https://api.plot.ly/v2/files#lookup
-    options_plot_url = 'https://api.plot.ly/v2/files/lookup?user={}&path=/{}/{}'.format(user, plotly_folder,
-                                                                                        options_plot_name)
-    strategy_plot_url = 'https://api.plot.ly/v2/files/lookup?user={}&path=/{}/{}'.format(user, plotly_folder,
-                                                                                         strategy_plot_name)
     strategy = OptionStrategy('IronCondor')
     option_operations = {198003954: 1, 198003965: -1, 215521192: -1, 198003244: 1}
     for con_id in option_operations:
@@ -283,8 +624,16 @@ def test_send_strategy_to_plotly():
                                             position=Position(option_operations[con_id]), premium=1)
         strategy.add(option)
     # Act
-    strategy.plot(plotly_folder='OptionStrategy')
-    r = requests.get(options_plot_url)
-    assert r.ok == True
-    r = requests.get(strategy_plot_url)
-    assert r.ok == True
+    html_path = strategy.plot(str(tmp_path / 'IronCondor.html'))
+    svg_path = strategy.plot(str(tmp_path / 'IronCondor.svg'), legs=False)
+    # Assert
+    with open(html_path) as html_file:
+        html = html_file.read()
+    assert html.startswith('<!DOCTYPE html>')
+    assert html.count('<polyline') == 5
+    for column_name in strategy._generate_columns_names():
+        assert '<title>{}</title>'.format(column_name) in html
+    with open(svg_path) as svg_file:
+        assert svg_file.read().count('<polyline') == 1
+    with pytest.raises(ValueError):
+        strategy.plot(str(tmp_path / 'IronCondor.pdf'))
@@ -0,0 +1,175 @@
+import numpy as np
+
+from OptionPricing import Greeks, black76, years_to_expiry
+from OptionStrategy import UNRESOLVED_CON_ID, OptionType
+
+
+class Portfolio(object):
+    # Nets the legs of many OptionStrategy objects by ConId into one packed table. Each row holds the net signed
+    # quantity and the net premium paid (cost) of a contract over the strategies holding it, so a contract netted to
+    # no position still carries the premium locked in between strategies. The contribution of every strategy is
+    # kept, so adding or removing one only touches its own rows. Legs added without ConId (UNRESOLVED_CON_ID) are
+    # netted by their description instead: underlying, expiry, right, strike and multiplier.
+    columns = (('con_id', np.int64), ('strike', np.float64), ('multiplier', np.float64), ('right', np.int8),
+               ('signs', np.int64), ('cost', np.float64), ('holders', np.int64))
+
+    def __init__(self, strategies=()):
+        self.size = 0
+        self._arrays = {column: np.empty(8, dtype=dtype) for column, dtype in self.columns}
+        self._underlying_asset = []
+        self._expiry = []
+        self._keys = []
+        self._rows = {}
+        self._contributions = {}
+        self._groups = None
+        for strategy in strategies:
+            self.add(strategy)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, strategy):
+        return strategy in self._contributions
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_arrays'][name][:self.size]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def strategies(self):
+        return list(self._contributions)
+
+    @property
+    def is_call(self):
+        return self.right == OptionType.Call.value
+
+    @property
+    def underlying_asset(self):
+        return list(self._underlying_asset)
+
+    @property
+    def expiry(self):
+        return list(self._expiry)
+
+    @property
+    def underlyings(self):
+        return self._underlying_groups()[0]
+
+    def add(self, strategy):
+        if strategy in self._contributions:
+            raise ValueError('The strategy {} is already in the portfolio.'.format(strategy.name))
+        legs = strategy.legs
+        keys = [self._key_of(legs, row) for row in range(len(legs))]
+        rows = np.array([self._row_of(legs, row, key) for row, key in enumerate(keys)], dtype=np.int64)
+        signs = legs.signs.astype(np.int64)
+        cost = signs * legs.premium
+        np.add.at(self._arrays['signs'], rows, signs)
+        np.add.at(self._arrays['cost'], rows, cost)
+        np.add.at(self._arrays['holders'], rows, 1)
+        self._contributions[strategy] = (keys, signs, cost)
+
+    def remove(self, strategy):
+        keys, signs, cost = self._contributions.pop(strategy)
+        rows = np.array([self._rows[key] for key in keys], dtype=np.int64)
+        np.subtract.at(self._arrays['signs'], rows, signs)
+        np.subtract.at(self._arrays['cost'], rows, cost)
+        np.subtract.at(self._arrays['holders'], rows, 1)
+        if (self.holders == 0).any():
+            self._compact()
+
+    def update(self, strategy):
+        # Replaces the contribution of a strategy whose legs changed since it was added.
+        self.remove(strategy)
+        self.add(strategy)
+
+    def profit_loss_over(self, prices):
+        # prices maps every underlying to its price grid, all of the same length. Returns the (legs x prices)
+        # profit/loss matrix and the {underlying: profit/loss} totals, valued in a single broadcast.
+        underlyings, groups = self._underlying_groups()
+        grids = self._leg_grids(prices, underlyings, groups)
+        intrinsic = np.where(self.is_call[:, np.newaxis], grids - self.strike[:, np.newaxis],
+                             self.strike[:, np.newaxis] - grids)
+        legs_profit_loss = ((self.signs * self.multiplier)[:, np.newaxis] * np.maximum(intrinsic, 0) -
+                            self.cost[:, np.newaxis])
+        return legs_profit_loss, self._by_underlying(legs_profit_loss, underlyings, groups)
+
+    def greeks(self, underlying, volatility, time_to_expiry=None, rate=0., as_of=None):
+        # Black-76 Greeks netted per underlying: {underlying: Greeks} over the grids of underlying (a mapping like the
+        # prices of profit_loss_over). volatility is one value or a {underlying: volatility} mapping. When
+        # time_to_expiry is None it is computed for each leg from its expiry and as_of. The price is the profit/loss.
+        underlyings, groups = self._underlying_groups()
+        grids = self._leg_grids(underlying, underlyings, groups)
+        if isinstance(volatility, dict):
+            volatility = np.array([volatility[name] for name in underlyings], dtype=float)[groups]
+        volatility = np.broadcast_to(volatility, len(groups))[:, np.newaxis]
+        if time_to_expiry is None:
+            time_to_expiry = years_to_expiry(self.expiry, as_of, self.con_id.tolist())
+        time_to_expiry = np.broadcast_to(time_to_expiry, len(groups))[:, np.newaxis]
+        unit = black76(grids, self.strike[:, np.newaxis], time_to_expiry, volatility, self.is_call[:, np.newaxis],
+                       rate)
+        weights = (self.signs * self.multiplier)[:, np.newaxis]
+        legs_greeks = [weights * unit.price - self.cost[:, np.newaxis]] + [weights * greek for greek in unit[1:]]
+        totals = [self._by_underlying(greek, underlyings, groups) for greek in legs_greeks]
+        return {name: Greeks(*[total[name] for total in totals]) for name in underlyings}
+
+    @staticmethod
+    def _key_of(legs, row):
+        con_id = legs.con_id[row].item()
+        if con_id != UNRESOLVED_CON_ID:
+            return con_id
+        return (legs.underlying_asset[row], legs.expiry[row], legs.right[row].item(), legs.strike[row].item(),
+                legs.multiplier[row].item())
+
+    def _row_of(self, legs, row, key):
+        portfolio_row = self._rows.get(key)
+        if portfolio_row is not None:
+            return portfolio_row
+        if self.size == len(self._arrays['con_id']):
+            for column in self._arrays:
+                self._arrays[column] = np.resize(self._arrays[column], 2 * self.size)
+        portfolio_row = self.size
+        values = (legs.con_id[row], legs.strike[row], legs.multiplier[row], legs.right[row], 0, 0., 0)
+        for (column, _), value in zip(self.columns, values):
+            self._arrays[column][portfolio_row] = value
+        self._underlying_asset.append(legs.underlying_asset[row])
+        self._expiry.append(legs.expiry[row])
+        self._keys.append(key)
+        self._rows[key] = portfolio_row
+        self.size += 1
+        self._groups = None
+        return portfolio_row
+
+    def _compact(self):
+        # Drops the contracts no strategy holds anymore, keeping the order of the others.
+        keep = self.holders > 0
+        size = int(keep.sum())
+        for column in self._arrays:
+            self._arrays[column][:size] = self._arrays[column][:self.size][keep]
+        self._underlying_asset = [name for name, kept in zip(self._underlying_asset, keep) if kept]
+        self._expiry = [expiry for expiry, kept in zip(self._expiry, keep) if kept]
+        self._keys = [key for key, kept in zip(self._keys, keep) if kept]
+        self.size = size
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._groups = None
+
+    def _underlying_groups(self):
+        # The sorted underlyings and the underlying index of every leg.
+        if self._groups is None:
+            underlyings = sorted(set(self._underlying_asset), key=str)
+            index = {name: group for group, name in enumerate(underlyings)}
+            self._groups = underlyings, np.array([index[name] for name in self._underlying_asset], dtype=np.int64)
+        return self._groups
+
+    @staticmethod
+    def _leg_grids(prices, underlyings, groups):
+        grids = np.stack([np.atleast_1d(np.asarray(prices[name], dtype=float)) for name in underlyings]) \
+            if underlyings else np.empty((0, 1))
+        return grids[groups]
+
+    @staticmethod
+    def _by_underlying(legs_values, underlyings, groups):
+        totals = np.zeros((len(underlyings),) + legs_values.shape[1:])
+        np.add.at(totals, groups, legs_values)
+        return {name: totals[group] for group, name in enumerate(underlyings)}
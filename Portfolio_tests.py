@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position
+from Portfolio import Portfolio
+
+prices = {'ES': np.arange(1900., 2300., 10.), 'NQ': np.arange(4200., 4600., 10.)}
+
+
+@pytest.fixture
+def book(condor, strategy_of):
+    return [condor('ES condor', first_con_id=1, underlying_asset='ES'),
+            strategy_of([(3, Position.Long, OptionType.Call, 2150., 6.5),
+                         (5, Position.Long, OptionType.Put, 1950., 1.)], 'ES hedge', 'ES', 50),
+            strategy_of([(11, Position.Short, OptionType.Call, 4400., 90.),
+                         (12, Position.Short, OptionType.Put, 4400., 85.)], 'NQ straddle', 'NQ', 50)]
+
+
+def expected_totals(strategies):
+    totals = {}
+    for strategy in strategies:
+        underlying_asset = strategy.legs.underlying_asset[0]
+        totals[underlying_asset] = totals.get(underlying_asset, 0.) + strategy.profit_loss_over(
+            prices[underlying_asset])[1]
+    return totals
+
+
+def test_legs_are_netted_by_ConId(book):
+    portfolio = Portfolio(book)
+    assert portfolio.con_id.tolist() == [1, 2, 3, 4, 5, 11, 12]
+    assert portfolio.signs.tolist() == [1, -1, 0, 1, 1, -1, -1]
+    # The short and the long 2150 calls cancel but their premiums do not.
+    assert portfolio.cost[2] == pytest.approx(0.5 * 50)
+    assert portfolio.underlyings == ['ES', 'NQ']
+
+
+def test_profit_loss_is_the_sum_of_the_strategies(book):
+    _, totals = Portfolio(book).profit_loss_over(prices)
+    for underlying_asset, expected in expected_totals(book).items():
+        assert np.allclose(totals[underlying_asset], expected)
+
+
+def test_strategies_are_added_and_removed_incrementally(book):
+    condor, hedge, straddle = book
+    portfolio = Portfolio([condor, hedge, straddle])
+    portfolio.remove(hedge)
+    assert portfolio.con_id.tolist() == [1, 2, 3, 4, 11, 12]
+    assert portfolio.signs.tolist() == [1, -1, -1, 1, -1, -1]
+    assert hedge not in portfolio
+    hedge.add(OptionOperation(position=Position.Long, premium=50., option_type=OptionType.Call, strike_price=2250.,
+                              con_id=6, underlying_asset='ES', multiplier=50, expiry='20160916'))
+    portfolio.add(hedge)
+    condor.add(OptionOperation(position=Position.Long, premium=300., option_type=OptionType.Put, strike_price=2050.,
+                               con_id=2, underlying_asset='ES', multiplier=50, expiry='20160916'))
+    portfolio.update(condor)
+    _, totals = portfolio.profit_loss_over(prices)
+    for underlying_asset, expected in expected_totals([condor, hedge, straddle]).items():
+        assert np.allclose(totals[underlying_asset], expected)
+    with pytest.raises(ValueError):
+        portfolio.add(hedge)
+    for strategy in (condor, hedge, straddle):
+        portfolio.remove(strategy)
+    assert len(portfolio) == 0
+    assert portfolio.underlyings == []
+
+
+def test_greeks_are_netted_per_underlying(book):
+    volatility = {'ES': 0.15, 'NQ': 0.2}
+    greeks = Portfolio(book).greeks(prices, volatility, 0.25, rate=0.01)
+    for underlying_asset in ('ES', 'NQ'):
+        expected = [strategy.greeks(prices[underlying_asset], volatility[underlying_asset], 0.25, rate=0.01)[1]
+                    for strategy in book if strategy.legs.underlying_asset[0] == underlying_asset]
+        for name in greeks[underlying_asset]._fields:
+            assert np.allclose(getattr(greeks[underlying_asset], name),
+                               sum(getattr(total, name) for total in expected))
+
+
+def test_greeks_need_the_time_to_expiry_or_as_of(book):
+    portfolio = Portfolio(book)
+    with pytest.raises(ValueError):
+        portfolio.greeks(prices, 0.15)
+    greeks = portfolio.greeks(prices, 0.15, as_of='2016-06-17')
+    assert np.isfinite(greeks['ES'].delta).all()
+
+
+def test_legs_without_ConId_are_netted_by_their_description():
+    strategies = []
+    with pytest.warns(UserWarning):
+        for name, option_type, strike_price in [('Put', OptionType.Put, 2000.), ('Call', OptionType.Call, 2200.),
+                                                ('Same call', OptionType.Call, 2200.)]:
+            strategy = OptionStrategy(name)
+            strategy.add(OptionOperation(position=Position.Short, premium=100., option_type=option_type,
+                                         strike_price=strike_price, underlying_asset='ES', multiplier=50,
+                                         expiry='20160916'))
+            strategies.append(strategy)
+    portfolio = Portfolio(strategies)
+    assert portfolio.strike.tolist() == [2000., 2200.]
+    assert portfolio.signs.tolist() == [-1, -2]
+    _, totals = portfolio.profit_loss_over(prices)
+    assert np.allclose(totals['ES'], expected_totals(strategies)['ES'])
+    portfolio.remove(strategies[0])
+    assert portfolio.strike.tolist() == [2200.]
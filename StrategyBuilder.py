@@ -0,0 +1,289 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from OptionPricing import black76, implied_volatility, years_to_expiry
+from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position
+
+STRUCTURES = ('iron_condor', 'vertical', 'butterfly')
+CANDIDATE_COLUMNS = ['Symbol', 'Expiry', 'Structure', 'ConIds', 'Strikes', 'Rights', 'Quantities', 'Premiums',
+                     'Multiplier']
+SCORE_COLUMNS = ['Credit', 'MaxProfit', 'MaxLoss', 'LowerBreakEven', 'UpperBreakEven', 'RewardRisk']
+
+
+class Candidates(object):
+    # A batch of candidate strategies with the same number of legs, one row per candidate.
+    def __init__(self, structure, rows, signs, chain):
+        self.structure = structure
+        self.rows = rows
+        self.signs = np.broadcast_to(signs, rows.shape).astype(float)
+        self.con_ids = chain['ConId'][rows]
+        self.strikes = chain['Strike'][rows]
+        self.is_call = chain['Right'][rows] == 'C'
+        self.premiums = chain['Premium'][rows]
+        self.multipliers = chain['Multiplier'][rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def concatenate(cls, structure, batches, chain):
+        rows = np.concatenate([rows for rows, _ in batches])
+        signs = np.concatenate([np.broadcast_to(signs, rows.shape) for rows, signs in batches])
+        return cls(structure, rows, signs, chain)
+
+
+class StrategyBuilder(object):
+    # Enumerates and scores iron condors, verticals and butterflies over an option chain. The chain holds one
+    # option per row with the Contracts.json columns ConId, Symbol, Expiry, Strike, Right and Multiplier plus the
+    # market Premium per unit of underlying. max_width bounds the strikes distance of the spreads. Iron condors are
+    # enumerated in batches of about chunk_size candidates, which best() ranks one at a time.
+    def __init__(self, chain, max_width=None, chunk_size=1 << 16):
+        chain = pd.DataFrame(chain).reset_index()
+        chain = chain[chain['Right'].isin(['C', 'P'])].sort_values(['Symbol', 'Expiry', 'Right', 'Strike'])
+        self.chain = {column: chain[column].to_numpy() for column in ('ConId', 'Symbol', 'Expiry', 'Strike',
+                                                                      'Right', 'Multiplier', 'Premium')}
+        self.chain['Strike'] = self.chain['Strike'].astype(float)
+        self.chain['Multiplier'] = self.chain['Multiplier'].astype(float)
+        self.chain['Premium'] = self.chain['Premium'].astype(float)
+        self.max_width = np.inf if max_width is None else max_width
+        self.chunk_size = chunk_size
+        # Positions of the options of every (Symbol, Expiry, Right), sorted by strike.
+        self._groups = {key: np.sort(positions)
+                        for key, positions in chain.groupby(['Symbol', 'Expiry', 'Right'], sort=False).indices.items()}
+
+    @property
+    def expiries(self):
+        return sorted({(symbol, expiry) for symbol, expiry, _ in self._groups})
+
+    def candidates(self, structure):
+        # Every candidate at once; the iron condors of a whole chain can take a lot of memory, see iter_candidates.
+        batches = list(self._batches(structure))
+        if not batches:
+            batches = [(np.empty((0, 1), dtype=np.intp), np.empty((0, 1)))]
+        return Candidates.concatenate(structure, batches, self.chain)
+
+    def iter_candidates(self, structure):
+        return (Candidates(structure, rows, signs, self.chain) for rows, signs in self._batches(structure))
+
+    def score(self, candidates):
+        scores = score_candidates(candidates.strikes, candidates.is_call, candidates.signs, candidates.premiums,
+                                  candidates.multipliers)
+        # The CANDIDATE_COLUMNS then the SCORE_COLUMNS.
+        frame = pd.DataFrame({'Symbol': self.chain['Symbol'][candidates.rows[:, 0]],
+                              'Expiry': self.chain['Expiry'][candidates.rows[:, 0]],
+                              'Structure': candidates.structure,
+                              'ConIds': list(map(tuple, candidates.con_ids.tolist())),
+                              'Strikes': list(map(tuple, candidates.strikes.tolist())),
+                              'Rights': [tuple('C' if is_call else 'P' for is_call in row)
+                                         for row in candidates.is_call.tolist()],
+                              'Quantities': list(map(tuple, candidates.signs.astype(int).tolist())),
+                              'Premiums': list(map(tuple, candidates.premiums.tolist())),
+                              'Multiplier': candidates.multipliers[:, 0]})
+        for column in SCORE_COLUMNS:
+            frame[column] = scores[column]
+        return frame
+
+    def best(self, structure='iron_condor', top=10, sort_by='RewardRisk'):
+        # A running top of the batches: the stable sort keeps the order of the ties, as one sort of every candidate.
+        best = None
+        for candidates in self.iter_candidates(structure):
+            scores = self.score(candidates)
+            if best is not None:
+                scores = pd.concat([best, scores], ignore_index=True)
+            best = scores.sort_values(sort_by, ascending=False, kind='stable').head(top).reset_index(drop=True)
+        return self.score(self.candidates(structure)) if best is None else best
+
+    # region Enumeration
+    def _batches(self, structure):
+        if structure not in STRUCTURES:
+            raise ValueError('Unknown structure {}, use one of {}.'.format(structure, STRUCTURES))
+        enumerate_structure = {'iron_condor': self._iron_condors, 'vertical': self._verticals,
+                               'butterfly': self._butterflies}[structure]
+        for symbol, expiry in self.expiries:
+            puts = self._groups.get((symbol, expiry, 'P'), np.empty(0, dtype=np.intp))
+            calls = self._groups.get((symbol, expiry, 'C'), np.empty(0, dtype=np.intp))
+            for rows, signs in enumerate_structure(puts, calls):
+                if len(rows):
+                    yield rows, signs
+
+    def _spreads(self, rows):
+        # Index pairs (lower strike, upper strike) of the rows not wider than max_width.
+        lower, upper = np.triu_indices(len(rows), 1)
+        strikes = self.chain['Strike'][rows]
+        narrow = strikes[upper] - strikes[lower] <= self.max_width
+        return rows[lower[narrow]], rows[upper[narrow]]
+
+    def _iron_condors(self, puts, calls):
+        # Put spreads x call spreads, a slice of the put spreads at a time.
+        long_puts, short_puts = self._spreads(puts)
+        short_calls, long_calls = self._spreads(calls)
+        strikes = self.chain['Strike']
+        step = max(1, self.chunk_size // max(1, len(short_calls)))
+        for start in range(0, len(short_puts), step):
+            put_spread, call_spread = np.nonzero(strikes[short_puts[start:start + step]][:, np.newaxis] <=
+                                                 strikes[short_calls])
+            put_spread += start
+            rows = np.column_stack([long_puts[put_spread], short_puts[put_spread], short_calls[call_spread],
+                                    long_calls[call_spread]])
+            yield rows, np.array([1, -1, -1, 1])
+
+    def _verticals(self, puts, calls):
+        batches = []
+        for rows in (puts, calls):
+            lower, upper = self._spreads(rows)
+            rows = np.column_stack([lower, upper])
+            batches.extend([(rows, np.array([1, -1])), (rows, np.array([-1, 1]))])
+        return batches
+
+    def _butterflies(self, puts, calls):
+        batches = []
+        for rows in (puts, calls):
+            if len(rows) < 3:
+                continue
+            lower, middle = self._spreads(rows)
+            strikes = self.chain['Strike']
+            wing = 2 * strikes[middle] - strikes[lower]
+            upper = rows[np.searchsorted(strikes[rows], wing).clip(max=len(rows) - 1)]
+            found = strikes[upper] == wing
+            batches.append((np.column_stack([lower[found], middle[found], upper[found]]), np.array([1, -2, 1])))
+        return batches
+    # endregion
+
+    def to_strategy(self, candidate, name=None):
+        # OptionStrategy of a row of score()/best().
+        strategy = OptionStrategy(name or '{}_{}_{}'.format(candidate['Symbol'], candidate['Structure'],
+                                                            candidate['Expiry']))
+        for con_id, strike, right, quantity, premium in zip(candidate['ConIds'], candidate['Strikes'],
+                                                            candidate['Rights'], candidate['Quantities'],
+                                                            candidate['Premiums']):
+            option_type = OptionType.Call if right == 'C' else OptionType.Put
+            strategy.add(OptionOperation(Position(int(np.sign(quantity))), premium * candidate['Multiplier'],
+                                         option_type, strike, con_id, candidate['Symbol'], candidate['Multiplier'],
+                                         abs(quantity), str(candidate['Expiry'])))
+        return strategy
+
+
+def score_candidates(strikes, is_call, signs, premiums, multipliers):
+    # Expiry profit/loss extremes and break-evens of n candidates with m legs each ((n, m) arrays, premiums per unit
+    # of underlying). The payoff is linear between strikes, so it is evaluated only at zero and at the strikes.
+    signs = signs * multipliers
+    points = np.concatenate([np.zeros((len(strikes), 1)), np.sort(strikes, axis=1)], axis=1)
+    intrinsic = np.where(is_call[:, np.newaxis, :], points[:, :, np.newaxis] - strikes[:, np.newaxis, :],
+                         strikes[:, np.newaxis, :] - points[:, :, np.newaxis])
+    values = (signs[:, np.newaxis, :] * (np.maximum(intrinsic, 0) - premiums[:, np.newaxis, :])).sum(axis=2)
+    right_slope = np.where(is_call, signs, 0).sum(axis=1)
+
+    max_profit = np.where(right_slope > 0, np.inf, values.max(axis=1))
+    max_loss = np.where(right_slope < 0, -np.inf, values.min(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower_values, upper_values = values[:, :-1], values[:, 1:]
+        crossing = lower_values * upper_values < 0
+        roots = np.where(crossing, points[:, :-1] - lower_values * (points[:, 1:] - points[:, :-1]) /
+                         (upper_values - lower_values), np.nan)
+        roots = np.where(values[:, :-1] == 0, points[:, :-1], roots)
+        tail = np.where(values[:, -1] * right_slope < 0, points[:, -1] - values[:, -1] / right_slope,
+                        np.where(values[:, -1] == 0, points[:, -1], np.nan))
+        roots = np.concatenate([roots, tail[:, np.newaxis]], axis=1)
+        reward_risk = np.where(max_loss < 0, max_profit / -max_loss, np.inf)
+    return {'Credit': -(signs * premiums).sum(axis=1), 'MaxProfit': max_profit, 'MaxLoss': max_loss,
+            'LowerBreakEven': np.fmin.reduce(roots, axis=1), 'UpperBreakEven': np.fmax.reduce(roots, axis=1),
+            'RewardRisk': reward_risk}
+
+
+def find_best(chains, structure='iron_condor', top=10, sort_by='RewardRisk', max_width=None, processes=None):
+    # Ranks the structures of many underlyings ({symbol: chain}), screening every underlying in its own process.
+    # processes=1 screens in this process.
+    tasks = [(chain, structure, top, sort_by, max_width) for chain in chains.values()]
+    if not tasks:
+        return pd.DataFrame(columns=CANDIDATE_COLUMNS + SCORE_COLUMNS)
+    if processes == 1:
+        results = list(map(_screen, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_screen, tasks))
+    ranked = pd.concat(results, ignore_index=True)
+    return ranked.sort_values(sort_by, ascending=False, kind='stable').head(top).reset_index(drop=True)
+
+
+def _screen(task):
+    chain, structure, top, sort_by, max_width = task
+    return StrategyBuilder(chain, max_width).best(structure, top, sort_by)
+
+
+def scan_valuations(chain, forward, as_of=None, rate=0., smile_degree=2):
+    # Compares every option premium of the chain against a volatility smile fitted per (Symbol, Expiry), in bulk.
+    # forward is a scalar, {Symbol: forward} or None to use a Forward column of the chain; the times to expiry come
+    # from as_of or a TimeToExpiry column. Returns the chain ranked by ZScore, the residual of the implied
+    # volatility against the smile over the robust (MAD) deviation of the residuals of its expiry.
+    chain = pd.DataFrame(chain).reset_index()
+    chain = chain[chain['Right'].isin(['C', 'P'])].reset_index(drop=True)
+    if forward is None:
+        forwards = chain['Forward'].to_numpy(dtype=float)
+    elif isinstance(forward, dict):
+        forwards = chain['Symbol'].map(forward).to_numpy(dtype=float)
+    else:
+        forwards = np.full(len(chain), float(forward))
+    if as_of is None:
+        time_to_expiry = chain['TimeToExpiry'].to_numpy(dtype=float)
+    else:
+        time_to_expiry = years_to_expiry(chain['Expiry'].astype(str).tolist(), as_of)
+    strikes = chain['Strike'].to_numpy(dtype=float)
+    is_call = (chain['Right'] == 'C').to_numpy()
+    premiums = chain['Premium'].to_numpy(dtype=float)
+    volatility, converged = implied_volatility(premiums, forwards, strikes, time_to_expiry, is_call, rate)
+
+    groups = chain.groupby(['Symbol', 'Expiry'], sort=False).ngroup().to_numpy()
+    log_moneyness = np.log(strikes / forwards)
+    weights = converged.astype(float)
+    fitted = _fit_smiles(groups, log_moneyness, np.where(converged, volatility, 0.), weights, smile_degree)
+    residuals = volatility - fitted
+    # A second fit with the outliers of the first one down-weighted.
+    deviation = _group_mad(groups, residuals, converged)
+    weights = np.where(converged, 1. / np.maximum(1., np.abs(residuals / deviation) / 3.) ** 2, 0.)
+    fitted = _fit_smiles(groups, log_moneyness, np.where(converged, volatility, 0.), weights, smile_degree)
+    residuals = volatility - fitted
+    deviation = _group_mad(groups, residuals, converged)
+
+    fair_value = black76(forwards, strikes, time_to_expiry, fitted, is_call, rate).price
+    scan = chain[['ConId', 'Symbol', 'Expiry', 'Strike', 'Right', 'Premium']].copy()
+    scan['FairValue'] = fair_value
+    scan['Mispricing'] = premiums - fair_value
+    scan['ImpliedVolatility'] = volatility
+    scan['FittedVolatility'] = fitted
+    scan['ZScore'] = residuals / deviation
+    return scan.sort_values('ZScore', ascending=False, na_position='last').reset_index(drop=True)
+
+
+def search_for_overvaluated_options(chain, forward, threshold=2., **scan_options):
+    scan = scan_valuations(chain, forward, **scan_options)
+    return scan[scan['ZScore'] >= threshold].reset_index(drop=True)
+
+
+def search_for_undervaluated_options(chain, forward, threshold=2., **scan_options):
+    scan = scan_valuations(chain, forward, **scan_options)
+    scan = scan[scan['ZScore'] <= -threshold]
+    return scan.sort_values('ZScore').reset_index(drop=True)
+
+
+def _fit_smiles(groups, x, y, weights, degree):
+    # Weighted least squares polynomials of every group at once: the normal equations of all the groups are
+    # accumulated with bincount and solved as one stack.
+    group_count = groups.max() + 1 if len(groups) else 0
+    powers = x[:, np.newaxis] ** np.arange(degree + 1)
+    normal = np.stack([np.bincount(groups, weights * powers[:, i] * powers[:, j], group_count)
+                       for i in range(degree + 1) for j in range(degree + 1)], axis=1)
+    normal = normal.reshape(group_count, degree + 1, degree + 1)
+    target = np.stack([np.bincount(groups, weights * powers[:, i] * y, group_count) for i in range(degree + 1)],
+                      axis=1)
+    # The pseudo-inverse copes with the expiries quoting fewer strikes than coefficients.
+    coefficients = np.matmul(np.linalg.pinv(normal), target[:, :, np.newaxis])[:, :, 0]
+    return (powers * coefficients[groups]).sum(axis=1)
+
+
+def _group_mad(groups, residuals, valid):
+    absolute = pd.Series(np.where(valid, np.abs(residuals), np.nan))
+    median = absolute.groupby(groups).transform('median').to_numpy()
+    # Floored at a hundredth of a volatility point, so a chain sitting on its smile has no outliers.
+    return np.maximum(1.4826 * median, 1e-4)
@@ -1,18 +1,132 @@
-def test_call_strategy_builder():
-    pass
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ContractLoader import load_contracts
+from OptionPricing import black76
+from StrategyBuilder import *
+
+path_to_contracts_json = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_files', 'Contracts.json')
+
+
+def option_chain(symbol='ES', forward=2100., volatility=0.15, strikes=np.arange(1900., 2325., 25.),
+                 expiries=('20160916', '20161216'), first_con_id=1):
+    rows = []
+    for expiry_number, expiry in enumerate(expiries):
+        time_to_expiry = 0.25 * (expiry_number + 1)
+        for right in ('C', 'P'):
+            # A skew, so the chain is not flat in volatility.
+            volatilities = volatility * (1 - 0.5 * np.log(strikes / forward))
+            premiums = black76(forward, strikes, time_to_expiry, volatilities, right == 'C').price
+            for strike, premium in zip(strikes, premiums):
+                rows.append((first_con_id + len(rows), symbol, expiry, strike, right, 50, premium))
+    return pd.DataFrame(rows, columns=['ConId', 'Symbol', 'Expiry', 'Strike', 'Right', 'Multiplier', 'Premium'])
+
+
+def test_call_strategy_builder(tmp_path):
+    contracts = load_contracts(path_to_contracts_json, cache_dir=str(tmp_path))
+    contracts['Premium'] = black76(2060., contracts['Strike'], 0.1, 0.2, contracts['Right'] == 'C').price
+    builder = StrategyBuilder(contracts)
+    assert builder.expiries == [('ES', '20160617')]
+    assert len(builder.candidates('vertical')) == 2 * (9 * 8 // 2 + 8 * 7 // 2)
+    with pytest.raises(ValueError):
+        builder.candidates('strangle')
+
+
+def mispriced_chain(bumps):
+    chain = option_chain(strikes=np.arange(1900., 2325., 25.))
+    chain['TimeToExpiry'] = np.where(chain['Expiry'] == '20160916', 0.25, 0.5)
+    for con_id, bump in bumps.items():
+        chain.loc[chain['ConId'] == con_id, 'Premium'] += bump
+    return chain
+
+
+def test_a_chain_on_its_smile_has_no_mispriced_options():
+    scan = scan_valuations(mispriced_chain({}), 2100.)
+    assert len(scan) == 68
+    assert np.allclose(scan['FairValue'], scan['Premium'], atol=1e-6)
+    assert search_for_overvaluated_options(mispriced_chain({}), 2100., threshold=1e3).empty
 
 
 def test_search_for_overvaluated_options():
-    pass
+    overvalued = search_for_overvaluated_options(mispriced_chain({8: 3., 45: 5.}), 2100., threshold=5.)
+    assert sorted(overvalued['ConId']) == [8, 45]
+    assert overvalued['ZScore'].is_monotonic_decreasing
+    assert (overvalued['Mispricing'] > 2.).all()
 
 
 def test_search_for_undervaluated_options():
-    pass
+    chain = mispriced_chain({10: -4., 60: -2.})
+    undervalued = search_for_undervaluated_options(chain, {'ES': 2100.}, threshold=5.)
+    assert sorted(undervalued['ConId']) == [10, 60]
+    assert undervalued['ZScore'].is_monotonic_increasing
+    assert (undervalued['Mispricing'] < -1.).all()
+    assert search_for_overvaluated_options(chain, 2100., threshold=5.).empty
+
+
+@pytest.mark.parametrize('structure, candidates', [('vertical', 40), ('butterfly', 8), ('iron_condor', 15)])
+def test_every_structure_is_enumerated(structure, candidates):
+    chain = option_chain(strikes=np.arange(2000., 2125., 25.), expiries=('20160916',))
+    assert len(StrategyBuilder(chain).candidates(structure)) == candidates
+
+
+@pytest.mark.parametrize('structure', STRUCTURES)
+def test_batched_scores_match_the_strategy_analytics(structure):
+    builder = StrategyBuilder(option_chain(strikes=np.arange(2000., 2225., 25.), expiries=('20160916',)))
+    scores = builder.score(builder.candidates(structure))
+    for _, candidate in scores.iterrows():
+        strategy = builder.to_strategy(candidate)
+        assert candidate['MaxProfit'] == pytest.approx(strategy.max_profit())
+        assert candidate['MaxLoss'] == pytest.approx(strategy.max_loss())
+        break_even_points = strategy.break_even_points()
+        if break_even_points:
+            assert candidate['LowerBreakEven'] == pytest.approx(break_even_points[0])
+            assert candidate['UpperBreakEven'] == pytest.approx(break_even_points[-1])
+        else:
+            assert np.isnan(candidate['LowerBreakEven'])
+
+
+def test_iron_condors_are_ranked_in_batches():
+    chain = option_chain(strikes=np.arange(1900., 2325., 25.), expiries=('20160916',))
+    whole = StrategyBuilder(chain, chunk_size=1 << 30)
+    batched = StrategyBuilder(chain, chunk_size=100)
+    assert len(list(whole.iter_candidates('iron_condor'))) == 1
+    assert all(len(candidates) <= 2 * 100 for candidates in batched.iter_candidates('iron_condor'))
+    assert sum(map(len, batched.iter_candidates('iron_condor'))) == len(whole.candidates('iron_condor'))
+    assert batched.best('iron_condor', top=20).equals(whole.best('iron_condor', top=20))
 
 
 def test_call_Iron_Condor():
-    pass
+    builder = StrategyBuilder(option_chain(), max_width=100)
+    best = builder.best('iron_condor', top=5)
+    assert len(best) == 5
+    assert best['RewardRisk'].is_monotonic_decreasing
+    assert (best['Structure'] == 'iron_condor').all()
+    assert (best['Credit'] > 0).all()
+    for _, candidate in best.iterrows():
+        strikes = candidate['Strikes']
+        assert candidate['Rights'] == ('P', 'P', 'C', 'C')
+        assert strikes[0] < strikes[1] <= strikes[2] < strikes[3]
+        assert max(strikes[1] - strikes[0], strikes[3] - strikes[2]) <= 100
+        assert candidate['MaxProfit'] == pytest.approx(candidate['Credit'])
 
 
 def test_find_best_stock_for_Iron_Condor():
-    pass
+    chains = {symbol: option_chain(symbol, forward, volatility, first_con_id=1000 * number)
+              for number, (symbol, forward, volatility) in enumerate([('ES', 2100., 0.15), ('NQ', 2100., 0.3),
+                                                                      ('YM', 2100., 0.2)])}
+    ranked = find_best(chains, 'iron_condor', top=10, max_width=100, processes=2)
+    sequential = find_best(chains, 'iron_condor', top=10, max_width=100, processes=1)
+    assert ranked.equals(sequential)
+    assert ranked.columns.tolist() == CANDIDATE_COLUMNS + SCORE_COLUMNS
+    builders = [StrategyBuilder(chain, 100) for chain in chains.values()]
+    every_candidate = pd.concat([builder.score(builder.candidates('iron_condor')) for builder in builders])
+    assert ranked['RewardRisk'].tolist() == sorted(every_candidate['RewardRisk'], reverse=True)[:10]
+
+
+def test_find_best_without_chains_ranks_nothing():
+    ranked = find_best({}, 'iron_condor', top=10)
+    assert ranked.empty
+    assert ranked.columns.tolist() == CANDIDATE_COLUMNS + SCORE_COLUMNS
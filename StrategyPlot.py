@@ -0,0 +1,114 @@
+import os
+from html import escape
+
+import numpy as np
+
+COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22',
+          '#17becf')
+FORMATS = ('html', 'svg', 'png')
+
+_MARGIN = (60, 20, 40, 70)  # top, right, bottom, left
+
+
+def plot_strategy(strategy, path, prices=None, legs=True, width=800, height=450, underlying=None):
+    # Writes the expiry profit/loss of the strategy (and of its legs) to path, formatted by its extension:
+    # .html and .svg are written as text with no plotting library, .png needs matplotlib.
+    # prices defaults to the adaptive grid of the strategy, around underlying when given.
+    if prices is None:
+        prices = strategy._generate_price_range(underlying=underlying)
+    prices = np.asarray(prices, dtype=float)
+    legs_profit_loss, total = strategy.profit_loss_over(prices)
+    names = strategy._generate_columns_names()
+    series = list(zip(names[:-1], legs_profit_loss)) if legs else []
+    series.append((strategy.name, total))
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'png':
+        _write_png(path, strategy.name, prices, series, width, height)
+    elif extension in ('svg', 'html'):
+        svg = svg_chart(strategy.name, prices, series, width, height)
+        if extension == 'html':
+            svg = ('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{}</title></head>\n<body>\n{}</body>\n'
+                   '</html>\n').format(escape(strategy.name), svg)
+        with open(path, 'w') as plot_file:
+            plot_file.write(svg)
+    else:
+        raise ValueError('The plot format must be one of {}.'.format(', '.join(FORMATS)))
+    return path
+
+
+def plot_strategies(strategies, directory, formats=('html',), **plot_options):
+    # Renders every strategy to <directory>/<strategy name>.<format>; returns the written paths.
+    os.makedirs(directory, exist_ok=True)
+    return [plot_strategy(strategy, os.path.join(directory, '{}.{}'.format(strategy.name, extension)),
+                          **plot_options)
+            for strategy in strategies for extension in formats]
+
+
+def svg_chart(title, prices, series, width=800, height=450):
+    # A line chart of (name, values) series over prices. The last series is the strategy, drawn thicker.
+    top, right, bottom, left = _MARGIN
+    values = np.array([values for _, values in series], dtype=float)
+    x_ticks = _ticks(prices.min(), prices.max())
+    y_ticks = _ticks(min(values.min(), 0.), max(values.max(), 0.))
+    x_low, x_high = min(prices.min(), x_ticks[0]), max(prices.max(), x_ticks[-1])
+    y_low, y_high = y_ticks[0], y_ticks[-1]
+
+    def x_of(x):
+        return left + (x - x_low) / (x_high - x_low) * (width - left - right)
+
+    def y_of(y):
+        return height - bottom - (y - y_low) / (y_high - y_low) * (height - top - bottom)
+
+    lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+             'font-family="sans-serif" font-size="11">'.format(width, height),
+             '<rect width="100%" height="100%" fill="white"/>',
+             '<text x="{}" y="20" font-size="14" text-anchor="middle">{}</text>'.format(width / 2, escape(title))]
+    for tick in x_ticks:
+        lines.append('<line x1="{0:.1f}" y1="{1}" x2="{0:.1f}" y2="{2}" stroke="#e5e5e5"/>'
+                     '<text x="{0:.1f}" y="{3}" text-anchor="middle">{4:g}</text>'
+                     .format(x_of(tick), top, height - bottom, height - bottom + 15, tick))
+    for tick in y_ticks:
+        lines.append('<line x1="{0}" y1="{1:.1f}" x2="{2}" y2="{1:.1f}" stroke="{3}"/>'
+                     '<text x="{4}" y="{1:.1f}" text-anchor="end" dy="4">{5:g}</text>'
+                     .format(left, y_of(tick), width - right, '#999999' if tick == 0 else '#e5e5e5', left - 5, tick))
+    x = x_of(prices)
+    for number, ((name, _), y) in enumerate(zip(series, y_of(values))):
+        strategy_line = number == len(series) - 1
+        points = ' '.join('{:.1f},{:.1f}'.format(*point) for point in zip(x.tolist(), y.tolist()))
+        lines.append('<polyline fill="none" stroke="{}" stroke-width="{}"{} points="{}"><title>{}</title></polyline>'
+                     .format(COLORS[number % len(COLORS)], 3 if strategy_line else 1.5,
+                             '' if strategy_line else ' stroke-dasharray="6,3"', points, escape(name)))
+        lines.append('<text x="{}" y="{}" fill="{}">{}</text>'.format(left + 10, top + 5 + 14 * number,
+                                                                       COLORS[number % len(COLORS)], escape(name)))
+    lines.append('</svg>\n')
+    return '\n'.join(lines)
+
+
+def _ticks(low, high, count=6):
+    # Round tick values (1, 2 or 5 times a power of ten apart) covering [low, high].
+    if high <= low:
+        high = low + 1.
+    raw_step = (high - low) / count
+    magnitude = 10 ** np.floor(np.log10(raw_step))
+    step = magnitude * min(multiple for multiple in (1, 2, 5, 10) if multiple * magnitude >= raw_step)
+    return np.arange(np.floor(low / step), np.ceil(high / step) + 1) * step
+
+
+def _write_png(path, title, prices, series, width, height):
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise ImportError('matplotlib is needed to write PNG plots, HTML and SVG plots need no plotting library.')
+    figure = Figure(figsize=(width / 100., height / 100.), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+    for number, (name, values) in enumerate(series):
+        strategy_line = number == len(series) - 1
+        axes.plot(prices, values, label=name, linewidth=3 if strategy_line else 1.5,
+                  linestyle='-' if strategy_line else '--', color=COLORS[number % len(COLORS)])
+    axes.axhline(0, color='#999999', linewidth=1)
+    axes.set_title(title)
+    axes.grid(True, color='#e5e5e5')
+    axes.legend(loc='upper left', fontsize='small')
+    figure.savefig(path)
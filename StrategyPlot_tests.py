@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pytest
+
+from StrategyPlot import *
+
+
+def test_svg_lines_follow_the_profit_loss():
+    prices = np.array([1900., 2000., 2100., 2300.])
+    svg = svg_chart('Condor', prices, [('flat', np.zeros(4)), ('total', np.array([-100., -100., 50., -100.]))])
+    points = [line.split('points="')[1].split('"')[0].split() for line in svg.splitlines() if '<polyline' in line]
+    flat, total = [[tuple(map(float, point.split(','))) for point in line] for line in points]
+    assert [x for x, _ in flat] == [x for x, _ in total]
+    assert np.all(np.diff([x for x, _ in flat]) > 0)
+    # SVG y grows downwards, so the profit is above the losses and the zero line.
+    assert total[2][1] < flat[2][1] < total[0][1] == total[3][1]
+
+
+def test_many_strategies_are_rendered_in_one_call(tmp_path, condor):
+    strategies = [condor('Condor{}'.format(number), 25. * number) for number in range(5)]
+    paths = plot_strategies(strategies, str(tmp_path / 'plots'), formats=('html', 'svg'))
+    assert len(paths) == 10
+    assert sorted(os.listdir(str(tmp_path / 'plots'))) == sorted(os.path.basename(path) for path in paths)
+
+
+def test_png_is_written_with_matplotlib(tmp_path, condor):
+    pytest.importorskip('matplotlib')
+    path = condor('Condor').plot(str(tmp_path / 'Condor.png'))
+    with open(path, 'rb') as png_file:
+        assert png_file.read(8) == b'\x89PNG\r\n\x1a\n'
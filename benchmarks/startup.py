@@ -0,0 +1,59 @@
+# Startup-time regression benchmark: imports the core modules in fresh interpreters and fails when one of them pulls
+# in a heavy dependency or takes more than --budget seconds over a bare `import numpy`.
+#
+#     python benchmarks/startup.py [--repeats 10] [--budget 0.1]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_MODULES = ('OptionPricing', 'OptionStrategy', 'MonteCarlo')
+HEAVY_MODULES = ('pandas', 'dateutil', 'plotly', 'cufflinks', 'matplotlib', 'scipy', 'requests')
+
+
+def import_time(statement, repeats=10):
+    # Median wall time of running statement in a fresh interpreter.
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=ROOT, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def loaded_heavy_modules(module):
+    statement = 'import sys, {}; print(" ".join(sorted(set(sys.modules) & set({!r}))))'.format(module, HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', statement], cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return output.split()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Startup-time regression benchmark.')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=0.1, help='seconds allowed over importing numpy')
+    options = parser.parse_args(arguments)
+
+    numpy_time = import_time('import numpy', options.repeats)
+    print('{:<16}{:>10.1f} ms'.format('numpy', 1000 * numpy_time))
+    failures = []
+    for module in CORE_MODULES:
+        module_time = import_time('import {}'.format(module), options.repeats)
+        heavy = loaded_heavy_modules(module)
+        print('{:<16}{:>10.1f} ms  {:+.1f} ms over numpy{}'.format(
+            module, 1000 * module_time, 1000 * (module_time - numpy_time),
+            '  imports ' + ', '.join(heavy) if heavy else ''))
+        if heavy:
+            failures.append('{} imports {}'.format(module, ', '.join(heavy)))
+        if module_time - numpy_time > options.budget:
+            failures.append('{} takes {:.3f} s over numpy'.format(module, module_time - numpy_time))
+    for failure in failures:
+        print('REGRESSION: ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
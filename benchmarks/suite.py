@@ -0,0 +1,174 @@
+# Benchmarks of the valuation, contract lookup and strategy construction hot paths on synthetic data.
+# Results are written as JSON and compared with a stored baseline; a case slower than tolerance times its baseline
+# is a regression and makes the run exit with 1.
+#
+#     python benchmarks/suite.py [--contracts 2000] [--legs 40] [--grid-points 2000] [--save-baseline]
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from benchmarks.synthetic import operation, strategy_of, write_contracts
+from ContractLoader import load_contracts
+from OptionStrategy import ContractIndex, OptionOperation, OptionType, Position
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results.json')
+LOOKUPS = 100
+
+
+def measure(function, repeat=5, min_time=0.05):
+    # Seconds per call: the number of calls of a run is doubled until a run takes min_time.
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {'seconds': statistics.median(times), 'best': min(times), 'number': number}
+
+
+def cases(contracts, legs, grid_points, directory):
+    # Yields (name, params, function) for every benchmark.
+    strategy = strategy_of(legs)
+    prices = itertools.cycle(np.linspace(1900., 2300., 97).tolist())
+    yield 'profit_loss_at', {'legs': legs}, lambda: strategy.profit_loss_at(next(prices))
+
+    grid = np.linspace(1900., 2300., grid_points)
+    yield 'profit_loss_over', {'legs': legs, 'grid_points': grid_points}, lambda: strategy.profit_loss_over(grid)
+
+    # The fixed step grid of the baseline; the adaptive grid, the default since, is a case of its own.
+    def generate_strategy_dataframe():
+        strategy._grid = None
+        strategy._generate_strategy_dataframe(index_step=5)
+
+    yield 'generate_strategy_dataframe', {'legs': legs}, generate_strategy_dataframe
+
+    def generate_adaptive_strategy_dataframe():
+        strategy._grid = None
+        strategy._generate_strategy_dataframe(points=200)
+
+    yield 'generate_adaptive_strategy_dataframe', {'legs': legs, 'points': 200}, generate_adaptive_strategy_dataframe
+
+    # Every churn round opens, adjusts and closes one lot per leg, leaving the strategy as it was. The operations
+    # are built in the round: the strategy keeps the first one of a leg and nets the others into it.
+    rng = np.random.RandomState(1)
+    openings = [operation(rng, legs + con_id) for con_id in range(legs)]
+    churn = [(option.ConId, option.position, option.premium, option.option_type, option.strike_price, option.expiry)
+             for option in openings]
+
+    def add_churn():
+        for con_id, position, premium, option_type, strike_price, expiry in churn:
+            for lot_position, quantity in ((position, 1), (position, 2), (Position(-position), 3)):
+                strategy.add(OptionOperation(lot_position, premium, option_type, strike_price, con_id, 'ES', 50,
+                                             quantity, expiry))
+
+    yield 'add_churn', {'legs': legs, 'adds': 3 * legs}, add_churn
+
+    path = os.path.join(directory, 'Contracts.json')
+    records = write_contracts(path, contracts)
+    options = [record for record in records if record['SecType'] == 'FOP']
+    sample = [options[number] for number in np.random.RandomState(2).randint(0, len(options), LOOKUPS).tolist()]
+    cache_dir = os.path.join(directory, 'cache')
+    yield ('load_contracts_cold', {'contracts': len(records)},
+           lambda: load_contracts(path, cache_dir=cache_dir, use_cache=False))
+    load_contracts(path, cache_dir=cache_dir)
+    yield 'load_contracts_warm', {'contracts': len(records)}, lambda: load_contracts(path, cache_dir=cache_dir)
+
+    frame = load_contracts(path, use_cache=False)
+    yield 'contract_index_build', {'contracts': len(records)}, lambda: ContractIndex(frame)
+    ContractIndex.of(frame)
+
+    def from_ConId():
+        for record in sample:
+            OptionOperation.from_ConId(frame, record['ConId'], Position.Long, 1.)
+
+    yield 'from_ConId', {'contracts': len(records), 'lookups': LOOKUPS}, from_ConId
+
+    def from_contract_description():
+        for record in sample:
+            OptionOperation.from_contract_description(
+                frame, Position.Long, 1., OptionType.Call if record['Right'] == 'C' else OptionType.Put,
+                record['Strike'], record['Symbol'], record['Expiry'])
+
+    yield 'from_contract_description', {'contracts': len(records), 'lookups': LOOKUPS}, from_contract_description
+
+
+def run(contracts=2000, legs=40, grid_points=2000, repeat=5, min_time=0.05):
+    results = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+               'cases': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, params, function in cases(contracts, legs, grid_points, directory):
+            results['cases'][name] = dict(measure(function, repeat, min_time), params=params)
+    return results
+
+
+def compare(results, baseline, tolerance=1.5, noise=1e-6):
+    # Returns the regressions: cases slower than tolerance times their baseline (and by more than noise seconds).
+    regressions = []
+    for name, case in sorted(results['cases'].items()):
+        reference = baseline.get('cases', {}).get(name)
+        if reference is None or reference['params'] != case['params']:
+            continue
+        if case['seconds'] > tolerance * reference['seconds'] and case['seconds'] - reference['seconds'] > noise:
+            regressions.append((name, reference['seconds'], case['seconds']))
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Hot path benchmarks.')
+    parser.add_argument('--contracts', type=int, default=2000)
+    parser.add_argument('--legs', type=int, default=40)
+    parser.add_argument('--grid-points', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds of a timed run')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='slowdown ratio failing a case')
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    options = parser.parse_args(arguments)
+
+    results = run(options.contracts, options.legs, options.grid_points, options.repeat, options.min_time)
+    with open(options.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    for name, case in sorted(results['cases'].items()):
+        reference = baseline.get('cases', {}).get(name)
+        ratio = '' if reference is None or reference['params'] != case['params'] else \
+            '{:8.2f}x baseline'.format(case['seconds'] / reference['seconds'])
+        print('{:<28}{:>12.2f} us{}'.format(name, 1e6 * case['seconds'], ratio))
+    if options.save_baseline:
+        with open(options.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        return 0
+    regressions = compare(results, baseline, options.tolerance)
+    for name, reference, seconds in regressions:
+        print('REGRESSION: {} takes {:.2f} us, {:.2f} us in the baseline'.format(name, 1e6 * seconds, 1e6 * reference))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
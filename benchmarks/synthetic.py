@@ -0,0 +1,54 @@
+# Synthetic TWS dumps and strategy books of configurable size for the benchmarks.
+import json
+
+import numpy as np
+
+from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position
+
+EXPIRIES = ('20160617', '20160916', '20161216', '20170317')
+
+
+def contract_records(contracts, symbols=('ES', 'NQ', 'YM'), strike_step=5., seed=0):
+    # Contracts.json records: per symbol a future plus puts and calls over the expiries around 2100.
+    rng = np.random.RandomState(seed)
+    per_chain = max(1, contracts // (2 * len(symbols) * len(EXPIRIES)))
+    records = []
+    for symbol in symbols:
+        records.append(_record(len(records) + 1, symbol, 'FUT', EXPIRIES[0], 0., None))
+        for expiry in EXPIRIES:
+            strikes = 2100. + strike_step * (np.arange(per_chain) - per_chain // 2)
+            for right in ('P', 'C'):
+                for strike in strikes.tolist():
+                    records.append(_record(len(records) + 1, symbol, 'FOP', expiry, strike, right))
+    order = rng.permutation(len(records))
+    return [records[number] for number in order.tolist()]
+
+
+def write_contracts(path, contracts, **options):
+    records = contract_records(contracts, **options)
+    with open(path, 'w') as json_file:
+        json.dump(records, json_file)
+    return records
+
+
+def strategy_of(legs, strike_step=0.25, seed=0):
+    # A strategy of legs distinct contracts with fractional strikes, as ES trades in 0.25 ticks.
+    rng = np.random.RandomState(seed)
+    strategy = OptionStrategy('Synthetic{}'.format(legs))
+    for con_id in range(legs):
+        strategy.add(operation(rng, con_id, strike_step))
+    return strategy
+
+
+def operation(rng, con_id, strike_step=0.25, quantity=1):
+    strike_price = 2000. + strike_step * rng.randint(0, 800)
+    return OptionOperation(Position(int(rng.choice([-1, 1]))), float(rng.uniform(1, 50) * 50),
+                           OptionType(int(rng.randint(0, 2))), strike_price, con_id, 'ES', 50, quantity, EXPIRIES[1])
+
+
+def _record(con_id, symbol, sec_type, expiry, strike, right):
+    local_symbol = symbol if right is None else '{} {}{}'.format(symbol, right, strike)
+    return {'ConId': con_id, 'Symbol': symbol, 'SecType': sec_type, 'Expiry': expiry, 'Strike': strike, 'Right': right,
+            'Multiplier': '50', 'Exchange': 'GLOBEX', 'Currency': 'USD', 'LocalSymbol': local_symbol,
+            'PrimaryExch': None, 'TradingClass': symbol, 'IncludeExpired': False, 'SecIdType': None, 'SecId': None,
+            'ComboLegsDescription': None, 'ComboLegs': None, 'UnderComp': None}
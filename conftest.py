@@ -0,0 +1,136 @@
+import pytest
+
+from OptionStrategy import OptionOperation, OptionStrategy, OptionType, Position
+
+# (position, option_type, strike_price, premium per unit of underlying) of the iron condor used across the tests.
+CONDOR_LEGS = [(Position.Long, OptionType.Put, 2000., 2.5), (Position.Short, OptionType.Put, 2050., 7.),
+               (Position.Short, OptionType.Call, 2150., 6.), (Position.Long, OptionType.Call, 2200., 1.5)]
+
+
+def build_strategy(legs, name='Strategy', underlying_asset=None, multiplier=1, expiries=('20160916',)):
+    # legs are (con_id, position, option_type, strike_price, premium per unit of underlying) tuples; the expiries are
+    # given to the legs in turn.
+    strategy = OptionStrategy(name)
+    for number, (con_id, position, option_type, strike_price, premium) in enumerate(legs):
+        strategy.add(OptionOperation(position=position, premium=premium * multiplier, option_type=option_type,
+                                     strike_price=strike_price, con_id=con_id, underlying_asset=underlying_asset,
+                                     multiplier=multiplier, expiry=expiries[number % len(expiries)]))
+    return strategy
+
+
+def build_condor(name='IronCondor', shift=0., first_con_id=0, underlying_asset=None):
+    # The CONDOR_LEGS iron condor on a 50 multiplier future, its strikes moved by shift.
+    return build_strategy([(first_con_id + number, position, option_type, strike_price + shift, premium)
+                           for number, (position, option_type, strike_price, premium) in enumerate(CONDOR_LEGS)],
+                          name, underlying_asset, 50)
+
+
+@pytest.fixture
+def strategy_of():
+    return build_strategy
+
+
+@pytest.fixture
+def condor():
+    return build_condor
+
+
+# Fields and reqId: ConId dictionary of the bars used by the BarStore and BarArchive tests.
+BAR_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume', 'WAP', 'Count']
+BAR_DICTIONARY = {'1': 197307551, '2': 198003980, '3': 198003244}
+
+
+def build_bar_list(seed=0):
+    # Shuffled 5 seconds bars for three requests; reqId 3 misses its first bars and reqId 4 is not in the dictionary.
+    import numpy as np
+    import pandas as pd
+    rng = np.random.RandomState(seed)
+    times = pd.date_range('2016-07-18 18:05:55', periods=121, freq='5s')
+    frames = []
+    for req_id, first in [(1, 0), (2, 0), (3, 10), (4, 0)]:
+        frame = pd.DataFrame(rng.uniform(1, 100, (len(times) - first, len(BAR_FIELDS))), columns=BAR_FIELDS)
+        frame.insert(0, 'Time', times[first:])
+        frame.insert(0, 'reqId', req_id)
+        frames.append(frame)
+    bars = pd.concat(frames, ignore_index=True)
+    return bars.iloc[rng.permutation(len(bars))].reset_index(drop=True)
+
+
+@pytest.fixture
+def bar_list():
+    return build_bar_list
+
+
+@pytest.fixture
+def bar_fields():
+    return BAR_FIELDS
+
+
+@pytest.fixture
+def bar_dictionary():
+    return BAR_DICTIONARY
+
+
+@pytest.fixture
+def bar_store():
+    # The BarStore of build_bar_list().
+    from BarStore import BarStore
+    return BarStore.from_frame(build_bar_list(), BAR_DICTIONARY)
+
+
+# The future and the options (ConId: (OptionType, Strike)) of the sessions replayed by the Backtest and LiveService
+# tests.
+SESSION_UNDERLYING = 187532577
+SESSION_CHAIN = {1: (OptionType.Put, 2100.), 2: (OptionType.Put, 2140.), 3: (OptionType.Call, 2140.),
+                 4: (OptionType.Call, 2160.), 5: (OptionType.Call, 2180.)}
+
+
+def build_session(steps=360, seed=0):
+    # 5 seconds Close bars of a random walk future and of SESSION_CHAIN priced with Black-76 at 20% volatility.
+    import numpy as np
+    import pandas as pd
+    from BarStore import BarStore
+    from OptionPricing import black76, years_to_expiry
+    times = pd.date_range('2016-07-18 18:05:55', periods=steps, freq='5s').values
+    futures = 2150. + np.cumsum(np.random.RandomState(seed).normal(0, 0.5, steps))
+    time_to_expiry = years_to_expiry(['20160916'], times)
+    con_ids = [SESSION_UNDERLYING] + sorted(SESSION_CHAIN)
+    close = [futures] + [black76(futures, SESSION_CHAIN[con_id][1], time_to_expiry, 0.2,
+                                 SESSION_CHAIN[con_id][0] == OptionType.Call).price for con_id in sorted(SESSION_CHAIN)]
+    data = np.array(close)[:, :, np.newaxis]
+    # Some missing bars, carried forward by the backtest.
+    data[2, 100:103] = np.nan
+    return BarStore(con_ids, times, ['Close'], data)
+
+
+def adjust_adaptive_condor(strategy, step, bar_store):
+    # Backtest adjust: opens an iron condor at step 0 and rolls its call side up at step 120, filled at the closes.
+    def fill(con_id, position, quantity=1):
+        option_type, strike_price = SESSION_CHAIN[con_id]
+        premium = bar_store.select(con_id, 'Close')[step] * 50
+        return OptionOperation(position, premium, option_type, strike_price, con_id, 'ES', 50, quantity, '20160916')
+
+    if step == 0:
+        return [fill(1, Position.Long), fill(2, Position.Short), fill(3, Position.Short), fill(4, Position.Long)]
+    if step == 120:
+        return [fill(3, Position.Long), fill(4, Position.Short, 3), fill(5, Position.Long, 2)]
+
+
+@pytest.fixture
+def underlying():
+    return SESSION_UNDERLYING
+
+
+@pytest.fixture
+def chain():
+    return SESSION_CHAIN
+
+
+@pytest.fixture
+def session():
+    return build_session
+
+
+@pytest.fixture
+def adaptive_condor():
+    return adjust_adaptive_condor